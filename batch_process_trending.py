@@ -1,167 +1,242 @@
 #!/usr/bin/env python3
 """
 Upload trending videos to GCS and process them through the karaoke service
+
+Items run concurrently: up to MAX_IN_FLIGHT jobs are submitted at once (the
+processing service's --max-instances, one job per instance) and uploads are limited
+to UPLOAD_WORKERS. Every state change is written to a checkpoint file, so a rerun
+skips finished items and re-submits unfinished ones. Re-submitting is safe because
+the service coalesces duplicate requests: a retry attaches to the running job or
+gets its stored result.
 """
 import os
 import glob
+import json
 import time
+import random
+import threading
 import requests
-from google.cloud import storage
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from gcs_transfer import TransferEngine
 
 # Configuration
 LOCAL_VIDEO_DIR = "/Users/rajvindersingh/Projects/karooke/trending_music"
 BUCKET_NAME = "soniq-karaoke-videos"
 PROCESSING_SERVICE_URL = "https://soniq-processor-894603036612.us-central1.run.app"
+VOCAL_LEVELS = [0.0, 0.25, 0.5]  # 0%, 25%, 50% vocal levels
+
+# Concurrency and retry policy
+MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT', '10'))        # match the service's --max-instances
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '4'))
+REQUEST_TIMEOUT = int(os.getenv('REQUEST_TIMEOUT', '600'))   # per attempt; a timed-out job is re-attached
+JOB_DEADLINE = int(os.getenv('JOB_DEADLINE', '3600'))        # give up on a job after this long
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Written next to the videos
+CHECKPOINT_FILE = 'batch_checkpoint.json'
+SUMMARY_FILE = 'batch_summary.json'
+
+_engine = None
+_engine_lock = threading.Lock()
+_upload_slots = threading.Semaphore(UPLOAD_WORKERS)
+
+class TransientError(Exception):
+    """A failure worth retrying (timeouts, throttling, 5xx)"""
+
+class StillRunning(TransientError):
+    """The request timed out waiting for the job, which keeps running on the service"""
+
+def get_transfer_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = TransferEngine(BUCKET_NAME, max_workers=UPLOAD_WORKERS)
+        return _engine
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, BACKOFF_SECONDS * (2 ** attempt))
+
+def with_retries(func, what, retries=MAX_RETRIES):
+    """Call func(), retrying TransientError with backoff"""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except TransientError as e:
+            if attempt == retries:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"🔁 {what}: {e} - retrying in {delay:.0f}s ({attempt + 1}/{retries})")
+            time.sleep(delay)
+
+class Checkpoint:
+    """Per-video state in a JSON file, rewritten atomically after every change"""
+
+    def __init__(self, path):
+        self.path = path
+        self.items = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.items = json.load(f).get('items', {})
+
+    def get(self, name):
+        with self._lock:
+            return dict(self.items.get(name, {}))
+
+    def update(self, name, **fields):
+        with self._lock:
+            record = self.items.setdefault(name, {'video_name': name})
+            record.update(fields, updated_at=time.time())
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'items': self.items}, f, indent=2)
+            os.replace(tmp_path, self.path)
+            return dict(record)
 
 def upload_video_to_gcs(local_path, gcs_filename):
-    """Upload a video file to Google Cloud Storage"""
-    try:
-        client = storage.Client()
-        bucket = client.bucket(BUCKET_NAME)
-        blob = bucket.blob(f"trending/{gcs_filename}")
-        
+    """Upload a video file to Google Cloud Storage (skipped if the bucket already has it)"""
+    def upload():
+        result = get_transfer_engine().upload(local_path, f"trending/{gcs_filename}")
+        if result['status'] == 'failed':
+            raise TransientError(result['error'])
+        return result['url']
+
+    with _upload_slots:
         print(f"📤 Uploading: {gcs_filename}")
-        blob.upload_from_filename(local_path)
-        blob.make_public()
-        
-        gcs_url = f"https://storage.googleapis.com/{BUCKET_NAME}/trending/{gcs_filename}"
-        print(f"✅ Uploaded: {gcs_url}")
-        return gcs_url
-        
-    except Exception as e:
-        print(f"❌ Upload failed for {gcs_filename}: {e}")
-        return None
+        gcs_url = with_retries(upload, f"upload {gcs_filename}")
+    print(f"✅ Uploaded: {gcs_url}")
+    return gcs_url
 
-def process_video_with_karaoke_service(video_url, video_name):
-    """Send video to processing service for karaoke creation"""
+def submit_job(video_url):
+    """One POST /process; raises TransientError for retryable outcomes"""
     try:
-        print(f"\n🎬 Processing: {video_name}")
-        print(f"📁 Video URL: {video_url}")
-        
-        # Call processing service
         response = requests.post(
             f"{PROCESSING_SERVICE_URL}/process",
-            json={
-                "video_url": video_url,
-                "vocal_levels": [0.0, 0.25, 0.5]  # 0%, 25%, 50% vocal levels
-            },
-            timeout=1800  # 30 minute timeout for processing
+            json={"video_url": video_url, "vocal_levels": VOCAL_LEVELS},
+            timeout=REQUEST_TIMEOUT
         )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('success'):
-                print(f"✅ Processing successful!")
-                print(f"🎤 Created {len(result.get('videos', []))} karaoke versions:")
-                
-                for video in result.get('videos', []):
-                    print(f"  • {video['vocal_level']}% vocal: {video['url']}")
-                
-                return result
-            else:
-                print(f"❌ Processing failed: {result}")
-                return None
-        else:
-            print(f"❌ HTTP Error {response.status_code}: {response.text}")
-            return None
-            
+    except requests.ReadTimeout as e:
+        raise StillRunning(e)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise TransientError(e)
+    if response.status_code in RETRY_STATUSES:
+        raise TransientError(f"HTTP {response.status_code}: {response.text[:200]}")
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+    result = response.json()
+    if not result.get('success'):
+        raise RuntimeError(f"Processing failed: {result}")
+    return result
+
+def process_video_with_karaoke_service(video_url, video_name):
+    """Submit a job and keep re-attaching to it until it finishes or JOB_DEADLINE passes"""
+    print(f"🎬 Submitting: {video_name}")
+    deadline = time.time() + JOB_DEADLINE
+    attempt = 0
+    while True:
+        try:
+            return submit_job(video_url)
+        except StillRunning:
+            if time.time() >= deadline:
+                raise
+            # Re-attach right away without spending a retry
+            print(f"⏳ Still processing {video_name}, re-attaching...")
+        except TransientError as e:
+            if time.time() >= deadline or attempt >= MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            print(f"🔁 {video_name}: {e} - retrying in {delay:.0f}s ({attempt}/{MAX_RETRIES})")
+            time.sleep(delay)
+
+def run_item(video_path, checkpoint):
+    """Upload (unless already uploaded) and process one video; returns its checkpoint record"""
+    video_filename = os.path.basename(video_path)
+    video_name = os.path.splitext(video_filename)[0]
+    record = checkpoint.get(video_name)
+    started = time.time()
+
+    gcs_url = record.get('gcs_url')
+    if not gcs_url:
+        try:
+            gcs_url = upload_video_to_gcs(video_path, video_filename)
+        except Exception as e:
+            print(f"❌ Upload failed for {video_filename}: {e}")
+            return checkpoint.update(video_name, status='upload_failed', error=str(e))
+        checkpoint.update(video_name, status='uploaded', gcs_url=gcs_url, upload_seconds=round(time.time() - started, 1))
+
+    process_started = time.time()
+    try:
+        result = process_video_with_karaoke_service(gcs_url, video_name)
     except Exception as e:
-        print(f"❌ Processing error: {str(e)}")
-        return None
+        print(f"⚠️ Upload success but processing failed: {video_name}: {e}")
+        return checkpoint.update(video_name, status='processing_failed', error=str(e))
+
+    print(f"🎉 Complete success for: {video_name}")
+    return checkpoint.update(video_name, status='success', error=None, processing_result=result,
+                             process_seconds=round(time.time() - process_started, 1))
 
-def main():
+def write_summary(records, started, path):
+    """Structured batch report: counts, timings and per-video results"""
+    counts = {}
+    for record in records:
+        counts[record['status']] = counts.get(record['status'], 0) + 1
+    summary = {
+        'started_at': started,
+        'finished_at': time.time(),
+        'wall_seconds': round(time.time() - started, 1),
+        'max_in_flight': MAX_IN_FLIGHT,
+        'counts': counts,
+        'items': sorted(records, key=lambda r: r['video_name']),
+    }
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def main(video_dir=LOCAL_VIDEO_DIR):
     """Main function to upload and process all trending videos"""
     print("🎵 BATCH KARAOKE PROCESSOR FOR TRENDING VIDEOS 🎵")
     print("=" * 70)
-    
+
     # Get all downloaded video files
-    video_files = glob.glob(os.path.join(LOCAL_VIDEO_DIR, "*.mp4"))
+    video_files = sorted(glob.glob(os.path.join(video_dir, "*.mp4")))
     if not video_files:
-        print("❌ No video files found in", LOCAL_VIDEO_DIR)
-        return
-    
-    print(f"📂 Found {len(video_files)} videos to process")
-    print("")
-    
-    # Process each video
-    results = []
-    successful_uploads = 0
-    successful_processing = 0
-    
-    for i, video_path in enumerate(sorted(video_files), 1):
-        video_filename = os.path.basename(video_path)
-        video_name = os.path.splitext(video_filename)[0]
-        
-        print(f"\n{'='*70}")
-        print(f"🎯 VIDEO {i}/{len(video_files)}: {video_name}")
-        print(f"📁 Local: {video_path}")
-        
-        # Step 1: Upload to GCS
-        gcs_url = upload_video_to_gcs(video_path, video_filename)
-        
-        if gcs_url:
-            successful_uploads += 1
-            
-            # Step 2: Process with karaoke service
-            print(f"⏳ Starting karaoke processing...")
-            processing_result = process_video_with_karaoke_service(gcs_url, video_name)
-            
-            if processing_result:
-                successful_processing += 1
-                results.append({
-                    'video_name': video_name,
-                    'gcs_url': gcs_url,
-                    'processing_result': processing_result,
-                    'status': 'success'
-                })
-                print(f"🎉 Complete success for: {video_name}")
-            else:
-                results.append({
-                    'video_name': video_name,
-                    'gcs_url': gcs_url,
-                    'processing_result': None,
-                    'status': 'processing_failed'
-                })
-                print(f"⚠️ Upload success but processing failed: {video_name}")
+        print("❌ No video files found in", video_dir)
+        return None
+
+    checkpoint = Checkpoint(os.path.join(video_dir, CHECKPOINT_FILE))
+    summary_path = os.path.join(video_dir, SUMMARY_FILE)
+    records, todo = [], []
+    for video_path in video_files:
+        record = checkpoint.get(os.path.splitext(os.path.basename(video_path))[0])
+        if record.get('status') == 'success':
+            records.append(record)
         else:
-            results.append({
-                'video_name': video_name,
-                'gcs_url': None,
-                'processing_result': None,
-                'status': 'upload_failed'
-            })
-            print(f"❌ Upload failed: {video_name}")
-    
-    # Final summary
+            todo.append(video_path)
+
+    print(f"📂 Found {len(video_files)} videos, {len(records)} already done, {len(todo)} to process")
+    print(f"🚦 Up to {MAX_IN_FLIGHT} jobs in flight, {UPLOAD_WORKERS} uploads at a time")
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT) as pool:
+        futures = [pool.submit(run_item, video_path, checkpoint) for video_path in todo]
+        for future in as_completed(futures):
+            records.append(future.result())
+
+    summary = write_summary(records, started, summary_path)
+
     print(f"\n{'='*70}")
     print("📊 BATCH PROCESSING SUMMARY")
     print(f"{'='*70}")
     print(f"📂 Total videos: {len(video_files)}")
-    print(f"📤 Successful uploads: {successful_uploads}/{len(video_files)}")
-    print(f"🎬 Successful processing: {successful_processing}/{len(video_files)}")
-    print("")
-    
-    # Detailed results
-    if successful_processing > 0:
-        print("🎉 SUCCESSFULLY PROCESSED VIDEOS:")
-        for result in results:
-            if result['status'] == 'success':
-                print(f"\n🎵 {result['video_name']}")
-                print(f"   📁 Original: {result['gcs_url']}")
-                
-                processing_result = result['processing_result']
-                if processing_result and 'videos' in processing_result:
-                    for video in processing_result['videos']:
-                        print(f"   🎤 {video['vocal_level']}% vocal: {video['url']}")
-    
-    if successful_processing < len(video_files):
-        print(f"\n⚠️ FAILED/PARTIAL RESULTS:")
-        for result in results:
-            if result['status'] != 'success':
-                print(f"   ❌ {result['video_name']}: {result['status']}")
-    
-    print(f"\n🏁 Batch processing complete!")
-    print(f"✅ {successful_processing} videos fully processed into karaoke versions")
+    for status, count in sorted(summary['counts'].items()):
+        print(f"   {status}: {count}")
+    print(f"⏱️ Wall time: {summary['wall_seconds']}s")
+    print(f"📝 Summary: {summary_path}")
+    return summary
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Batch Runner
+Streams a manifest of songs through one separator:
+
+    prepare (download + decode, `prefetch` items ahead on a thread pool)
+        -> separate (caller's thread, one model, several ready items per call)
+        -> finish (uploads on a thread pool while the next batch separates)
+
+so downloading item k+1 overlaps separating item k, and short items that are
+ready together share a single inference call
+"""
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class BatchItem:
+    """One manifest entry and what happened to it"""
+
+    def __init__(self, index, job_id, data):
+        self.index = index
+        self.job_id = job_id
+        self.data = data
+        self.status = 'pending'         # pending | completed | cached | failed
+        self.prepared = None
+        self.result = None
+        self.error = None
+        self.timings = {}
+
+    def fail(self, stage, error):
+        self.status = 'failed'
+        self.error = f"{stage}: {error}"
+        print(f"❌ Batch item {self.index} ({self.job_id}) failed at {stage}: {error}")
+
+def _timed(item, stage, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        item.timings[stage] = round(item.timings.get(stage, 0.0) + time.perf_counter() - start, 3)
+
+def run_batch(items, prepare, separate_many, finish, lookup=None, seconds_of=None,
+              prefetch=2, finish_workers=4, max_batch_seconds=300):
+    """Run BatchItems through prepare -> separate_many -> finish and return them in order
+
+    prepare(item) -> prepared input (e.g. (waveform, sample_rate)), None on failure
+    separate_many([item, ...]) -> one separated result per item, in the same order
+    finish(item, separated) -> the item's result dict, None on failure
+    lookup(item) -> a stored result to reuse instead of running the item, or None
+    seconds_of(prepared) -> audio length, used to cap each separate_many call at
+    max_batch_seconds (items are never split; a single long item runs on its own)
+    """
+    pending = deque()
+    for item in items:
+        stored = lookup(item) if lookup else None
+        if stored is not None:
+            item.status, item.result = 'cached', stored
+        else:
+            pending.append(item)
+
+    prepare_pool = ThreadPoolExecutor(max_workers=max(1, prefetch), thread_name_prefix='batch-prepare')
+    finish_pool = ThreadPoolExecutor(max_workers=max(1, finish_workers), thread_name_prefix='batch-finish')
+    in_flight = deque()
+    finishing = []
+
+    def run_prepare(item):
+        try:
+            item.prepared = _timed(item, 'prepare', prepare, item)
+            if item.prepared is None:
+                item.fail('prepare', 'no audio')
+        except Exception as e:
+            item.fail('prepare', e)
+        return item
+
+    def run_finish(item, separated):
+        try:
+            item.result = _timed(item, 'finish', finish, item, separated)
+            if item.result is None:
+                item.fail('finish', 'no result')
+            else:
+                item.status = 'completed'
+        except Exception as e:
+            item.fail('finish', e)
+        finally:
+            item.prepared = None
+
+    def top_up():
+        while pending and len(in_flight) < max(1, prefetch):
+            in_flight.append(prepare_pool.submit(run_prepare, pending.popleft()))
+
+    try:
+        top_up()
+        while in_flight:
+            # Take the next item in manifest order, then any that are already prepared behind it
+            batch = [in_flight.popleft().result()]
+            total = seconds_of(batch[0].prepared) if seconds_of and batch[0].prepared is not None else 0
+            while in_flight and in_flight[0].done():
+                candidate = in_flight[0].result()
+                length = seconds_of(candidate.prepared) if seconds_of and candidate.prepared is not None else 0
+                if total + length > max_batch_seconds:
+                    break
+                batch.append(in_flight.popleft().result())
+                total += length
+            top_up()
+
+            ready = [item for item in batch if item.status != 'failed']
+            if not ready:
+                continue
+            start = time.perf_counter()
+            try:
+                separated = separate_many(ready)
+            except Exception as e:
+                for item in ready:
+                    item.fail('separate', e)
+                    item.prepared = None
+                continue
+            elapsed = time.perf_counter() - start
+            for item, result in zip(ready, separated):
+                item.timings['separate'] = round(elapsed, 3)
+                item.timings['batched_with'] = len(ready)
+                finishing.append(finish_pool.submit(run_finish, item, result))
+        for future in finishing:
+            future.result()
+    finally:
+        prepare_pool.shutdown(wait=True)
+        finish_pool.shutdown(wait=True)
+    return items
+
+def summarize(items, wall_seconds):
+    counts = {'completed': 0, 'cached': 0, 'failed': 0}
+    for item in items:
+        counts[item.status] = counts.get(item.status, 0) + 1
+    return dict(counts, total=len(items), wall_seconds=round(wall_seconds, 3))
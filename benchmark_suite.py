@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+"""
+Offline End-to-End Benchmark Suite
+Runs the processing service against the bundled test media with local stand-ins
+for GCS, Whisper and the video host, then reports throughput, per-stage latency
+percentiles and peak memory, and compares them against a saved baseline
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.server
+from datetime import datetime, timezone
+from functools import partial
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_MEDIA = [
+    'test_30sec_audio.wav',
+    'test_30sec_video.mp4',
+    'punjaban_pure_instrumental.mp4',
+]
+DEFAULT_BASELINE = os.path.join(REPO_DIR, 'benchmark_baseline.json')
+
+# Metrics where a larger value is a regression; everything else is "higher is better"
+LOWER_IS_BETTER = ('latency', 'peak_rss_mb', 'startup.')
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def summarize(values):
+    """p50/p90/p95/p99/max summary of a list of latencies"""
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 50), 3),
+        'p90': round(percentile(values, 90), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+        'max': round(max(values), 3),
+    } if values else {'count': 0}
+
+def media_duration(path, ffprobe='ffprobe'):
+    """Media duration in seconds from the container header"""
+    from media_probe import duration
+    return duration(path, ffprobe) or 0.0
+
+# Local stand-ins
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass  # Suppress server logs
+
+def _start_server(handler):
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+
+def create_local_file_server(media_files):
+    """Serve the benchmark media over HTTP, like test_cloud_run_simulation does"""
+    web_dir = tempfile.mkdtemp(prefix='bench_media_')
+    for name in media_files:
+        shutil.copy2(os.path.join(REPO_DIR, name), os.path.join(web_dir, name))
+
+    httpd, base_url = _start_server(partial(_QuietHandler, directory=web_dir))
+    print(f"🌐 Media server on {base_url} serving {len(media_files)} files")
+    return httpd, base_url, web_dir
+
+class StubWhisperHandler(http.server.BaseHTTPRequestHandler):
+    """Answers /v1/audio/transcriptions with evenly spaced fake words"""
+    latency = 0.0
+    words_per_second = 2.0
+    duration = 30.0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        time.sleep(self.latency)
+
+        step = 1.0 / self.words_per_second
+        words = [
+            {'word': f"la{i}", 'start': round(i * step, 2), 'end': round(i * step + step * 0.8, 2)}
+            for i in range(int(self.duration * self.words_per_second))
+        ]
+        body = json.dumps({
+            'task': 'transcribe',
+            'language': 'english',
+            'duration': self.duration,
+            'text': " ".join(w['word'] for w in words),
+            'words': words,
+        }).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_whisper(latency=0.0):
+    """Start a local server that mimics the Whisper transcription API"""
+    handler = type('BenchWhisperHandler', (StubWhisperHandler,), {'latency': latency})
+    httpd, base_url = _start_server(handler)
+    print(f"🎙️ Stub Whisper on {base_url} ({latency:.2f}s latency)")
+    return httpd, f"{base_url}/v1"
+
+class FakeBlob:
+    """Minimal google.cloud.storage.Blob backed by a local directory"""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+
+    @property
+    def public_url(self):
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    @property
+    def generation(self):
+        return os.stat(self.path).st_mtime_ns if os.path.exists(self.path) else 0
+
+    @property
+    def updated(self):
+        return datetime.fromtimestamp(os.path.getmtime(self.path), timezone.utc)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    @property
+    def md5_hash(self):
+        from gcs_transfer import file_checksums
+        return file_checksums(self.path)[0]
+
+    crc32c = None
+
+    def _missing(self):
+        from google.cloud.exceptions import NotFound
+        if not os.path.exists(self.path):
+            raise NotFound(self.name)
+
+    def _write(self, if_generation_match=None):
+        from google.api_core.exceptions import PreconditionFailed
+        if if_generation_match is not None and if_generation_match != self.generation:
+            raise PreconditionFailed(self.name)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def upload_from_filename(self, filename, if_generation_match=None, **kwargs):
+        self._write(if_generation_match)
+        shutil.copyfile(filename, self.path)
+
+    def upload_from_string(self, data, if_generation_match=None, **kwargs):
+        self._write(if_generation_match)
+        with open(self.path, 'wb') as f:
+            f.write(data.encode() if isinstance(data, str) else data)
+
+    def download_to_filename(self, filename, **kwargs):
+        self._missing()
+        shutil.copyfile(self.path, filename)
+
+    def download_as_bytes(self, **kwargs):
+        self._missing()
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def download_as_text(self, **kwargs):
+        return self.download_as_bytes().decode('utf-8')
+
+    def exists(self, client=None):
+        return os.path.exists(self.path)
+
+    def reload(self, **kwargs):
+        self._missing()
+
+    def delete(self, **kwargs):
+        self._missing()
+        os.remove(self.path)
+
+    def make_public(self):
+        pass
+
+class FakeBucket:
+    def __init__(self, root, name):
+        self.name = name
+        self.root = os.path.join(root, name)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        blob = FakeBlob(self, name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix=''):
+        for directory, _, files in os.walk(self.root):
+            for filename in sorted(files):
+                name = os.path.relpath(os.path.join(directory, filename), self.root).replace(os.sep, '/')
+                if name.startswith(prefix):
+                    yield FakeBlob(self, name)
+
+class FakeStorageClient:
+    """Drop-in for storage.Client that writes objects under a local root"""
+    root = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def bucket(self, name):
+        return FakeBucket(self.root, name)
+
+def fake_storage_module(root):
+    """Object exposing a Client attribute, to replace the google.cloud.storage module"""
+    client_class = type('BenchStorageClient', (FakeStorageClient,), {'root': root})
+    return type('FakeStorageModule', (), {'Client': client_class})
+
+# Benchmark run
+
+def configure_processing_service(gcs_root, whisper_base):
+    """Import processing_service and point it at the local stand-ins"""
+    import openai
+    import processing_service
+
+    processing_service._storage_client = fake_storage_module(gcs_root).Client()
+    processing_service.FFMPEG_PATH = shutil.which('ffmpeg') or processing_service.FFMPEG_PATH
+    processing_service.OPENAI_API_KEY = 'sk-benchmark'
+    openai.api_base = whisper_base
+    return processing_service
+
+def vocals_wav(service, gcs_root, job_id, separated_audio):
+    """Local WAV of the job's uploaded vocal stem (stem packs are decoded next to it)"""
+    from stem_pack import StemPack, EXTENSIONS
+    from stem_store import write_wav
+    entry = next((e for e in separated_audio if e.get('type') == 'vocals'), {})
+    filename = entry.get('filename') or f"separated_audio/{job_id}_vocals.{EXTENSIONS.get(service.STEM_CODEC, 'wav')}"
+    path = os.path.join(gcs_root, service.BUCKET_NAME, 'karaoke', filename)
+    if not path.endswith('.kstp'):
+        return path
+    pack = StemPack.from_file(path)
+    return write_wav(path[:-len('.kstp')] + '.wav', pack.read(), pack.sample_rate)
+
+def run_job(service, client, gcs_root, video_url, test_duration, transcribe):
+    """Run one /process job (plus optional transcription) and return its timeline"""
+    from pipeline_profiler import JobProfiler
+
+    payload = {'video_url': video_url, 'vocal_levels': [0.0]}
+    if test_duration:
+        payload['test_duration'] = test_duration
+
+    start = time.perf_counter()
+    response = client.post('/process', json=payload)
+    result = response.get_json() or {}
+    job_id = result.get('job_id')
+
+    timeline = {'stages': [], 'status': 'failed'}
+    if response.status_code == 200 and job_id:
+        timeline_path = os.path.join(gcs_root, service.BUCKET_NAME, 'karaoke', 'requests', f"{job_id}_timeline.json")
+        with open(timeline_path) as f:
+            timeline = json.load(f)
+
+        if transcribe:
+            vocals = vocals_wav(service, gcs_root, job_id, result.get('separated_audio') or [])
+            with JobProfiler(f"{job_id}-transcribe", 'benchmark') as profiler:
+                if not service.transcribe_audio(vocals):
+                    profiler.fail('Transcription failed')
+            timeline['stages'].extend(profiler.timeline()['stages'])
+            if profiler.status != 'success':
+                timeline['status'] = 'failed'
+
+    timeline['benchmark_wall_seconds'] = time.perf_counter() - start
+    return timeline
+
+def run_benchmark(media_files, iterations, test_duration, transcribe, whisper_latency):
+    """Run every media file `iterations` times and aggregate the results"""
+    gcs_root = tempfile.mkdtemp(prefix='bench_gcs_')
+    media_server, media_base, media_dir = create_local_file_server(media_files)
+    whisper_server, whisper_base = start_stub_whisper(whisper_latency)
+
+    try:
+        service = configure_processing_service(gcs_root, whisper_base)
+        service.app.config['TESTING'] = True
+
+        timelines = []
+        audio_seconds = 0.0
+        started = time.perf_counter()
+
+        with service.app.test_client() as client:
+            for iteration in range(iterations):
+                for name in media_files:
+                    duration = media_duration(os.path.join(media_dir, name))
+                    if test_duration:
+                        duration = min(duration, test_duration)
+
+                    print(f"🎯 [{iteration + 1}/{iterations}] {name} ({duration:.1f}s audio)")
+                    timeline = run_job(service, client, gcs_root, f"{media_base}/{name}", test_duration, transcribe)
+                    timeline['media'] = name
+                    timelines.append(timeline)
+
+                    if timeline['status'] == 'success':
+                        audio_seconds += duration
+                        print(f"   ✅ {timeline['benchmark_wall_seconds']:.2f}s")
+                    else:
+                        print(f"   ❌ {timeline.get('error', 'job failed')}")
+
+        wall = time.perf_counter() - started
+        return build_report(timelines, wall, audio_seconds, {
+            'media': media_files,
+            'iterations': iterations,
+            'test_duration': test_duration,
+            'transcribe': transcribe,
+            'whisper_latency': whisper_latency,
+        })
+    finally:
+        media_server.shutdown()
+        whisper_server.shutdown()
+        shutil.rmtree(media_dir, ignore_errors=True)
+        shutil.rmtree(gcs_root, ignore_errors=True)
+
+def build_report(timelines, wall, audio_seconds, config):
+    """Throughput, stage latency percentiles and peak memory for a set of job timelines"""
+    succeeded = [t for t in timelines if t['status'] == 'success']
+
+    stage_latency = {}
+    for timeline in succeeded:
+        for stage in timeline['stages']:
+            stage_latency.setdefault(stage['stage'], []).append(stage['wall_seconds'])
+
+    return {
+        'config': config,
+        'jobs': len(timelines),
+        'failed_jobs': len(timelines) - len(succeeded),
+        'wall_seconds': round(wall, 3),
+        'throughput': {
+            'jobs_per_minute': round(len(succeeded) / wall * 60, 3) if wall else 0.0,
+            'audio_seconds_per_wall_second': round(audio_seconds / wall, 3) if wall else 0.0,
+        },
+        'job_latency': summarize([t['benchmark_wall_seconds'] for t in succeeded]),
+        'stage_latency': {name: summarize(values) for name, values in sorted(stage_latency.items())},
+        'memory': {
+            'peak_rss_mb': max((t.get('peak_rss_mb', 0) for t in timelines), default=0),
+            'child_peak_rss_mb': max(
+                (s.get('child_peak_rss_mb', 0) for t in timelines for s in t['stages']), default=0),
+        },
+    }
+
+# Startup cost
+
+def parse_importtime(stderr):
+    """Parse `python -X importtime` output into [(module, self_us, cumulative_us)]"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            # One space follows the separator; deeper imports are indented by two per level
+            modules.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return modules
+
+def import_cost(statement, top=10):
+    """Run `statement` under -X importtime and summarise the heaviest modules"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                            capture_output=True, text=True, cwd=REPO_DIR)
+    wall = time.perf_counter() - start
+    modules = parse_importtime(result.stderr)
+    # Top-level packages (no leading indentation) give the per-dependency cost
+    top_level = [(name, cum) for name, _, cum in modules if not name.startswith(' ')]
+    return {
+        'statement': statement,
+        'ok': result.returncode == 0,
+        'wall_seconds': round(wall, 3),
+        'import_seconds': round(sum(cum for _, cum in top_level) / 1e6, 3),
+        'top_packages': [
+            {'module': name, 'cumulative_ms': round(cum / 1000, 1)}
+            for name, cum in sorted(top_level, key=lambda m: -m[1])[:top]
+        ],
+        'top_self': [
+            {'module': name.strip(), 'self_ms': round(self_us / 1000, 1)}
+            for name, self_us, _ in sorted(modules, key=lambda m: -m[1])[:top]
+        ],
+    }
+
+def time_to_endpoints(timeout=600):
+    """Start processing_service.py and time the first 200 from /health and /ready"""
+    import socket
+    import requests
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    env = dict(os.environ, PORT=str(port))
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'processing_service.py'], cwd=REPO_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings = {'health_seconds': None, 'ready_seconds': None}
+    try:
+        while time.perf_counter() - start < timeout and process.poll() is None:
+            for endpoint in ('health', 'ready'):
+                if timings[f"{endpoint}_seconds"] is not None:
+                    continue
+                try:
+                    response = requests.get(f"http://127.0.0.1:{port}/{endpoint}", timeout=1)
+                except requests.RequestException:
+                    continue
+                if response.status_code == 200:
+                    timings[f"{endpoint}_seconds"] = round(time.perf_counter() - start, 3)
+                elif endpoint == 'ready' and response.json().get('status') == 'error':
+                    timings['ready_error'] = response.json().get('error')
+            if timings['ready_seconds'] is not None or 'ready_error' in timings:
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return timings
+
+def startup_report():
+    """Import cost of the service module, deferred stage imports, and endpoint readiness"""
+    print("🚀 Measuring startup cost...")
+    service = import_cost('import processing_service')
+    deferred = import_cost('import processing_service; processing_service.warm_up()')
+    report = {
+        'import_seconds': service['import_seconds'],
+        'warm_up_import_seconds': deferred['import_seconds'],
+        'service_import': service,
+        'warm_up_import': deferred,
+    }
+    report.update(time_to_endpoints())
+    return report
+
+# Baseline comparison
+
+def _flatten(report):
+    flat = {}
+    for key in ('throughput', 'job_latency', 'stage_latency', 'memory', 'startup'):
+        section = report.get(key) or {}
+        for name, value in section.items():
+            if name in ('service_import', 'warm_up_import'):
+                continue
+            if isinstance(value, dict):
+                for stat in ('p50', 'p95'):
+                    if stat in value:
+                        flat[f"{key}.{name}.{stat}"] = value[stat]
+            elif name != 'count' and isinstance(value, (int, float)):
+                flat[f"{key}.{name}"] = value
+    return flat
+
+def compare_to_baseline(report, baseline, tolerance):
+    """List metrics that regressed by more than `tolerance` (fraction) versus the baseline"""
+    current = _flatten(report)
+    previous = _flatten(baseline)
+    regressions = []
+
+    for name, old in sorted(previous.items()):
+        new = current.get(name)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        lower_better = any(marker in name for marker in LOWER_IS_BETTER)
+        if (lower_better and change > tolerance) or (not lower_better and change < -tolerance):
+            regressions.append({'metric': name, 'baseline': old, 'current': new, 'change': round(change, 3)})
+
+    return regressions
+
+def print_report(report):
+    print(f"\n{'='*60}")
+    print("📊 BENCHMARK REPORT")
+    print(f"{'='*60}")
+    print(f"Jobs: {report['jobs']} ({report['failed_jobs']} failed) in {report['wall_seconds']:.1f}s")
+    print(f"Throughput: {report['throughput']['jobs_per_minute']} jobs/min, "
+          f"{report['throughput']['audio_seconds_per_wall_second']} audio-s per wall-s")
+    print(f"Peak RSS: {report['memory']['peak_rss_mb']}MB (children {report['memory']['child_peak_rss_mb']}MB)")
+    print(f"\n{'stage':<14}{'n':>5}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in report['stage_latency'].items():
+        print(f"{name:<14}{stats['count']:>5}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}")
+
+    startup = report.get('startup')
+    if startup:
+        print(f"\n🚀 Startup: import {startup['import_seconds']}s "
+              f"(+{startup['warm_up_import_seconds'] - startup['import_seconds']:.3f}s deferred to warm-up), "
+              f"/health {startup['health_seconds']}s, /ready {startup['ready_seconds']}s")
+        for module in startup['warm_up_import']['top_packages'][:5]:
+            print(f"   {module['module']:<30}{module['cumulative_ms']:>10.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for the karaoke processing service")
+    parser.add_argument('--media', nargs='+', default=BENCHMARK_MEDIA, help="Media files from the repo to process")
+    parser.add_argument('--iterations', type=int, default=3)
+    parser.add_argument('--test-duration', type=int, default=None, help="Limit each job to N seconds of audio")
+    parser.add_argument('--no-transcribe', action='store_true', help="Skip the stub Whisper transcription stage")
+    parser.add_argument('--whisper-latency', type=float, default=0.5, help="Simulated API latency in seconds")
+    parser.add_argument('--output', help="Write the JSON report to this path")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed regression as a fraction")
+    parser.add_argument('--startup', action='store_true', help="Also measure import time and /health, /ready latency")
+    args = parser.parse_args()
+
+    print("🏁 KARAOKE PIPELINE BENCHMARK 🏁")
+    print("=" * 60)
+
+    startup = startup_report() if args.startup else None
+    report = run_benchmark(args.media, args.iterations, args.test_duration,
+                           not args.no_transcribe, args.whisper_latency)
+    report['startup'] = startup
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📝 Report saved to: {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📌 Baseline saved to: {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} regressions versus {os.path.basename(args.baseline)}:")
+            for r in regressions:
+                print(f"   ❌ {r['metric']}: {r['baseline']} → {r['current']} ({r['change']:+.0%})")
+            return 1
+        print(f"\n✅ No regressions versus {os.path.basename(args.baseline)}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
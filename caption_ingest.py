@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Caption Ingest
+YouTube caption tracks (fetched by yt-dlp next to the video) as a transcription source.
+
+Two kinds of track are useful for karaoke:
+- word-timed: YouTube's speech recognition (json3 segments with tOffsetMs, or WebVTT
+  with inline <00:00:01.234> tags); used as the transcript when it passes caption_quality()
+- line-timed: uploaded (usually human) captions with one cue per lyric line; their text
+  is aligned to the vocals like known lyrics, and the cue times are the fallback
+
+Only the video's own language is fetched: manual subtitles in that language, else the
+'<lang>-orig' recognition track. Translated tracks are skipped.
+"""
+import os
+import re
+import json
+import glob
+import html
+from word_timing import Word, Transcript
+
+CAPTION_FORMATS = ('json3', 'vtt')
+MIN_CAPTION_WORDS = 20
+MIN_WORDS_PER_MINUTE = 15
+WORD_SECONDS = (0.05, 2.0)          # plausible median word length of a word-timed track
+NOISE_TAG = re.compile(r"\[[^\]]*\]")                  # [Music], [Applause]
+TIMESTAMP = r"(?:\d+:)?\d{2}:\d{2}\.\d{3}"
+CUE_TIMING = re.compile(rf"^({TIMESTAMP})\s+-->\s+({TIMESTAMP})")
+INLINE_TIME = re.compile(rf"<({TIMESTAMP})>")
+TAG = re.compile(r"</?[^>]+>")
+
+class CaptionTrack:
+    """Caption words and cue lines; `word_timed` says whether the words carry their own times"""
+
+    def __init__(self, words, lines, word_timed, path=None, noise=0):
+        self.transcript = Transcript(words)
+        self.lines = lines
+        self.word_timed = word_timed
+        self.path = path
+        self.noise = noise              # [Music]-style tags that were dropped
+
+    @property
+    def lyrics(self):
+        return "\n".join(self.lines)
+
+def choose_track(info):
+    """(language key, automatic) of the caption track to fetch for a yt-dlp info dict, or None"""
+    language = info.get('language')
+    manual = [key for key in (info.get('subtitles') or {}) if key != 'live_chat']
+    wanted = language or 'en'
+    for key in manual:
+        if key.split('-')[0] == wanted.split('-')[0]:
+            return key, False
+    automatic = info.get('automatic_captions') or {}
+    if language and f"{language}-orig" in automatic:
+        return f"{language}-orig", True
+    return None
+
+def download_options(info):
+    """yt-dlp params that write the chosen caption track next to the video ({} without one)"""
+    choice = choose_track(info)
+    if not choice:
+        return {}
+    key, automatic = choice
+    return {
+        'writesubtitles': not automatic,
+        'writeautomaticsub': automatic,
+        'subtitleslangs': [key],
+        'subtitlesformat': '/'.join(CAPTION_FORMATS) + '/best',
+    }
+
+def find_caption_file(video_path):
+    """Caption file yt-dlp wrote next to `video_path` ('<base>.<lang>.json3' or '.vtt'), or ''"""
+    base = glob.escape(os.path.splitext(video_path)[0])
+    for extension in CAPTION_FORMATS:
+        found = sorted(glob.glob(f"{base}.*.{extension}"))
+        if found:
+            return found[0]
+    return ''
+
+def _clean(text):
+    """Caption words without markup, music notes and [Music]-style tags; (words, dropped tag count)"""
+    text = html.unescape(TAG.sub('', text)).replace('♪', ' ')
+    dropped = len(NOISE_TAG.findall(text))
+    words = [token.strip('()') for token in NOISE_TAG.sub(' ', text).split()]
+    return [word for word in words if word], dropped
+
+def _spread(words, start, end):
+    """Word records for a line-timed cue, with time split by word length"""
+    weights = [len(word) + 1 for word in words]
+    total, position, timed = float(sum(weights)), start, []
+    for word, weight in zip(words, weights):
+        length = (end - start) * weight / total
+        timed.append(Word(word, position, position + length))
+        position += length
+    return timed
+
+def _seconds(stamp):
+    parts = [float(p) for p in stamp.split(':')]
+    return sum(value * 60 ** i for i, value in enumerate(reversed(parts)))
+
+def parse_json3(data, path=None):
+    """CaptionTrack from YouTube's json3 caption format"""
+    words, lines, noise, word_timed = [], [], 0, False
+    for event in data.get('events', []):
+        segs = [seg for seg in event.get('segs') or [] if seg.get('utf8', '').strip()]
+        if not segs:
+            continue
+        start = event.get('tStartMs', 0) / 1000.0
+        end = start + event.get('dDurationMs', 0) / 1000.0
+        if len(segs) > 1 or 'tOffsetMs' in segs[0]:
+            word_timed = True
+            times = [start + seg.get('tOffsetMs', 0) / 1000.0 for seg in segs] + [end]
+            line = []
+            for seg, seg_start, seg_end in zip(segs, times, times[1:]):
+                cleaned, dropped = _clean(seg['utf8'])
+                noise += dropped
+                words.extend(Word(word, seg_start, seg_end) for word in cleaned)
+                line.extend(cleaned)
+        else:
+            line, dropped = _clean(segs[0]['utf8'])
+            noise += dropped
+            words.extend(_spread(line, start, end))
+        if line:
+            lines.append(" ".join(line))
+    return CaptionTrack(_untangle(words), lines, word_timed, path, noise)
+
+def parse_vtt(text, path=None):
+    """CaptionTrack from WebVTT; recognition tracks with inline word times keep them"""
+    cues, cue = [], None
+    for line in text.splitlines():
+        timing = CUE_TIMING.match(line.strip())
+        if timing:
+            cue = [_seconds(timing.group(1)), _seconds(timing.group(2)), []]
+            cues.append(cue)
+        elif not line:
+            cue = None
+        elif cue is not None and line.strip():     # recognition cues hold a ' ' placeholder line
+            cue[2].append(line.strip())
+    word_timed = any(INLINE_TIME.search(line) for _, _, cue_lines in cues for line in cue_lines)
+    words, lines, noise, previous = [], [], 0, None
+    for start, end, cue_lines in cues:
+        if word_timed:
+            # Rolling recognition cues repeat the previous line untagged; only tagged lines are new
+            for line in cue_lines:
+                if not INLINE_TIME.search(line):
+                    if line != previous:                        # a cue of its own, like [Music]
+                        noise += _clean(line)[1]
+                    previous = line
+                    continue
+                previous = TAG.sub('', line)
+                pieces = INLINE_TIME.split(line)        # text, time, text, time, ...
+                times = [start] + [_seconds(t) for t in pieces[1::2]] + [end]
+                line_words = []
+                for piece, piece_start, piece_end in zip(pieces[0::2], times, times[1:]):
+                    cleaned, dropped = _clean(piece)
+                    noise += dropped
+                    words.extend(Word(word, piece_start, piece_end) for word in cleaned)
+                    line_words.extend(cleaned)
+                if line_words:
+                    lines.append(" ".join(line_words))
+        else:
+            cleaned, dropped = _clean(" ".join(cue_lines))
+            noise += dropped
+            if cleaned and cleaned != previous:
+                words.extend(_spread(cleaned, start, end))
+                lines.append(" ".join(cleaned))
+            previous = cleaned
+    return CaptionTrack(_untangle(words), lines, word_timed, path, noise)
+
+def _untangle(words):
+    """End every word by the next one's start"""
+    for word, following in zip(words, words[1:]):
+        word.end = max(word.start, min(word.end, following.start))
+    return words
+
+def load_captions(path):
+    """CaptionTrack from a .json3 or .vtt file"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json3'):
+            return parse_json3(json.load(f), path)
+        return parse_vtt(f.read(), path)
+
+def caption_quality(track, duration=None):
+    """None when the track is usable, else the reason it is not"""
+    words = track.transcript.words
+    if len(words) < MIN_CAPTION_WORDS:
+        return f"only {len(words)} words" + (f" ({track.noise} [Music]-style tags)" if track.noise else "")
+    if any(b.start < a.start for a, b in zip(words, words[1:])):
+        return "word times out of order"
+    if duration:
+        if words[-1].start > duration + 5:
+            return f"runs past the audio ({words[-1].start:.0f}s > {duration:.0f}s)"
+        if len(words) / (duration / 60.0) < MIN_WORDS_PER_MINUTE:
+            return f"too sparse ({len(words)} words in {duration:.0f}s)"
+    if track.word_timed:
+        lengths = sorted(w.end - w.start for w in words)
+        median = lengths[len(lengths) // 2]
+        if not WORD_SECONDS[0] <= median <= WORD_SECONDS[1]:
+            return f"implausible word length ({median:.2f}s median)"
+    return None
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Transcription Backend Comparison
+Runs a transcription backend over audio files that already have a stored (API)
+transcript and reports word error rate, word timing error and speed:
+
+    python compare_transcription.py references/ --backend local --model small --threads 4
+
+references/ holds pairs <name>.json + <name>.<audio ext>; the JSON is a transcript
+({"text", "words"}) or a job metadata file with a "transcript" field.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from word_timing import Word, Transcript
+from transcription_backends import get_backend, BACKENDS
+from media_probe import duration as media_duration
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.mp3', '.m4a', '.mp4', '.webm')
+
+def normalize_word(word):
+    """Lowercase without punctuation, so 'Hello,' matches 'hello'"""
+    return re.sub(r"[^\w']", '', word.lower())
+
+def align_words(reference, hypothesis):
+    """Levenshtein alignment of two word lists; returns (substitutions, deletions, insertions, matches)
+
+    matches lists (reference_index, hypothesis_index) of identical words.
+    """
+    ref = [normalize_word(w.word) for w in reference]
+    hyp = [normalize_word(w.word) for w in hypothesis]
+    rows, cols = len(ref) + 1, len(hyp) + 1
+    cost = [[0] * cols for _ in range(rows)]
+    for i in range(rows):
+        cost[i][0] = i
+    for j in range(cols):
+        cost[0][j] = j
+    for i in range(1, rows):
+        for j in range(1, cols):
+            cost[i][j] = min(cost[i - 1][j - 1] + (ref[i - 1] != hyp[j - 1]),
+                             cost[i - 1][j] + 1, cost[i][j - 1] + 1)
+    substitutions = deletions = insertions = 0
+    matches = []
+    i, j = len(ref), len(hyp)
+    # Among equally cheap paths prefer matches, then gaps over substitutions, which keeps
+    # more matched words for the timing comparison
+    while i or j:
+        if i and j and ref[i - 1] == hyp[j - 1] and cost[i][j] == cost[i - 1][j - 1]:
+            matches.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif i and cost[i][j] == cost[i - 1][j] + 1:
+            deletions += 1
+            i -= 1
+        elif j and cost[i][j] == cost[i][j - 1] + 1:
+            insertions += 1
+            j -= 1
+        else:
+            substitutions += 1
+            i, j = i - 1, j - 1
+    return substitutions, deletions, insertions, matches[::-1]
+
+def compare_transcripts(reference, hypothesis):
+    """WER and start-time error of `hypothesis` against `reference` (both Transcripts)"""
+    substitutions, deletions, insertions, matches = align_words(reference.words, hypothesis.words)
+    offsets = [abs(reference.words[i].start - hypothesis.words[j].start) for i, j in matches]
+    return {
+        'reference_words': len(reference.words),
+        'hypothesis_words': len(hypothesis.words),
+        'wer': round((substitutions + deletions + insertions) / max(1, len(reference.words)), 4),
+        'substitutions': substitutions,
+        'deletions': deletions,
+        'insertions': insertions,
+        'timing_mae': round(sum(offsets) / len(offsets), 3) if offsets else None,
+    }
+
+def load_reference(path):
+    """Transcript from a stored transcript or job metadata JSON"""
+    with open(path) as f:
+        data = json.load(f)
+    data = data.get('transcript', data)
+    return Transcript([Word(w['word'], w['start'], w['end']) for w in data.get('words', [])], data.get('text'))
+
+def find_pairs(directory):
+    """[(name, audio_path, reference_path)] of every reference with an audio file next to it"""
+    pairs = []
+    for name in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(name)
+        if extension != '.json':
+            continue
+        audio = next((os.path.join(directory, stem + ext) for ext in AUDIO_EXTENSIONS
+                      if os.path.exists(os.path.join(directory, stem + ext))), None)
+        if audio:
+            pairs.append((stem, audio, os.path.join(directory, name)))
+    return pairs
+
+def run_comparison(backend, pairs):
+    """Per-file results plus totals; the realtime factor is audio seconds per wall second"""
+    results = []
+    for name, audio_path, reference_path in pairs:
+        print(f"🎙️ {name}...")
+        start = time.perf_counter()
+        hypothesis = backend.transcribe(audio_path)
+        seconds = time.perf_counter() - start
+        audio_seconds = media_duration(audio_path) or 0.0
+        result = dict(compare_transcripts(load_reference(reference_path), hypothesis), name=name,
+                      seconds=round(seconds, 2), audio_seconds=round(audio_seconds, 2),
+                      realtime_factor=round(audio_seconds / seconds, 2) if seconds else None)
+        print(f"  WER {result['wer']:.1%}, timing error {result['timing_mae']}s, {result['realtime_factor']}x realtime")
+        results.append(result)
+    reference_words = sum(r['reference_words'] for r in results)
+    errors = sum(r['substitutions'] + r['deletions'] + r['insertions'] for r in results)
+    total_seconds = sum(r['seconds'] for r in results)
+    timed = [r['timing_mae'] for r in results if r['timing_mae'] is not None]
+    return {
+        'backend': backend.name,
+        'files': results,
+        'wer': round(errors / max(1, reference_words), 4),
+        'timing_mae': round(sum(timed) / len(timed), 3) if timed else None,
+        'seconds': round(total_seconds, 2),
+        'realtime_factor': round(sum(r['audio_seconds'] for r in results) / total_seconds, 2) if total_seconds else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a transcription backend against stored transcripts")
+    parser.add_argument('references', help="Directory of <name>.json transcripts with <name>.<audio> files")
+    parser.add_argument('--backend', default='local', choices=sorted(BACKENDS))
+    parser.add_argument('--model', help="Local model size or path (default LOCAL_WHISPER_MODEL)")
+    parser.add_argument('--compute-type', help="CTranslate2 compute type, e.g. int8, int8_float32, float32")
+    parser.add_argument('--threads', type=int, help="CPU threads per model worker")
+    parser.add_argument('--workers', type=int, help="Files decoded concurrently")
+    parser.add_argument('--batch-size', type=int, help="Segments decoded per batch")
+    parser.add_argument('--output', help="Write the JSON report here")
+    args = parser.parse_args()
+
+    options = {'model': args.model, 'compute_type': args.compute_type, 'threads': args.threads,
+               'workers': args.workers, 'batch_size': args.batch_size}
+    options = {k: v for k, v in options.items() if v is not None} if args.backend == 'local' else {}
+    pairs = find_pairs(args.references)
+    if not pairs:
+        print(f"❌ No <name>.json + audio pairs in {args.references}")
+        sys.exit(1)
+    report = run_comparison(get_backend(args.backend, **options), pairs)
+    print(f"\n📊 {report['backend']}: WER {report['wer']:.1%}, timing error {report['timing_mae']}s, "
+          f"{report['realtime_factor']}x realtime over {len(pairs)} file(s)")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report: {args.output}")
+
+if __name__ == "__main__":
+    main()
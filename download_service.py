@@ -6,15 +6,17 @@ Downloads videos and stores them in Google Cloud Storage
 import os
 import tempfile
 import uuid
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 import yt_dlp
 from google.cloud import storage
+from pipeline_profiler import JobProfiler, profile_stage, render_metrics
 
 app = Flask(__name__)
 
 # Configuration
 BUCKET_NAME = os.getenv('BUCKET_NAME', 'soniq-karaoke-videos')
 TEMP_DIR = tempfile.gettempdir()
+SERVICE_NAME = 'youtube-downloader'
 
 def upload_to_gcs(local_path, gcs_filename):
     """Upload file to Google Cloud Storage"""
@@ -49,7 +51,7 @@ def download_youtube_video(url):
             'quiet': True,
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with profile_stage('download') as stage, yt_dlp.YoutubeDL(ydl_opts) as ydl:
             # Get video info
             info = ydl.extract_info(url, download=False)
             title = info.get('title', 'Unknown')
@@ -57,12 +59,15 @@ def download_youtube_video(url):
             
             # Download the video
             ydl.download([url])
+            stage.add_output(local_path)
         
         if not os.path.exists(local_path):
             return None, None, None, "Download failed - file not found"
         
         # Upload to GCS
-        gcs_url = upload_to_gcs(local_path, output_filename)
+        with profile_stage('upload') as stage:
+            gcs_url = upload_to_gcs(local_path, output_filename)
+            stage.add_output(local_path)
         
         if gcs_url:
             # Clean up local file
@@ -91,6 +96,11 @@ def health():
         'version': '1.0'
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus-style stage and process metrics"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/download', methods=['POST'])
 def download_video():
     """Download YouTube video endpoint"""
@@ -109,7 +119,10 @@ def download_video():
         print(f"📥 Downloading: {url}")
         
         # Download video
-        result, error = download_youtube_video(url)
+        with JobProfiler(str(uuid.uuid4())[:8], SERVICE_NAME) as profiler:
+            result, error = download_youtube_video(url)
+            if error:
+                profiler.fail(error)
         
         if error:
             print(f"❌ Download failed: {error}")
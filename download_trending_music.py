@@ -7,6 +7,7 @@ import os
 import yt_dlp
 from datetime import datetime
 import json
+from caption_ingest import download_options
 
 # Configuration
 OUTPUT_DIR = "/Users/rajvindersingh/Projects/karooke/trending_music"
@@ -102,7 +103,7 @@ def download_video(url, index):
         'windowsfilenames': True,    # Safe filenames
         'writedescription': False,
         'writeinfojson': True,       # Save metadata
-        'writesubtitles': False,
+        'writesubtitles': False,     # turned on per video for its own-language track (caption_ingest)
         'max_filesize': 100 * 1024 * 1024,  # Max 100MB per video
     }
     
@@ -128,8 +129,9 @@ def download_video(url, index):
                     print("⏭️ Skipping: Video too long (>10 minutes)")
                     return False
                 
-                # Download the video
+                # Download the video, with its caption track when there is one
                 print(f"📥 Downloading...")
+                ydl.params.update(download_options(info))
                 ydl.download([url])
                 
                 print(f"✅ Downloaded successfully!")
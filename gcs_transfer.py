@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+GCS Transfer Engine
+In-process uploads to Cloud Storage on a thread pool, replacing `gsutil cp` +
+`gsutil acl ch` forks:
+
+- one storage client for all transfers
+- objects that already exist with the same size and MD5/CRC32C are skipped (only their
+  ACL is set), so re-running over a partially uploaded folder sends only what is missing
+- files above COMPOSITE_THRESHOLD are uploaded as parallel parts and composed
+- the public-read ACL is set in the upload request itself (composed objects need
+  one ACL call after the compose)
+"""
+import os
+import time
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = int(os.getenv('GCS_TRANSFER_WORKERS', '8'))
+COMPOSITE_THRESHOLD = 150 * 1024 * 1024
+PART_SIZE = 64 * 1024 * 1024
+MAX_COMPOSE_SOURCES = 32           # GCS limit per compose request
+READ_BLOCK = 1024 * 1024
+
+def file_checksums(path):
+    """Base64 MD5 and CRC32C of a file, in the form GCS reports them (CRC32C None without google-crc32c)"""
+    md5 = hashlib.md5()
+    try:
+        import google_crc32c
+        crc = google_crc32c.Checksum()
+    except ImportError:
+        crc = None
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b''):
+            md5.update(block)
+            if crc is not None:
+                crc.update(block)
+    return (base64.b64encode(md5.digest()).decode('ascii'),
+            base64.b64encode(crc.digest()).decode('ascii') if crc is not None else None)
+
+def same_content(blob, size, md5, crc32c):
+    """True if an existing object matches the local file (composite objects only carry CRC32C)"""
+    if blob is None or blob.size != size:
+        return False
+    if blob.md5_hash and blob.md5_hash == md5:
+        return True
+    return bool(crc32c and blob.crc32c and blob.crc32c == crc32c)
+
+class TransferEngine:
+    """Parallel uploads into one bucket; upload() for a file, upload_many() for a folder"""
+
+    def __init__(self, bucket_name, client=None, max_workers=MAX_WORKERS, public=True,
+                 composite_threshold=COMPOSITE_THRESHOLD, part_size=PART_SIZE):
+        self.bucket_name = bucket_name
+        self.public = public
+        self.composite_threshold = composite_threshold
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self._client = client
+        self._client_lock = threading.Lock()
+        # Parts get their own pool so a file never waits on a slot held by itself
+        self._parts = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gcs-part')
+
+    @property
+    def bucket(self):
+        with self._client_lock:
+            if self._client is None:
+                from google.cloud import storage
+                self._client = storage.Client()
+        return self._client.bucket(self.bucket_name)
+
+    def public_url(self, object_name):
+        return f"https://storage.googleapis.com/{self.bucket_name}/{object_name}"
+
+    def upload(self, local_path, object_name, content_type=None):
+        """Upload one file unless an identical object exists; returns a result dict"""
+        started = time.perf_counter()
+        result = {'object': object_name, 'url': self.public_url(object_name), 'bytes': 0}
+        try:
+            size = os.path.getsize(local_path)
+            md5, crc32c = file_checksums(local_path)
+            bucket = self.bucket
+            existing = bucket.get_blob(object_name)
+            if same_content(existing, size, md5, crc32c):
+                if self.public:
+                    existing.make_public()  # gsutil made every object public, including ones already there
+                result['status'] = 'skipped'
+            else:
+                if size > self.composite_threshold:
+                    self._upload_composite(bucket, local_path, object_name, size, content_type)
+                else:
+                    blob = bucket.blob(object_name)
+                    blob.md5_hash = md5    # the service rejects the upload if the data arrives corrupted
+                    blob.upload_from_filename(local_path, content_type=content_type,
+                                              predefined_acl='publicRead' if self.public else None)
+                result['status'] = 'uploaded'
+                result['bytes'] = size
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        return result
+
+    def _upload_part(self, bucket, local_path, part_name, offset, length):
+        with open(local_path, 'rb') as f:
+            f.seek(offset)
+            bucket.blob(part_name).upload_from_file(f, size=length)
+        return bucket.blob(part_name)
+
+    def _upload_composite(self, bucket, local_path, object_name, size, content_type):
+        """Upload ranges of the file as temporary objects in parallel, then compose them"""
+        part_size = max(self.part_size, -(-size // MAX_COMPOSE_SOURCES))
+        ranges = [(offset, min(part_size, size - offset)) for offset in range(0, size, part_size)]
+        names = [f"{object_name}.part-{i:02d}" for i in range(len(ranges))]
+        futures = [self._parts.submit(self._upload_part, bucket, local_path, name, offset, length)
+                   for name, (offset, length) in zip(names, ranges)]
+        try:
+            parts = [future.result() for future in futures]
+            blob = bucket.blob(object_name)
+            if content_type:
+                blob.content_type = content_type
+            blob.compose(parts)
+            if self.public:
+                blob.make_public()
+        finally:
+            for future in futures:
+                future.exception()
+            for name in names:
+                try:
+                    bucket.blob(name).delete()
+                except Exception:
+                    pass
+
+    def upload_many(self, files):
+        """Upload [(local_path, object_name), ...] concurrently; results in input order"""
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='gcs-upload') as pool:
+            return list(pool.map(lambda item: self.upload(*item), files))
+
+    def close(self):
+        self._parts.shutdown(wait=True)
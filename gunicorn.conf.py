@@ -0,0 +1,87 @@
+"""
+Gunicorn configuration shared by the karaoke services
+Usage: gunicorn -c gunicorn.conf.py processing_service:app
+
+- preload_app imports the (lightweight) service module once in the master; with
+  PRELOAD_MODELS=1 its warm_up hook also loads the model and storage client there, so
+  they are shared copy-on-write by workers at the cost of slower container startup.
+  Otherwise each worker warms up in the background and /ready reports when it is done
+- worker and thread counts follow the container's CPU quota, not the host's cores
+- SIGTERM stops accepting new requests and lets in-flight jobs finish
+"""
+import os
+import sys
+import multiprocessing
+
+def cpu_quota():
+    """CPUs available to this container (cgroup v2/v1 quota, falling back to cpu_count)"""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+            if quota != 'max':
+                return max(1, int(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, quota // period)
+    except (OSError, ValueError):
+        pass
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return multiprocessing.cpu_count()
+
+CPUS = cpu_quota()
+
+# Separation is CPU-bound and TensorFlow spreads one job across several cores,
+# so each worker is budgeted CPUS_PER_WORKER cores (1 for the I/O-bound downloader)
+CPUS_PER_WORKER = int(os.getenv('GUNICORN_CPUS_PER_WORKER', '2'))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv('WEB_CONCURRENCY', max(1, CPUS // max(1, CPUS_PER_WORKER))))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+worker_class = 'gthread'
+
+preload_app = True
+
+# Long jobs: match Cloud Run's request timeout, and give in-flight jobs time to drain on SIGTERM
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '3600'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '300'))
+
+# Keep connections from the Cloud Run front end open longer than its idle timeout
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '75'))
+
+# Recycle workers occasionally to bound memory growth from native libraries
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '200'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '20'))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+def _service_module(server):
+    """The module that defines the WSGI app, e.g. processing_service"""
+    app = server.app.wsgi()
+    return sys.modules.get(getattr(app, 'import_name', ''))
+
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', '0') == '1'
+
+def when_ready(server):
+    """Runs in the master after the app is preloaded and before workers fork"""
+    module = _service_module(server)
+    if PRELOAD_MODELS and module is not None and hasattr(module, 'warm_up'):
+        server.log.info(f"Warming up {module.__name__} before fork")
+        module.warm_up()
+    server.log.info(f"Serving with {workers} workers x {threads} threads ({CPUS} CPUs in quota)")
+
+def post_fork(server, worker):
+    module = _service_module(server)
+    if module is not None and hasattr(module, 'after_fork'):
+        module.after_fork()
+
+def worker_exit(server, worker):
+    server.log.info(f"Worker {worker.pid} exited")
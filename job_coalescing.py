@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Job Coalescing
+Idempotency keys for processing requests: a retried or duplicate request attaches to
+the job already running for the same key, or gets the stored result when it finished.
+
+Within a process duplicates wait on the running job. Across instances a create-only
+claim object in GCS marks the job as running, and the job's
+requests/{job_id}_metadata.json object is the stored result.
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# How long a claim holds before another instance may take the job over (the request timeout)
+LEASE_SECONDS = 3600
+POLL_SECONDS = 10
+
+def job_key(video_url, vocal_levels=None, test_duration=None, supplied=None, stems=None, transcribe=False,
+            lyrics=None):
+    """Stable job id for a request: 16 hex chars from the client's key or the request fields
+
+    `stems` is left out when None, `transcribe` when False and `lyrics` (a digest of
+    the text) when None, so requests for the default stems without a transcript keep their ids.
+    """
+    if supplied:
+        source = f"key:{supplied}"
+    else:
+        fields = {
+            'video_url': video_url,
+            'vocal_levels': [round(float(level), 4) for level in (vocal_levels or [])],
+            'test_duration': float(test_duration) if test_duration else None,
+        }
+        if stems:
+            fields['stems'] = sorted(stems)
+        if transcribe:
+            fields['transcribe'] = True
+        if lyrics:
+            fields['lyrics'] = hashlib.sha1(lyrics.encode('utf-8')).hexdigest()
+        source = json.dumps(fields, sort_keys=True)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+
+class GcsJobStore:
+    """Claims and stored results as objects under `prefix` in a GCS bucket"""
+
+    def __init__(self, bucket_fn, prefix='karaoke/requests/'):
+        self.bucket_fn = bucket_fn
+        self.prefix = prefix
+
+    def _blob(self, name):
+        return self.bucket_fn().blob(f"{self.prefix}{name}")
+
+    def load(self, job_id):
+        """The job's stored metadata, or None if it has not completed"""
+        from google.cloud.exceptions import NotFound
+        try:
+            return json.loads(self._blob(f"{job_id}_metadata.json").download_as_text())
+        except NotFound:
+            return None
+
+    def claim(self, job_id, lease=LEASE_SECONDS):
+        """Create the claim object; False if another live claim exists"""
+        from google.api_core.exceptions import PreconditionFailed
+        blob = self._blob(f"{job_id}_claim.json")
+        body = json.dumps({'job_id': job_id, 'claimed_at': time.time()})
+        try:
+            blob.upload_from_string(body, content_type='application/json', if_generation_match=0)
+            return True
+        except PreconditionFailed:
+            pass
+        # Take over a claim whose holder died without releasing it
+        blob.reload()
+        if time.time() - blob.updated.timestamp() < lease:
+            return False
+        try:
+            blob.upload_from_string(body, content_type='application/json', if_generation_match=blob.generation)
+            return True
+        except PreconditionFailed:
+            return False
+
+    def claimed(self, job_id):
+        return self._blob(f"{job_id}_claim.json").exists()
+
+    def release(self, job_id):
+        from google.cloud.exceptions import NotFound
+        try:
+            self._blob(f"{job_id}_claim.json").delete()
+        except NotFound:
+            pass
+
+class JobCoalescer:
+    """Runs each job key at most once at a time and replays completed results
+
+    run() returns (payload, status, deduplicated). `respond(job_id, metadata)` turns a
+    stored metadata object back into the response payload. Failed jobs are not
+    remembered, so a retry after a failure runs the job again.
+    """
+
+    def __init__(self, store=None, respond=None, max_completed=256, poll_seconds=POLL_SECONDS,
+                 lease=LEASE_SECONDS):
+        self.store = store
+        self.respond = respond
+        self.max_completed = max_completed
+        self.poll_seconds = poll_seconds
+        self.lease = lease
+        self.completed = OrderedDict()
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def remember(self, job_id, payload):
+        with self._lock:
+            self.completed[job_id] = payload
+            self.completed.move_to_end(job_id)
+            while len(self.completed) > self.max_completed:
+                self.completed.popitem(last=False)
+
+    def lookup(self, job_id):
+        """Result of a finished job (remembered here or stored by any instance), or None"""
+        with self._lock:
+            if job_id in self.completed:
+                return self.completed[job_id]
+        stored = self._stored(job_id)
+        if stored is not None:
+            self.remember(job_id, stored)
+        return stored
+
+    def _stored(self, job_id):
+        if self.store is None:
+            return None
+        try:
+            metadata = self.store.load(job_id)
+        except Exception as e:
+            print(f"⚠️ Stored result lookup failed for {job_id}: {e}")
+            return None
+        return self.respond(job_id, metadata) if metadata else None
+
+    def run(self, job_id, func):
+        with self._lock:
+            if job_id in self.completed:
+                self.completed.move_to_end(job_id)
+                return self.completed[job_id], 200, True
+            running = self._running.get(job_id)
+            if running is None:
+                running = self._running[job_id] = {'done': threading.Event(), 'outcome': None}
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            print(f"🔗 Attaching to running job {job_id}")
+            running['done'].wait()
+            if running['outcome'] is None:
+                # Its batch gave the job up without a result: run it here
+                return self.run(job_id, func)
+            payload, status = running['outcome']
+            return payload, status, True
+
+        outcome = ({'error': 'Processing failed'}, 500)
+        deduplicated = False
+        try:
+            outcome, deduplicated = self._lead(job_id, func)
+            return outcome + (deduplicated,)
+        finally:
+            running['outcome'] = outcome
+            with self._lock:
+                self._running.pop(job_id, None)
+            running['done'].set()
+
+    def begin(self, job_id):
+        """Lead a job that runs outside run(), e.g. a /batch item
+
+        Returns ('stored', payload) for a finished job, ('busy', None) when it is running
+        in this process or claimed by another instance, and ('lead', None) when the
+        caller runs it; the caller must then call end(). run() calls for the job attach
+        to it meanwhile.
+        """
+        stored = self.lookup(job_id)
+        if stored is not None:
+            return 'stored', stored
+        with self._lock:
+            if job_id in self._running:
+                return 'busy', None
+            running = self._running[job_id] = {'done': threading.Event(), 'outcome': None, 'claimed': False}
+        if self.store is not None:
+            try:
+                running['claimed'] = self.store.claim(job_id, self.lease)
+            except Exception as e:
+                print(f"⚠️ Could not claim job {job_id}, running it unclaimed: {e}")
+                running['claimed'] = None
+            if running['claimed'] is False:
+                self.end(job_id)
+                return 'busy', None
+        return 'lead', None
+
+    def end(self, job_id, payload=None):
+        """Finish a begin() lead with its successful payload, or None when it failed"""
+        if payload is not None:
+            self.remember(job_id, payload)
+        with self._lock:
+            running = self._running.pop(job_id, None)
+        if running is None:
+            return
+        if running['claimed']:
+            try:
+                self.store.release(job_id)
+            except Exception as e:
+                print(f"⚠️ Could not release the claim on job {job_id}: {e}")
+        running['outcome'] = (payload, 200) if payload is not None else None
+        running['done'].set()
+
+    def _lead(self, job_id, func):
+        """Run the job here, or wait for the instance that holds its claim"""
+        claimed = False
+        while True:
+            stored = self._stored(job_id)
+            if stored is not None:
+                print(f"♻️ Returning stored result for job {job_id}")
+                self.remember(job_id, stored)
+                return (stored, 200), True
+
+            if self.store is None:
+                break
+            try:
+                claimed = self.store.claim(job_id, self.lease)
+                if claimed:
+                    break
+            except Exception as e:
+                # Without the store we can only dedupe within this process
+                print(f"⚠️ Could not claim job {job_id}, running it unclaimed: {e}")
+                break
+
+            # Another instance is running it: wait for its result or for the claim to go away
+            print(f"⏳ Job {job_id} is running on another instance, waiting...")
+            deadline = time.time() + self.lease
+            while time.time() < deadline and self.store.claimed(job_id):
+                time.sleep(self.poll_seconds)
+                if self._stored(job_id) is not None:
+                    break
+
+        try:
+            payload, status = func()
+        finally:
+            if claimed:
+                self.store.release(job_id)
+        if status == 200:
+            self.remember(job_id, payload)
+        return (payload, status), False
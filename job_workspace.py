@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Job Workspace
+A private temp directory per job with selectable backing (disk, /dev/shm or a
+size-limited tmpfs mount), byte accounting against per-job and per-instance caps,
+and cleanup on exit whether the job succeeded or not
+"""
+import os
+import time
+import shutil
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
+from pipeline_profiler import METRICS
+from pipeline_engine import PipelineHook
+
+PREFIX = 'karaoke-job-'
+
+# Defaults, overridable per workspace
+BACKING = os.getenv('WORKSPACE_BACKING', 'disk')            # disk | shm | tmpfs
+TMPFS_ROOT = os.getenv('WORKSPACE_TMPFS_ROOT', '')          # mount point of a size-limited tmpfs volume
+JOB_MAX_BYTES = int(float(os.getenv('WORKSPACE_JOB_MAX_MB', '0')) * 1024 * 1024) or None
+INSTANCE_MAX_BYTES = int(float(os.getenv('WORKSPACE_INSTANCE_MAX_MB', '0')) * 1024 * 1024) or None
+
+_active = set()
+_active_lock = threading.Lock()
+
+class WorkspaceFull(Exception):
+    """Writing more would exceed the job's or the instance's temp storage cap"""
+
+def backing_root(backing):
+    """Directory that holds workspaces for a backing, falling back to disk when unavailable"""
+    if backing == 'shm' and os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm', 'shm'
+    if backing == 'tmpfs' and TMPFS_ROOT and os.path.isdir(TMPFS_ROOT) and os.access(TMPFS_ROOT, os.W_OK):
+        return TMPFS_ROOT, 'tmpfs'
+    return tempfile.gettempdir(), 'disk'
+
+def directory_bytes(path):
+    """Total size of the regular files under path"""
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    total += directory_bytes(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+def instance_bytes():
+    """Bytes currently held by all open workspaces in this process"""
+    with _active_lock:
+        workspaces = list(_active)
+    return sum(w.bytes_used for w in workspaces)
+
+class JobWorkspace:
+    """Context-managed job directory; every temp file of a job goes through path()
+
+        with JobWorkspace(job_id, backing='shm', max_bytes=2 * 1024**3) as workspace:
+            audio_path = workspace.path('audio.wav')
+    """
+
+    def __init__(self, job_id, backing=None, root=None, max_bytes=None, instance_max_bytes=None, keep=False):
+        self.job_id = str(job_id)
+        if root:
+            self.root, self.backing = root, 'custom'
+        else:
+            self.root, self.backing = backing_root(backing or BACKING)
+        self.max_bytes = max_bytes if max_bytes is not None else JOB_MAX_BYTES
+        self.instance_max_bytes = instance_max_bytes if instance_max_bytes is not None else INSTANCE_MAX_BYTES
+        self.keep = keep
+        self.dir = None
+        self.bytes_used = 0
+        self.peak_bytes = 0
+        self.created_at = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def open(self):
+        os.makedirs(self.root, exist_ok=True)
+        self.dir = tempfile.mkdtemp(prefix=f"{PREFIX}{self.job_id}-", dir=self.root)
+        self.created_at = time.time()
+        with _active_lock:
+            _active.add(self)
+        METRICS.add_gauge('karaoke_workspaces_active', {'backing': self.backing}, 1)
+        return self
+
+    def path(self, *parts):
+        """Path inside the workspace; parent directories are created"""
+        path = os.path.join(self.dir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def subdir(self, *parts):
+        path = os.path.join(self.dir, *parts)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def measure(self):
+        """Re-count the bytes on disk and update the peak and the instance gauge"""
+        used = directory_bytes(self.dir) if self.dir else 0
+        with self._lock:
+            delta = used - self.bytes_used
+            self.bytes_used = used
+            self.peak_bytes = max(self.peak_bytes, used)
+        if delta:
+            METRICS.add_gauge('karaoke_workspace_bytes', {'backing': self.backing}, delta)
+        return used
+
+    def check(self, extra_bytes=0):
+        """Raise WorkspaceFull if `extra_bytes` more would exceed the job or instance cap"""
+        used = self.measure()
+        if self.max_bytes and used + extra_bytes > self.max_bytes:
+            raise WorkspaceFull(f"job workspace at {used / 1024**2:.0f}MB, cap {self.max_bytes / 1024**2:.0f}MB")
+        if self.instance_max_bytes:
+            total = instance_bytes()
+            if total + extra_bytes > self.instance_max_bytes:
+                raise WorkspaceFull(f"instance temp storage at {total / 1024**2:.0f}MB, "
+                                    f"cap {self.instance_max_bytes / 1024**2:.0f}MB")
+        return used
+
+    def remove(self, path):
+        """Delete a file or directory early to free space mid-job"""
+        if path and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif path and os.path.exists(path):
+            os.remove(path)
+        self.measure()
+
+    def summary(self):
+        return {
+            'backing': self.backing,
+            'root': self.root,
+            'peak_mb': round(self.peak_bytes / (1024 * 1024), 1),
+            'max_mb': round(self.max_bytes / (1024 * 1024), 1) if self.max_bytes else None,
+        }
+
+    def close(self):
+        """Remove the directory (unless keep=True) and release its accounted bytes"""
+        if self.dir is None:
+            return
+        self.measure()
+        if not self.keep:
+            shutil.rmtree(self.dir, ignore_errors=True)
+        METRICS.add_gauge('karaoke_workspace_bytes', {'backing': self.backing}, -self.bytes_used)
+        METRICS.add_gauge('karaoke_workspaces_active', {'backing': self.backing}, -1)
+        METRICS.inc('karaoke_workspace_peak_bytes_total', {'backing': self.backing}, self.peak_bytes)
+        with _active_lock:
+            _active.discard(self)
+        self.bytes_used = 0
+        if not self.keep:
+            self.dir = None
+
+class WorkspaceHook(PipelineHook):
+    """Checks the caps before each stage and re-counts the workspace after it
+
+    A stage that would start over the cap fails with WorkspaceFull, which skips its
+    dependents like any other stage failure.
+    """
+
+    def __init__(self, workspace):
+        self.workspace = workspace
+
+    @contextmanager
+    def stage_context(self, stage, inputs):
+        self.workspace.check()
+        try:
+            yield
+        finally:
+            self.workspace.measure()
+
+@contextmanager
+def workspace_or_dir(work_dir, job_id):
+    """Use an existing directory as-is, or open a throwaway workspace when none is given"""
+    if work_dir:
+        yield work_dir
+        return
+    with JobWorkspace(job_id) as workspace:
+        yield workspace.dir
+
+def sweep_stale(max_age_seconds=6 * 3600, backings=('disk', 'shm', 'tmpfs')):
+    """Remove workspaces left behind by crashed processes; returns the number removed"""
+    removed = 0
+    now = time.time()
+    with _active_lock:
+        open_dirs = {w.dir for w in _active}
+    for root in {backing_root(b)[0] for b in backings}:
+        try:
+            entries = list(os.scandir(root))
+        except OSError:
+            continue
+        for entry in entries:
+            if (entry.name.startswith(PREFIX) and entry.is_dir(follow_symlinks=False)
+                    and entry.path not in open_dirs
+                    and now - entry.stat(follow_symlinks=False).st_mtime > max_age_seconds):
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+    return removed
+
+@atexit.register
+def _close_open_workspaces():
+    with _active_lock:
+        workspaces = list(_active)
+    for workspace in workspaces:
+        workspace.close()
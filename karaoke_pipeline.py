@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Karaoke Pipeline
+Declares the karaoke job as a stage graph on pipeline_engine:
+
+    download -> decode -> separate -> transcribe -> refine -> subtitle --\\
+                                   \\-> loudness -> mix_<level> (per level) -----------> render_<level> -> upload_<level>
+
+Transcription (network-bound) runs alongside the loudness analysis and the per-level
+mixes, and each level renders as soon as its mix and the subtitles are ready. The
+stems are analyzed once and every mix is scaled to the target loudness from that
+analysis. When the lyrics are known (config 'lyrics', or a "Lyrics:" block in the video
+description) the transcribe stage aligns them to the vocals instead of calling Whisper;
+so does a usable YouTube caption track fetched with the video (caption_ingest).
+The refine stage snaps the word boundaries to the vocal stem's onsets before subtitling.
+
+With output='client' the job stops there: the stems are encoded as plain FLAC, Opus or
+M4A files (client_codec; stem_codec adds stem_pack files) and the word timings written
+as JSON, LRC and WebVTT (timed_lyrics) for players that mix and highlight on the device,
+so there is no mix or render, and no libx264 encode.
+The CLI scripts and app.py only differ in the config they pass to run_karaoke()
+"""
+import os
+import tempfile
+import karaoke_stages as stages
+from pipeline_engine import Pipeline, Stage, ProfilerHook, MemoCacheHook
+from job_workspace import JobWorkspace, WorkspaceHook
+from transcription_backends import get_backend
+from timed_lyrics import write_timed_lyrics
+
+DEFAULT_CONFIG = {
+    'ffmpeg': 'ffmpeg',
+    'docker': 'docker',
+    'openai_api_key': os.getenv('OPENAI_API_KEY', ''),
+    'name': 'karaoke',
+    'separation': 'docker',             # 'docker' (Spleeter image) or 'pan' (ffmpeg filters)
+    'spleeter_model': 'spleeter:2stems-16kHz',
+    'start': None,                      # clip start/length in seconds, None for the whole video
+    'duration': None,
+    'max_transcribe_seconds': None,     # chunk and stop transcribing after this many seconds
+    'transcription_backend': None,      # 'openai' or 'local' (transcription_backends); None: TRANSCRIPTION_BACKEND
+    'lyrics': None,                     # known lyric text to align instead of transcribing (whole songs only)
+    'refine_timing': True,              # snap word times to the vocal stem (timing_refinement)
+    'subtitles': 'cloud',               # key of karaoke_stages.SUBTITLE_PRESETS
+    'translation_backend': None,        # second-language tracks (translation_memo); None: TRANSLATION_BACKEND
+    'translate_to': None,               # target language; None: TRANSLATION_TARGET
+    'output': 'video',                  # 'video' (a render per vocal level) or 'client' (stems + timed lyrics)
+    'client_codec': 'flac',             # client output stems: a CLIENT_AUDIO_FORMATS codec ('flac', 'opus', 'm4a')
+    'stem_codec': None,                 # also pack the client stems as stem_pack files with this codec
+    'vocal_levels': [0.0, 0.25],
+    'normalize': True,                  # scale every mix to target_lufs (False: amix-style 1/2 gain)
+    'target_lufs': -14.0,
+    'background': 'video',              # 'video' (original footage) or 'black' (lyric video)
+    'max_video_seconds': 300,           # cap for black-background lyric videos
+    'force_style': 'FontSize=32',
+    'crf': 18,
+    'output_dir': None,                 # None: work directory when uploading, else temp_dir
+    'output_template': '{name}_karaoke_{level}_vocal.mp4',
+    'upload': None,                     # callable(local_path, filename) -> url
+    'temp_dir': tempfile.gettempdir(),
+    'workspace': None,                  # 'disk', 'shm' or 'tmpfs'; None uses WORKSPACE_BACKING
+    'workspace_max_bytes': None,        # None uses WORKSPACE_JOB_MAX_MB
+    'keep_work_dir': False,
+    'max_workers': None,
+}
+
+# Stems published by output='client'; the player mixes them at any vocal level
+CLIENT_STEMS = ('vocals', 'accompaniment')
+
+# Message reported when a job stops at a stage
+STAGE_ERRORS = {
+    'download': 'Video download failed',
+    'decode': 'Audio separation failed',
+    'separate': 'Audio separation failed',
+    'transcribe': 'Transcription failed',
+    'subtitle': 'Subtitle creation failed',
+    'timed_lyrics': 'Subtitle creation failed',
+    'encode_vocals': 'Stem encoding failed',
+    'encode_accompaniment': 'Stem encoding failed',
+    'pack_vocals': 'Stem encoding failed',
+    'pack_accompaniment': 'Stem encoding failed',
+}
+
+# Shared across jobs in this process: the same vocals (e.g. a rerun with other vocal levels) skip Whisper
+CACHE = MemoCacheHook()
+
+def make_config(**overrides):
+    unknown = set(overrides) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown pipeline config keys: {', '.join(sorted(unknown))}")
+    config = dict(DEFAULT_CONFIG)
+    config.update(overrides)
+    return config
+
+def level_percent(vocal_level):
+    return int(round(vocal_level * 100))
+
+def level_stages(config, work_dir, output_dir, vocal_level):
+    """mix -> render (-> upload) branch for one vocal level"""
+    ffmpeg = config['ffmpeg']
+    pct = level_percent(vocal_level)
+    mix, video, url = f'mix_{pct}', f'video_{pct}', f'url_{pct}'
+    output_name = config['output_template'].format(name=config['name'], level=pct)
+    output_path = os.path.join(output_dir, output_name)
+
+    def mix_stage(vocals_path, accompaniment_path, loudness=None):
+        return stages.mix_vocal_level(ffmpeg, vocals_path, accompaniment_path, vocal_level,
+                                      os.path.join(work_dir, f'mixed_{pct}.wav'), loudness)
+
+    def render_stage(**inputs):
+        if config['background'] == 'black':
+            duration = min(config['max_video_seconds'], inputs['transcript'].words[-1].end)
+            return stages.render_lyric_video(ffmpeg, inputs[mix], inputs['subtitle_path'], output_path,
+                                             duration, config['force_style'])
+        return stages.render_karaoke_video(ffmpeg, inputs['video_path'], inputs[mix], inputs['subtitle_path'],
+                                           output_path, config['start'], config['duration'], config['crf'])
+
+    def upload_stage(**inputs):
+        return config['upload'](inputs[video], output_name)
+
+    source = 'transcript' if config['background'] == 'black' else 'video_path'
+    branch = [
+        Stage(f'mix_{pct}', mix_stage,
+              inputs=['vocals_path', 'accompaniment_path'] + (['loudness'] if config['normalize'] else []),
+              outputs=[mix], profile_as='mix'),
+        Stage(f'render_{pct}', render_stage, inputs=[source, 'subtitle_path', mix],
+              outputs=[video], profile_as='render'),
+    ]
+    if config['upload']:
+        branch.append(Stage(f'upload_{pct}', upload_stage, inputs=[video], outputs=[url], profile_as='upload'))
+    return branch
+
+def client_stages(config, output_dir, from_url=False):
+    """encode (+ pack) per stem + timed lyrics (-> upload) for output='client': no mixes, no renders"""
+    extension = stages.CLIENT_AUDIO_FORMATS[config['client_codec']][0]
+    outputs = [f'{stem}_file' for stem in CLIENT_STEMS]
+
+    def encode_stage(stem):
+        output_path = os.path.join(output_dir, f"{config['name']}_{stem}.{extension}")
+        return Stage(f'encode_{stem}',
+                     lambda **inputs: {f'{stem}_file': stages.encode_client_stem(
+                         config['ffmpeg'], inputs[f'{stem}_path'], output_path, config['client_codec'])},
+                     inputs=[f'{stem}_path'], outputs=[f'{stem}_file'], profile_as='encode')
+
+    def pack_stage(stem):
+        import stem_pack
+        output_path = os.path.join(output_dir, f"{config['name']}_{stem}.{stem_pack.EXTENSIONS[config['stem_codec']]}")
+        return Stage(f'pack_{stem}',
+                     lambda **inputs: {f'{stem}_pack': stem_pack.pack_wav(inputs[f'{stem}_path'], output_path,
+                                                                          config['stem_codec'], ffmpeg=config['ffmpeg'])},
+                     inputs=[f'{stem}_path'], outputs=[f'{stem}_pack'], profile_as='encode')
+
+    def lyrics_stage(transcript, title=None):
+        return {'lyrics_files': write_timed_lyrics(transcript, output_dir, f"{config['name']}_lyrics",
+                                                   title or config['name'])}
+
+    def upload_stage(lyrics_files, **inputs):
+        urls = {'stems': {}, 'packs': {}, 'lyrics': {}}
+        for stem in CLIENT_STEMS:
+            path = inputs[f'{stem}_file']
+            urls['stems'][stem] = config['upload'](path, os.path.basename(path))
+            if f'{stem}_pack' in inputs:
+                path = inputs[f'{stem}_pack']['path']
+                urls['packs'][stem] = config['upload'](path, os.path.basename(path))
+        for fmt, path in lyrics_files.items():
+            urls['lyrics'][fmt] = config['upload'](path, os.path.basename(path))
+        return {'client_urls': urls}
+
+    branch = [encode_stage(stem) for stem in CLIENT_STEMS]
+    if config['stem_codec']:
+        branch += [pack_stage(stem) for stem in CLIENT_STEMS]
+        outputs += [f'{stem}_pack' for stem in CLIENT_STEMS]
+    branch.append(Stage('timed_lyrics', lyrics_stage, inputs=['transcript'] + (['title'] if from_url else []),
+                        outputs=['lyrics_files'], profile_as='subtitle'))
+    if config['upload']:
+        branch.append(Stage('upload_client', upload_stage, inputs=['lyrics_files'] + outputs,
+                            outputs=['client_urls'], profile_as='upload'))
+    return branch
+
+def build_karaoke_pipeline(config, work_dir, from_url=False):
+    """Stage graph for one job; intermediates go to work_dir, videos to config['output_dir']"""
+    ffmpeg = config['ffmpeg']
+    # Uploaded videos can be discarded with the work directory, local ones must outlive it
+    output_dir = config['output_dir'] or (work_dir if config['upload'] else config['temp_dir'])
+    graph = []
+
+    if from_url:
+        graph.append(Stage(
+            'download',
+            lambda youtube_url: stages.download_youtube(youtube_url, os.path.join(work_dir, 'video.mp4')),
+            inputs=['youtube_url'], outputs=['video_path', 'title', 'description', 'captions_path']))
+
+    if config['separation'] == 'pan':
+        graph.append(Stage(
+            'separate',
+            lambda video_path: stages.pan_separation(ffmpeg, video_path, work_dir, config['start'], config['duration']),
+            inputs=['video_path'], outputs=['vocals_path', 'accompaniment_path']))
+    else:
+        graph.append(Stage(
+            'decode',
+            lambda video_path: stages.extract_audio(ffmpeg, video_path, os.path.join(work_dir, 'audio.wav'),
+                                                    config['start'], config['duration']),
+            inputs=['video_path'], outputs=['audio_path']))
+        graph.append(Stage(
+            'separate',
+            lambda audio_path: stages.docker_spleeter_separation(config['docker'], audio_path, work_dir,
+                                                                 config['spleeter_model']),
+            inputs=['audio_path'], outputs=['vocals_path', 'accompaniment_path']))
+
+    backend = get_backend(config['transcription_backend'], api_key=config['openai_api_key'])
+    # Lyrics describe the whole song, so clips are always transcribed
+    clipped = config['start'] is not None or bool(config['duration'])
+    graph.append(Stage(
+        'transcribe',
+        lambda vocals_path, lyrics, description, captions_path: stages.lyrics_or_transcription(
+            ffmpeg, vocals_path, None if clipped else lyrics, config['openai_api_key'],
+            config['max_transcribe_seconds'], backend=backend, description=None if clipped else description,
+            captions_path=None if clipped else captions_path),
+        inputs=['vocals_path', 'lyrics', 'description', 'captions_path'], outputs=['raw_transcript'],
+        cache=(backend.settings(), config['openai_api_key'], config['max_transcribe_seconds'], clipped)))
+    graph.append(Stage(
+        'refine',
+        lambda raw_transcript, vocals_path: {'transcript': stages.refine_word_timing(raw_transcript, vocals_path)
+                                             if config['refine_timing'] else raw_transcript},
+        inputs=['raw_transcript', 'vocals_path'], outputs=['transcript'], profile_as='analyze'))
+
+    if config['normalize']:
+        graph.append(Stage(
+            'loudness',
+            lambda vocals_path, accompaniment_path: {'loudness': stages.analyze_loudness(
+                vocals_path, accompaniment_path, config['vocal_levels'], config['target_lufs'])},
+            inputs=['vocals_path', 'accompaniment_path'], outputs=['loudness'], profile_as='analyze'))
+
+    if config['output'] == 'client':
+        graph.extend(client_stages(config, output_dir, from_url))
+        return Pipeline(graph, max_workers=config['max_workers'])
+
+    graph.append(Stage(
+        'subtitle',
+        lambda transcript: stages.write_subtitles(
+            transcript, os.path.join(work_dir, 'subtitles.ass'), config['subtitles'],
+            translate=stages.subtitle_translator(config['translation_backend'], config['translate_to'])),
+        inputs=['transcript'], outputs=['subtitle_path']))
+    for vocal_level in config['vocal_levels']:
+        graph.extend(level_stages(config, work_dir, output_dir, vocal_level))
+
+    return Pipeline(graph, max_workers=config['max_workers'])
+
+def client_outputs(config, result):
+    """{'stems': {stem: {codec, bytes, path or url[, pack]}}, 'lyrics': {format: path or url}} of an output='client' run
+
+    A stem's optional 'pack' is its stem_pack file ({codec, bytes, path or url}).
+    """
+    urls = result.get('client_urls') or {'stems': {}, 'packs': {}, 'lyrics': {}}
+    stems = {}
+    for stem in CLIENT_STEMS:
+        path = result.get(f'{stem}_file')
+        if not path:
+            continue
+        where = {'url': urls['stems'].get(stem)} if config['upload'] else {'path': path}
+        stems[stem] = dict(codec=config['client_codec'], bytes=os.path.getsize(path), **where)
+        pack = result.get(f'{stem}_pack')
+        if pack:
+            where = {'url': urls['packs'].get(stem)} if config['upload'] else {'path': pack['path']}
+            stems[stem]['pack'] = dict(codec=pack['codec'], bytes=pack['bytes'], **where)
+    lyrics = result.get('lyrics_files') or {}
+    return {'stems': stems, 'lyrics': urls['lyrics'] if config['upload'] else lyrics}
+
+def failure_message(result):
+    """User-facing error for the first failed stage of a pipeline result"""
+    if any(r.get('error_type') == 'WorkspaceFull' for r in result.failed):
+        return 'Temporary storage full'
+    for record in result.failed:
+        if record['stage'] in STAGE_ERRORS:
+            return STAGE_ERRORS[record['stage']]
+    return result.error()
+
+def run_karaoke(config, video_path=None, youtube_url=None, profiler=None, hooks=None):
+    """Run the karaoke pipeline for a local video or a YouTube URL
+
+    Returns a dict with the title, the loudness analysis, one entry per vocal level
+    that rendered (or, for output='client', the packed stems and timed lyric files),
+    the pipeline result and an error message when a shared stage failed.
+    """
+    workspace = JobWorkspace(config['name'], backing=config['workspace'],
+                             max_bytes=config['workspace_max_bytes'], keep=config['keep_work_dir'])
+    if hooks is None:
+        hooks = [CACHE]
+    hooks = [WorkspaceHook(workspace)] + list(hooks)
+    if profiler is not None:
+        hooks = [ProfilerHook(profiler)] + hooks
+
+    artifacts = {'lyrics': config['lyrics'] or ''}
+    if youtube_url:
+        artifacts['youtube_url'] = youtube_url
+    else:
+        artifacts.update(video_path=video_path, description=stages.video_description(video_path),
+                         captions_path=stages.find_caption_file(video_path))
+    with workspace:
+        pipeline = build_karaoke_pipeline(config, workspace.dir, from_url=bool(youtube_url))
+        result = pipeline.run(artifacts, hooks=hooks)
+
+        videos = []
+        for vocal_level in config['vocal_levels']:
+            pct = level_percent(vocal_level)
+            path = result.get(f'video_{pct}')
+            if not path:
+                continue
+            entry = {
+                'vocal_level': pct,
+                'filename': config['output_template'].format(name=config['name'], level=pct),
+            }
+            if config['upload']:
+                if not result.get(f'url_{pct}'):
+                    continue
+                entry['url'] = result.get(f'url_{pct}')
+            else:
+                entry['path'] = path
+            videos.append(entry)
+
+        client = client_outputs(config, result) if config['output'] == 'client' else None
+        shared_failure = any(r['stage'] in STAGE_ERRORS for r in result.failed)
+    if profiler is not None:
+        profiler.annotate(workspace=workspace.summary())
+    return {
+        'title': result.get('title'),
+        'transcript': result.get('transcript'),
+        'loudness': result.get('loudness') or {},
+        'videos': videos,
+        'client': client,
+        'error': failure_message(result) if shared_failure else None,
+        'result': result,
+    }
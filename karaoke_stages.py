@@ -0,0 +1,761 @@
+#!/usr/bin/env python3
+"""
+Karaoke Stage Functions
+The download, separation, transcription, subtitle, mixing and rendering steps shared
+by the services and CLI scripts. Every function takes its paths and tools explicitly
+so it can run as a pipeline stage on any thread
+"""
+import os
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from caption_ingest import find_caption_file
+from transliteration import transliterate_words
+from pipeline_profiler import run_subprocess
+from word_timing import (to_transcript, merge_transcripts, group_lines_by_span,
+                         group_lines_by_count, format_ass_time)
+
+SPLEETER_IMAGE = 'researchdeezer/spleeter'
+WHISPER_MAX_BYTES = 20 * 1024 * 1024  # stay under the 25MB Whisper upload limit
+CHUNK_SECONDS = 300
+# Transcription input: 16kHz mono in one of these (extension, ffmpeg codec args)
+WHISPER_FORMATS = {
+    'opus': ('ogg', ['-c:a', 'libopus', '-application', 'voip']),
+    'mp3': ('mp3', ['-c:a', 'libmp3lame']),
+    'flac': ('flac', ['-c:a', 'flac']),
+    'wav': ('wav', ['-c:a', 'pcm_s16le']),
+}
+WHISPER_CODEC = os.getenv('WHISPER_CODEC', 'opus')
+# Client-side karaoke stems: (extension, ffmpeg codec args) of formats browsers and phones play natively
+CLIENT_AUDIO_FORMATS = {
+    'flac': ('flac', ['-c:a', 'flac']),
+    'opus': ('opus', ['-c:a', 'libopus', '-b:a', '160k']),
+    'm4a': ('m4a', ['-c:a', 'aac', '-b:a', '256k', '-movflags', '+faststart']),
+}
+WHISPER_KBPS = (16, 48)               # lossy bitrate range; speech recognition gains nothing above the top
+LOSSLESS_BYTES_PER_SECOND = {'flac': 24000, 'wav': 32000}   # 16kHz mono 16-bit, FLAC estimated pessimistically
+SPECULATIVE_SECONDS = 60             # vocal audio per speculative transcription request
+SILENCE_SEARCH_SECONDS = 8           # cut windows at the quietest point of their last seconds
+SILENCE_HOP_SECONDS = 0.05
+
+ASS_STYLE_FORMAT = ("Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+                    "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+                    "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding")
+
+# Subtitle looks used across the scripts and services. 'highlight' presets show each
+# line once per word with the current word recoloured on every track; 'k' presets
+# use ASS \k karaoke timing on a single line. A track's 'translate' shows the words
+# ('words', highlighted with the original) or the whole line ('line') in a second
+# language, from write_subtitles' `translate` (transliteration by default).
+SUBTITLE_PRESETS = {
+    'cloud': {
+        'title': 'Cloud Karaoke',
+        'mode': 'highlight',
+        'line_span': 3.0,
+        'styles': ["Default,Arial,28,&Hffffff,&Hffffff,&H000000,&H80000000,1,0,0,0,100,100,0,0,1,3,1,2,10,10,50,1"],
+        'tracks': [
+            {'style': 'Default', 'translate': None, 'on': '{\\c&H00ccff&}', 'off': '{\\c&Hffffff&}'},
+        ],
+    },
+    'equal_size': {
+        'title': 'Equal-Size Bilingual Karaoke',
+        'mode': 'highlight',
+        'line_span': 3.0,
+        'styles': [
+            "Gurmukhi,Arial Unicode MS,32,&Hffffff,&Hffffff,&H000000,&H80000000,1,0,0,0,100,100,0,0,1,3,1,2,10,10,80,1",
+            "English,Arial,32,&Hffffff,&Hffffff,&H000000,&H80000000,1,0,0,0,100,100,0,0,1,3,1,2,10,10,30,1",
+        ],
+        'tracks': [
+            {'style': 'Gurmukhi', 'translate': None, 'on': '{\\c&H00ccff&\\3c&H0066cc&}', 'off': '{\\c&Hffffff&\\3c&H000000&}'},
+            {'style': 'English', 'translate': 'words', 'on': '{\\c&H00ccff&\\3c&H0066cc&}', 'off': '{\\c&Hffffff&\\3c&H000000&}'},
+        ],
+    },
+    'original_size': {
+        'title': 'Original-Size Bilingual Karaoke',
+        'mode': 'highlight',
+        'line_span': 3.0,
+        'styles': [
+            "Gurmukhi,Arial Unicode MS,28,&Hffffff,&Hffffff,&H000000,&H80000000,1,0,0,0,100,100,0,0,1,3,1,2,10,10,70,1",
+            "English,Arial,22,&Hdddddd,&Hdddddd,&H000000,&H80000000,0,0,0,0,100,100,0,0,1,2,1,2,10,10,25,1",
+        ],
+        'tracks': [
+            {'style': 'Gurmukhi', 'translate': None, 'on': '{\\c&Hff8800&\\3c&H804400&}', 'off': '{\\c&Hffffff&\\3c&H000000&}'},
+            {'style': 'English', 'translate': 'words', 'on': '{\\c&Hff8800&\\3c&H804400&}', 'off': '{\\c&Hdddddd&\\3c&H000000&}'},
+        ],
+    },
+    'bilingual': {
+        'title': 'Bilingual Karaoke - Gurmukhi + English',
+        'mode': 'highlight',
+        'line_span': 3.5,
+        'styles': [
+            "Gurmukhi,Arial Unicode MS,28,&Hffffff,&Hffffff,&H000000,&H80000000,1,0,0,0,100,100,0,0,1,3,0,2,10,10,50,1",
+            "English,Arial,22,&Hffffff,&Hffffff,&H000000,&H80000000,0,0,0,0,100,100,0,0,1,2,0,2,10,10,10,1",
+        ],
+        'tracks': [
+            {'style': 'Gurmukhi', 'translate': None, 'on': '{\\c&Hff6600&}', 'off': '{\\c&Hffffff&}'},
+            {'style': 'English', 'translate': 'words', 'on': '{\\c&Hff6600&}', 'off': '{\\c&Hffffff&}'},
+        ],
+    },
+    'translation': {
+        'title': 'Bilingual Karaoke',
+        'mode': 'highlight',
+        'line_span': 3.0,
+        'styles': [
+            "Original,Arial Unicode MS,28,&Hffffff,&Hffffff,&H000000,&H80000000,1,0,0,0,100,100,0,0,1,3,1,2,10,10,70,1",
+            "Translation,Arial,22,&Hdddddd,&Hdddddd,&H000000,&H80000000,0,0,0,0,100,100,0,0,1,2,1,2,10,10,25,1",
+        ],
+        'tracks': [
+            {'style': 'Original', 'translate': None, 'on': '{\\c&H0088ff&}', 'off': '{\\c&Hffffff&}'},
+            {'style': 'Translation', 'translate': 'line', 'on': '{\\c&H0088ff&}', 'off': '{\\c&Hdddddd&}'},
+        ],
+    },
+    'lyrics': {
+        'title': 'Karaoke Video',
+        'mode': 'k',
+        'max_words': 8,
+        'styles': ["Default,Arial,28,&Hffffff,&Hffffff,&H000000,&H80000000,1,0,0,0,100,100,0,0,1,3,0,2,10,10,30,1"],
+    },
+}
+
+# Download
+
+def download_youtube(url, output_path):
+    """Download a YouTube video with yt-dlp; returns (path, title, description, captions_path)"""
+    import yt_dlp
+    ydl_opts = {
+        'format': 'best[ext=mp4]/best',
+        'outtmpl': output_path,
+        'quiet': True,
+        'no_warnings': True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+        title = info.get('title', 'Unknown')
+        description = info.get('description') or ''
+        ydl.download([url])
+
+    if not os.path.exists(output_path):
+        print("❌ Download failed - file not found")
+        return None, None, None, None
+    print(f"✅ Downloaded: {title} ({os.path.getsize(output_path) / (1024*1024):.1f}MB)")
+    return output_path, title, description, fetch_captions(info, output_path)
+
+def fetch_captions(info, video_path):
+    """Write the video's own-language caption track next to it (caption_ingest); returns its path or ''
+
+    A separate subtitles-only pass, so a caption error never fails the video download.
+    """
+    import yt_dlp
+    from caption_ingest import download_options
+    options = download_options(info)
+    if not options:
+        return ''
+    options.update(outtmpl=video_path, skip_download=True, quiet=True, no_warnings=True)
+    try:
+        with yt_dlp.YoutubeDL(options) as ydl:
+            ydl.process_ie_result(info, download=True)
+    except Exception as e:
+        print(f"⚠️ Captions not fetched: {e}")
+    return find_caption_file(video_path)
+
+def video_description(video_path):
+    """Description from the yt-dlp .info.json next to a downloaded video ('' without one)"""
+    info_path = os.path.splitext(video_path)[0] + '.info.json'
+    try:
+        with open(info_path) as f:
+            return json.load(f).get('description') or ''
+    except (OSError, ValueError):
+        return ''
+
+# Separation
+
+def _clip_args(start, duration):
+    args = []
+    if start is not None:
+        args.extend(['-ss', str(start)])
+    if duration:
+        args.extend(['-t', str(duration)])
+    return args
+
+def extract_audio(ffmpeg, video_path, audio_path, start=None, duration=None):
+    """Decode the video's audio track to 44.1kHz stereo PCM"""
+    cmd = [ffmpeg, '-i', video_path] + _clip_args(start, duration) + [
+        '-vn', '-acodec', 'pcm_s16le', '-ar', '44100', '-ac', '2',
+        audio_path, '-y'
+    ]
+    result = run_subprocess(cmd)
+    if not os.path.exists(audio_path):
+        print(f"❌ Audio extraction failed: {result.stderr[-500:]}")
+        return None
+    return audio_path
+
+def docker_spleeter_separation(docker, audio_path, work_dir, model='spleeter:2stems-16kHz'):
+    """Separate with the Spleeter Docker image; audio_path must live under work_dir"""
+    output_dir = os.path.join(work_dir, 'spleeter_output')
+    os.makedirs(output_dir, exist_ok=True)
+
+    docker_cmd = [
+        docker, 'run',
+        '-v', f"{work_dir}:/work",
+        '--rm',
+        SPLEETER_IMAGE,
+        'separate',
+        '-i', f"/work/{os.path.relpath(audio_path, work_dir)}",
+        '-p', model,
+        '-o', '/work/spleeter_output'
+    ]
+    result = run_subprocess(docker_cmd)
+
+    audio_name = os.path.splitext(os.path.basename(audio_path))[0]
+    vocals_path = os.path.join(output_dir, audio_name, "vocals.wav")
+    accompaniment_path = os.path.join(output_dir, audio_name, "accompaniment.wav")
+
+    if os.path.exists(vocals_path) and os.path.exists(accompaniment_path):
+        print("✅ ML separation successful!")
+        print(f"  🎤 Vocals: {os.path.getsize(vocals_path) / (1024*1024):.2f}MB")
+        print(f"  🎼 Accompaniment: {os.path.getsize(accompaniment_path) / (1024*1024):.2f}MB")
+        return vocals_path, accompaniment_path
+
+    print(f"❌ Docker Spleeter separation failed: {result.stderr[-500:]}")
+    return None, None
+
+def pan_separation(ffmpeg, video_path, work_dir, start=None, duration=None):
+    """Quick pseudo-separation with ffmpeg pan filters (no ML model)"""
+    vocals_path = os.path.join(work_dir, "vocals.wav")
+    instrumental_path = os.path.join(work_dir, "instrumental.wav")
+
+    run_subprocess([ffmpeg, '-i', video_path] + _clip_args(start, duration) + [
+        '-af', 'pan=mono|c0=0.5*c0+0.5*c1',
+        '-ar', '16000', '-ac', '1',
+        vocals_path, '-y'
+    ])
+    run_subprocess([ffmpeg, '-i', video_path] + _clip_args(start, duration) + [
+        '-af', 'pan=stereo|c0=c0-0.5*c1|c1=c1-0.5*c0',
+        '-ar', '44100', '-ac', '2',
+        instrumental_path, '-y'
+    ])
+
+    if os.path.exists(vocals_path) and os.path.exists(instrumental_path):
+        return vocals_path, instrumental_path
+    return None, None
+
+# Transcription
+
+def whisper_request(audio_path, api_key):
+    """One Whisper API call with word timestamps; works with openai 0.28 and 1.x"""
+    import openai
+    with open(audio_path, 'rb') as audio_file:
+        if hasattr(openai, 'OpenAI'):
+            client = openai.OpenAI(api_key=api_key)
+            response = client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                response_format="verbose_json",
+                timestamp_granularities=["word"]
+            )
+        else:
+            openai.api_key = api_key
+            response = openai.Audio.transcribe(
+                model="whisper-1",
+                file=audio_file,
+                response_format="verbose_json",
+                timestamp_granularities=["word"]
+            )
+    return to_transcript(response)
+
+def ffprobe_for(ffmpeg):
+    """The ffprobe installed next to an ffmpeg binary"""
+    return os.path.join(os.path.dirname(ffmpeg), 'ffprobe')
+
+def whisper_args(codec='wav', kbps=None):
+    """ffmpeg output args for a 16kHz mono transcription input"""
+    args = list(WHISPER_FORMATS[codec][1]) + ['-ar', '16000', '-ac', '1']
+    if kbps and codec not in LOSSLESS_BYTES_PER_SECOND:
+        args.extend(['-b:a', f"{kbps}k"])
+    return args
+
+def whisper_bitrate(seconds, max_bytes=WHISPER_MAX_BYTES):
+    """Highest lossy bitrate (kbps, within WHISPER_KBPS) keeping `seconds` of audio in one request, or None"""
+    kbps = int(max_bytes * 8 * 0.9 / max(seconds, 1.0) / 1000)   # 10% headroom for container overhead
+    return min(kbps, WHISPER_KBPS[1]) if kbps >= WHISPER_KBPS[0] else None
+
+def split_audio(ffmpeg, audio_path, chunk_dir, chunk_seconds=CHUNK_SECONDS, max_seconds=None, codec='wav', kbps=None):
+    """Cut audio into 16kHz mono chunks; returns [(offset_seconds, path)]
+
+    WAV stems are memory-mapped and each chunk's samples are piped straight into the
+    encoder; other inputs are decoded by ffmpeg once per chunk, up to the duration
+    in their container header.
+    """
+    from stem_store import try_open, encode_window
+    stem = try_open(audio_path)
+    if stem is not None:
+        total_seconds = stem.seconds
+    else:
+        from media_probe import duration
+        total_seconds = duration(audio_path, ffprobe_for(ffmpeg))
+    output_args = whisper_args(codec, kbps)
+    chunks = []
+    start_time = 0
+    while max_seconds is None or start_time < max_seconds:
+        if total_seconds is not None and start_time >= total_seconds:
+            break
+        length = chunk_seconds if max_seconds is None else min(chunk_seconds, max_seconds - start_time)
+        chunk_path = os.path.join(chunk_dir, f"chunk_{len(chunks):03d}.{WHISPER_FORMATS[codec][0]}")
+        if stem is not None:
+            encode_window(ffmpeg, stem, start_time, start_time + length, chunk_path, output_args)
+        else:
+            run_subprocess([
+                ffmpeg, '-ss', str(start_time), '-i', audio_path, '-t', str(length),
+            ] + output_args + [chunk_path, '-y'])
+        if not os.path.exists(chunk_path) or os.path.getsize(chunk_path) <= 1000:
+            break
+        chunks.append((start_time, chunk_path))
+        start_time += length
+    return chunks
+
+def whisper_inputs(ffmpeg, audio_path, chunk_dir, max_seconds=None, codec=WHISPER_CODEC, max_bytes=WHISPER_MAX_BYTES):
+    """Compressed 16kHz mono transcription inputs; returns [(offset_seconds, path)]
+
+    The whole track goes into one file whenever it fits under `max_bytes`: lossy codecs
+    pick the bitrate for that, lossless ones are chunked only past their size estimate.
+    Tracks too long for one request are cut into CHUNK_SECONDS pieces at the top bitrate.
+    Falls back to PCM WAV chunks when the codec's encoder is unavailable, and to the
+    original file when nothing can be encoded but it fits as is.
+    """
+    from stem_store import try_open
+    stem = try_open(audio_path)
+    if stem is not None:
+        seconds = stem.seconds
+    else:
+        from media_probe import duration
+        seconds = duration(audio_path, ffprobe_for(ffmpeg))
+    del stem
+    if seconds is not None and max_seconds is not None:
+        seconds = min(seconds, max_seconds)
+
+    kbps = WHISPER_KBPS[1]
+    chunk_seconds = CHUNK_SECONDS
+    if seconds is not None:
+        if codec in LOSSLESS_BYTES_PER_SECOND:
+            fits = seconds * LOSSLESS_BYTES_PER_SECOND[codec] <= max_bytes
+        else:
+            fit_kbps = whisper_bitrate(seconds, max_bytes)
+            fits = fit_kbps is not None
+            kbps = fit_kbps or kbps
+        if fits:
+            chunk_seconds = seconds
+    try:
+        chunks = split_audio(ffmpeg, audio_path, chunk_dir, chunk_seconds, seconds, codec, kbps)
+        if len(chunks) == 1 and os.path.getsize(chunks[0][1]) > max_bytes:
+            os.remove(chunks[0][1])
+            chunks = split_audio(ffmpeg, audio_path, chunk_dir, CHUNK_SECONDS, seconds, codec, WHISPER_KBPS[1])
+        if not chunks and codec != 'wav':
+            print(f"  ⚠️ {codec} encoding failed, sending PCM chunks")
+            chunks = split_audio(ffmpeg, audio_path, chunk_dir, max_seconds=seconds)
+    except OSError as e:
+        print(f"  ⚠️ Cannot encode transcription input: {e}")
+        chunks = []
+    if not chunks and max_seconds is None and os.path.getsize(audio_path) <= max_bytes:
+        chunks = [(0, audio_path)]      # no usable ffmpeg: the original file still fits
+    return chunks
+
+def transcribe_vocals(ffmpeg, vocals_path, api_key, max_seconds=None, max_workers=4, codec=WHISPER_CODEC, backend=None):
+    """Transcribe a vocal stem from a compressed 16kHz mono encoding, chunked (and transcribed concurrently) only when too long
+
+    `backend` is a transcription_backends backend; None uses the Whisper API with api_key.
+    """
+    from transcription_backends import WhisperApiBackend
+    backend = backend or WhisperApiBackend(api_key)
+    if not vocals_path or not os.path.exists(vocals_path):
+        return None
+
+    print("🗣️ Transcribing vocals...")
+    chunk_dir = tempfile.mkdtemp(prefix='chunks_', dir=os.path.dirname(vocals_path))
+    try:
+        chunks = whisper_inputs(ffmpeg, vocals_path, chunk_dir, max_seconds, codec)
+        upload_bytes = sum(os.path.getsize(path) for _, path in chunks)
+        print(f"📦 Transcribing {len(chunks)} chunk(s), {upload_bytes / (1024*1024):.2f}MB "
+              f"(stem {os.path.getsize(vocals_path) / (1024*1024):.1f}MB)")
+
+        transcripts = backend.transcribe_many([path for _, path in chunks], max_workers)
+        parts = [(offset, transcript) for (offset, _), transcript in zip(chunks, transcripts)]
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    transcript = merge_transcripts(parts)
+    if not transcript.words:
+        print("❌ No words transcribed")
+        return None
+    print(f"✅ Transcription: {len(transcript.words)} words from {len(chunks)} chunk(s)")
+    return transcript
+
+def caption_transcript(captions_path, vocals_path=None):
+    """Transcript from a caption file (caption_ingest), or None when it fails the quality checks
+
+    Word-timed recognition tracks are used as they are; line-timed captions are aligned
+    to the vocals like known lyrics, keeping the cue times if that alignment is rejected.
+    """
+    from caption_ingest import load_captions, caption_quality
+    from media_probe import duration
+    try:
+        track = load_captions(captions_path)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Captions unreadable: {e}")
+        return None
+    have_vocals = vocals_path and os.path.exists(vocals_path)
+    problem = caption_quality(track, duration(vocals_path) if have_vocals else None)
+    if problem:
+        print(f"⚠️ Captions not used: {problem}")
+        return None
+    if not track.word_timed and have_vocals:
+        from lyrics_alignment import align_lyrics
+        print("🎼 Aligning caption lines to the vocals...")
+        aligned = align_lyrics(vocals_path, track.lyrics)
+        if aligned is not None:
+            return aligned
+    kind = 'word' if track.word_timed else 'line'
+    print(f"💬 Using {kind}-timed captions: {len(track.transcript.words)} words from {os.path.basename(captions_path)}")
+    return track.transcript
+
+def lyrics_or_transcription(ffmpeg, vocals_path, lyrics, api_key, max_seconds=None, backend=None, description=None,
+                            captions_path=None):
+    """Word timings from the cheapest source that fits the vocal stem, transcribing as the last resort
+
+    In order: known `lyrics` aligned to the vocals, the video's caption track, a "Lyrics:"
+    block in the video description, then the transcription backend.
+    """
+    have_vocals = vocals_path and os.path.exists(vocals_path)
+    if lyrics and have_vocals:
+        from lyrics_alignment import align_lyrics
+        print("🎼 Aligning known lyrics to the vocals...")
+        transcript = align_lyrics(vocals_path, lyrics)
+        if transcript is not None:
+            return transcript
+    if captions_path:
+        transcript = caption_transcript(captions_path, vocals_path)
+        if transcript is not None:
+            return transcript
+    if not lyrics and description and have_vocals:
+        from lyrics_alignment import extract_lyrics, align_lyrics
+        lyrics = extract_lyrics(description)
+        if lyrics:
+            print("🎼 Aligning description lyrics to the vocals...")
+            transcript = align_lyrics(vocals_path, lyrics)
+            if transcript is not None:
+                return transcript
+    return transcribe_vocals(ffmpeg, vocals_path, api_key, max_seconds, backend=backend)
+
+def refine_word_timing(transcript, vocals_path):
+    """Snap word boundaries to the vocal stem's onsets and pauses (timing_refinement); unchanged if it cannot be read"""
+    if not transcript or not transcript.words:
+        return transcript
+    from timing_refinement import refine_transcript
+    try:
+        return refine_transcript(transcript, vocals_path)
+    except Exception as e:
+        print(f"⚠️ Word timing refinement skipped: {e}")
+        return transcript
+
+def quietest_cut(samples, sample_rate, end, search_seconds=SILENCE_SEARCH_SECONDS, hop_seconds=SILENCE_HOP_SECONDS):
+    """Frame of the quietest hop in the `search_seconds` before frame `end`: a cut there splits no word"""
+    import numpy as np
+    hop = max(1, int(hop_seconds * sample_rate))
+    start = max(0, end - int(search_seconds * sample_rate))
+    hops = (end - start) // hop
+    if hops < 2:
+        return end
+    region = np.asarray(samples[start:start + hops * hop], dtype=np.float32)
+    energy = np.square(region).reshape(hops, -1).sum(axis=1)
+    return start + int(np.argmin(energy)) * hop + hop // 2
+
+class SpeculativeTranscriber:
+    """Transcribes a vocal stem while it is still being separated
+
+    feed() takes consecutive (frames, channels) float blocks of the stem as separation
+    produces them. Every SPECULATIVE_SECONDS the buffered audio is cut at its quietest
+    point, encoded as a compressed 16kHz mono file and transcribed on a worker thread
+    (by `backend`, the Whisper API by default), so that latency overlaps the rest of
+    the separation. finish() sends the
+    remainder and merges the words at their offsets.
+    """
+
+    def __init__(self, ffmpeg, api_key, chunk_dir, sample_rate, codec=WHISPER_CODEC,
+                 window_seconds=SPECULATIVE_SECONDS, max_workers=4, backend=None):
+        from transcription_backends import WhisperApiBackend
+        self.ffmpeg = ffmpeg
+        self.backend = backend or WhisperApiBackend(api_key)
+        self.chunk_dir = chunk_dir
+        self.sample_rate = int(sample_rate)
+        self.codec = codec
+        self.window_frames = int(window_seconds * self.sample_rate)
+        self._blocks = []
+        self._buffered = 0
+        self._submitted = 0
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='speculative-transcribe')
+        os.makedirs(chunk_dir, exist_ok=True)
+
+    def feed(self, block):
+        import numpy as np
+        self._blocks.append(np.asarray(block, dtype=np.float32))
+        self._buffered += len(block)
+        while self._buffered >= self.window_frames:
+            buffer = np.concatenate(self._blocks)
+            cut = quietest_cut(buffer, self.sample_rate, self.window_frames)
+            self._submit(buffer[:cut])
+            self._blocks = [buffer[cut:]]
+            self._buffered = len(buffer) - cut
+
+    def _submit(self, samples):
+        offset = self._submitted / float(self.sample_rate)
+        index = len(self._futures)
+        self._futures.append(self._executor.submit(self._transcribe, index, offset, samples))
+        self._submitted += len(samples)
+
+    def _encode(self, index, samples):
+        """Compressed transcription input for a window; a 16-bit WAV when ffmpeg cannot encode it"""
+        import numpy as np
+        from stem_store import Stem, encode_window, write_wav
+        base = os.path.join(self.chunk_dir, f"speculative_{index:03d}")
+        path = f"{base}.{WHISPER_FORMATS[self.codec][0]}"
+        seconds = len(samples) / float(self.sample_rate)
+        try:
+            if encode_window(self.ffmpeg, Stem(path, samples, self.sample_rate), 0, None, path,
+                             whisper_args(self.codec, whisper_bitrate(seconds) or WHISPER_KBPS[1])):
+                return path
+        except OSError as e:
+            print(f"  ⚠️ Cannot encode window {index}: {e}")
+        return write_wav(f"{base}.wav", samples, self.sample_rate, np.int16)
+
+    def _transcribe(self, index, offset, samples):
+        path = None
+        try:
+            path = self._encode(index, samples)
+            return offset, self.backend.transcribe(path)
+        except Exception as e:
+            print(f"  ⚠️ Speculative window at {offset:.1f}s failed: {e}")
+            return offset, None
+        finally:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def finish(self):
+        """Transcribe what is still buffered and wait for every window; returns the merged Transcript"""
+        import numpy as np
+        if self._buffered:
+            self._submit(np.concatenate(self._blocks))
+            self._blocks, self._buffered = [], 0
+        try:
+            parts = [future.result() for future in self._futures]
+        finally:
+            self._executor.shutdown()
+        transcript = merge_transcripts(parts)
+        print(f"✅ Speculative transcription: {len(transcript.words)} words from {len(parts)} window(s)")
+        return transcript
+
+    def cancel(self):
+        """Drop queued windows (e.g. when separation failed)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# Subtitles
+
+def _ass_header(preset, title=None):
+    styles = "\n".join(f"Style: {style}" for style in preset['styles'])
+    return f"""[Script Info]
+Title: {title or preset['title']}
+ScriptType: v4.00+
+
+[V4+ Styles]
+{ASS_STYLE_FORMAT}
+{styles}
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+def transliterate_texts(texts, kind='word'):
+    """Default `translate` for write_subtitles: the Latin spelling of each text"""
+    return [" ".join(transliterate_words(text.split())) for text in texts]
+
+def subtitle_translator(backend=None, target=None):
+    """`translate` for write_subtitles: a translation_memo backend behind the shared memo
+
+    Only words and lines the memo has never seen reach the backend; if it fails, the
+    subtitles fall back to transliteration.
+    """
+    from translation_memo import get_translator, get_memo, TRANSLATION_TARGET
+    translator = get_translator(backend)
+    if translator.free:
+        return lambda texts, kind='word': translator.translate(texts, target)
+
+    def translate(texts, kind='word'):
+        try:
+            return get_memo().translate(texts, translator, target or TRANSLATION_TARGET, kind)
+        except Exception as e:
+            print(f"⚠️ Translation with {translator.name} failed, transliterating instead: {e}")
+            return transliterate_texts(texts, kind)
+    return translate
+
+def _track_texts(lines, tracks, translate):
+    """Per track, every line's words (lists) or, for 'line' tracks, its translated text;
+    one translate() call per kind for the whole transcript"""
+    originals = [[w.word for w in line] for line in lines]
+    kinds = {track.get('translate') for track in tracks}
+    translated = {}
+    if 'words' in kinds:
+        flat = iter(translate([word for line in originals for word in line], 'word'))
+        translated['words'] = [[next(flat) for _ in line] for line in originals]
+    if 'line' in kinds:
+        translated['line'] = translate([" ".join(line) for line in originals], 'line')
+    return [translated.get(track.get('translate'), originals) for track in tracks]
+
+def _highlight_events(transcript, preset, translate=transliterate_texts):
+    events = []
+    tracks = preset['tracks']
+    lines = group_lines_by_span(transcript.words, preset['line_span'])
+    texts = _track_texts(lines, tracks, translate)
+    for line_idx, line_words in enumerate(lines):
+        for word_idx, word in enumerate(line_words):
+            start_time = format_ass_time(word.start)
+            end_time = format_ass_time(word.end)
+            for layer, track in enumerate(tracks):
+                words = texts[layer][line_idx]
+                if isinstance(words, str):
+                    line_text = track['off'] + words     # a translated line has no word to highlight
+                else:
+                    line_text = " ".join(
+                        track['on'] + text + track['off'] if i == word_idx else text
+                        for i, text in enumerate(words)
+                    )
+                events.append(f"Dialogue: {layer},{start_time},{end_time},{track['style']},,0,0,0,,{line_text}\\N")
+    return events
+
+def _k_events(transcript, preset):
+    events = []
+    for line_words in group_lines_by_count(transcript.words, preset['max_words']):
+        line_start = line_words[0].start
+        text_parts = []
+        current_time = line_start
+        for word in line_words:
+            highlight_duration = int(max(0.1, word.end - current_time) * 100)  # centiseconds
+            text_parts.append(f"{{\\k{highlight_duration}}}{word.word.strip()}")
+            current_time = word.end
+        events.append(f"Dialogue: 0,{format_ass_time(line_start)},{format_ass_time(line_words[-1].end)},"
+                      f"Default,,0,0,0,,{''.join(text_parts)}\\N")
+    return events
+
+def write_subtitles(transcript, subtitle_path, preset='cloud', title=None, translate=None):
+    """Write an ASS file for the transcript using one of SUBTITLE_PRESETS
+
+    `translate(texts, kind)` fills the presets' second-language tracks (see subtitle_translator).
+    """
+    if not transcript or not transcript.words:
+        return None
+    preset = SUBTITLE_PRESETS[preset] if isinstance(preset, str) else preset
+    if preset['mode'] == 'k':
+        events = _k_events(transcript, preset)
+    else:
+        events = _highlight_events(transcript, preset, translate or transliterate_texts)
+    with open(subtitle_path, 'w', encoding='utf-8') as f:
+        f.write(_ass_header(preset, title))
+        f.write("\n".join(events) + "\n")
+    return subtitle_path
+
+# Mixing and rendering
+
+def analyze_loudness(vocals_path, accompaniment_path, vocal_levels=(), target_lufs=None):
+    """Loudness analysis of the two stems (see loudness.py); {} when they cannot be mapped"""
+    from stem_store import try_open
+    import loudness
+    vocals, accompaniment = try_open(vocals_path), try_open(accompaniment_path)
+    if vocals is None or accompaniment is None:
+        return {}
+    try:
+        return loudness.analyze(vocals, accompaniment, vocal_levels,
+                                loudness.TARGET_LUFS if target_lufs is None else target_lufs)
+    except Exception as e:
+        # The mixes fall back to the fixed amix gain
+        print(f"⚠️ Loudness analysis skipped: {e}")
+        return {}
+
+def mix_vocal_level(ffmpeg, vocals_path, accompaniment_path, vocal_level, output_path, analysis=None):
+    """Mix vocals into the accompaniment at vocal_level (0-1.0)
+
+    With a loudness analysis the mix is scaled by the gain that brings it to the target
+    loudness. Without one it is scaled by 1/2 like ffmpeg's amix, and at 0% the
+    accompaniment is already the mix, so its path is returned without a copy.
+    Matching WAV stems are mixed from their memory maps in one pass; anything else
+    goes through ffmpeg.
+    """
+    if analysis:
+        from loudness import mix_gain
+        gain = mix_gain(analysis, vocal_level)
+    elif vocal_level == 0:
+        return accompaniment_path
+    else:
+        gain = 0.5
+
+    from stem_store import try_open, mix_stems
+    vocals, accompaniment = try_open(vocals_path), try_open(accompaniment_path)
+    if (vocals is not None and accompaniment is not None and vocals.sample_rate == accompaniment.sample_rate
+            and vocals.channels == accompaniment.channels):
+        return mix_stems(vocals, accompaniment, vocal_level, output_path, vocal_gain=gain, accompaniment_gain=gain)
+
+    # amix halves both inputs; the volume filter after it applies the gain on top of that
+    cmd = [
+        ffmpeg,
+        '-i', accompaniment_path, '-i', vocals_path,
+        '-filter_complex', f'[1:a]volume={vocal_level}[v];[0:a][v]amix=inputs=2:duration=longest,volume={gain * 2:.6f}',
+        '-c:a', 'pcm_s16le', output_path, '-y'
+    ]
+    run_subprocess(cmd)
+    return output_path if os.path.exists(output_path) else None
+
+def encode_client_stem(ffmpeg, stem_path, output_path, codec='flac'):
+    """Encode a stem as a standalone audio file a client can play (CLIENT_AUDIO_FORMATS)"""
+    result = run_subprocess([ffmpeg, '-i', stem_path, '-vn'] + CLIENT_AUDIO_FORMATS[codec][1] + ['-y', output_path])
+    if result.returncode == 0 and os.path.exists(output_path):
+        return output_path
+    print(f"❌ Failed to encode {os.path.basename(output_path)}: {result.stderr[-500:]}")
+    return None
+
+def render_karaoke_video(ffmpeg, video_path, audio_path, subtitle_path, output_path,
+                         start=None, duration=None, crf=18):
+    """Burn subtitles into the original video with the mixed audio
+
+    The mix is already clipped, so only the video input is seeked to `start`.
+    """
+    cmd = [ffmpeg] + _clip_args(start, None) + [
+        '-i', video_path, '-i', audio_path,
+    ] + _clip_args(None, duration) + [
+        '-vf', f"ass={subtitle_path}",
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', 'libx264', '-c:a', 'aac',
+        '-b:a', '256k', '-preset', 'fast', '-crf', str(crf),
+        '-y', output_path
+    ]
+    result = run_subprocess(cmd)
+    if result.returncode == 0 and os.path.exists(output_path):
+        print(f"✅ Created: {os.path.basename(output_path)} ({os.path.getsize(output_path) / (1024*1024):.1f}MB)")
+        return output_path
+    print(f"❌ Failed to create {os.path.basename(output_path)}: {result.stderr[-500:]}")
+    return None
+
+def render_lyric_video(ffmpeg, audio_path, subtitle_path, output_path, duration, force_style='FontSize=32'):
+    """Render subtitles over a black 720p background with the given audio"""
+    cmd = [
+        ffmpeg,
+        '-f', 'lavfi', '-i', f"color=black:size=1280x720:duration={duration}",
+        '-i', audio_path,
+        '-vf', f"subtitles={subtitle_path}:force_style='{force_style}'",
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c:v', 'libx264', '-c:a', 'aac',
+        '-t', str(duration),
+        output_path, '-y'
+    ]
+    result = run_subprocess(cmd)
+    if os.path.exists(output_path):
+        return output_path
+    print(f"❌ Video creation failed: {result.stderr[-500:]}")
+    return None
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Load Generator for the Karaoke Services
+Drives /process, /download (or any job endpoint) of locally running services at
+configurable arrival rates and concurrencies, samples each instance's /metrics,
+and reports a saturation curve for sizing Cloud Run concurrency and instances
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from benchmark_suite import summarize
+
+def parse_metrics(text):
+    """Parse Prometheus text exposition into {metric_name: summed value}"""
+    totals = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        try:
+            series, value = line.rsplit(' ', 1)
+            name = series.split('{', 1)[0]
+            totals[name] = totals.get(name, 0.0) + float(value)
+        except ValueError:
+            continue
+    return totals
+
+def parse_duration_mix(spec):
+    """Parse '10:0.4,30:0.4,full:0.2' into {10: 0.4, 30: 0.4, None: 0.2}"""
+    mix = {}
+    for part in spec.split(','):
+        duration, weight = part.split(':')
+        mix[None if duration == 'full' else int(duration)] = float(weight)
+    return mix
+
+def make_payload_factory(endpoint, media_url, youtube_url, duration_mix, vocal_levels, extra_payload):
+    """Return a function producing (payload, test_duration) for each request"""
+    durations = list(duration_mix)
+    weights = [duration_mix[d] for d in durations]
+
+    def factory():
+        test_duration = random.choices(durations, weights)[0]
+        if endpoint == '/download':
+            payload = {'url': youtube_url}
+        else:
+            payload = {'video_url': media_url, 'vocal_levels': vocal_levels}
+            if test_duration:
+                payload['test_duration'] = test_duration
+        payload.update(extra_payload)
+        return payload, test_duration
+
+    return factory
+
+class InstanceSampler(threading.Thread):
+    """Polls each target's /metrics for CPU, RSS and in-flight jobs"""
+
+    def __init__(self, targets, interval):
+        super().__init__(daemon=True)
+        self.targets = targets
+        self.interval = interval
+        self.samples = {target: [] for target in targets}
+        self._halt = threading.Event()
+
+    def run(self):
+        previous = {}
+        while not self._halt.is_set():
+            for target in self.targets:
+                try:
+                    metrics = parse_metrics(requests.get(f"{target}/metrics", timeout=5).text)
+                except requests.RequestException:
+                    continue
+                now = time.time()
+                cpu = metrics.get('process_cpu_seconds_total', 0.0) + metrics.get('process_children_cpu_seconds_total', 0.0)
+                sample = {
+                    'time': now,
+                    'rss_mb': metrics.get('process_resident_memory_bytes', 0.0) / (1024 * 1024),
+                    'in_flight': metrics.get('karaoke_jobs_in_flight', 0.0),
+                    'cpu_cores': None,
+                }
+                if target in previous:
+                    last_time, last_cpu = previous[target]
+                    if now > last_time:
+                        sample['cpu_cores'] = max(0.0, (cpu - last_cpu) / (now - last_time))
+                previous[target] = (now, cpu)
+                self.samples[target].append(sample)
+            self._halt.wait(self.interval)
+
+    def stop(self):
+        self._halt.set()
+        self.join(timeout=self.interval + 5)
+
+    def summary(self):
+        per_instance = {}
+        for target, samples in self.samples.items():
+            cores = [s['cpu_cores'] for s in samples if s['cpu_cores'] is not None]
+            per_instance[target] = {
+                'samples': len(samples),
+                'cpu_cores_mean': round(sum(cores) / len(cores), 3) if cores else None,
+                'cpu_cores_max': round(max(cores), 3) if cores else None,
+                'rss_mb_max': round(max((s['rss_mb'] for s in samples), default=0.0), 1),
+                'in_flight_max': max((s['in_flight'] for s in samples), default=0.0),
+            }
+        return per_instance
+
+def run_step(targets, endpoint, payload_factory, rate, concurrency, duration, timeout, sample_interval):
+    """Offer load at `rate` req/s (closed loop when rate is None) for `duration` seconds"""
+    lock = threading.Lock()
+    results = []
+    state = {'queued': 0, 'max_queued': 0, 'active': 0, 'max_active': 0}
+    counter = {'next': 0}
+
+    def send(target, payload, test_duration, enqueued):
+        with lock:
+            state['queued'] -= 1
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+        started = time.perf_counter()
+        record = {'target': target, 'test_duration': test_duration,
+                  'queue_wait': round(started - enqueued, 3)}
+        try:
+            response = requests.post(f"{target}{endpoint}", json=payload, timeout=timeout)
+            record['status'] = response.status_code
+            record['ok'] = response.status_code == 200
+        except requests.RequestException as e:
+            record['status'] = type(e).__name__
+            record['ok'] = False
+        record['latency'] = time.perf_counter() - started
+        with lock:
+            state['active'] -= 1
+            results.append(record)
+
+    def submit(executor):
+        target = targets[counter['next'] % len(targets)]
+        counter['next'] += 1
+        payload, test_duration = payload_factory()
+        with lock:
+            state['queued'] += 1
+            state['max_queued'] = max(state['max_queued'], state['queued'])
+        return executor.submit(send, target, payload, test_duration, time.perf_counter())
+
+    sampler = InstanceSampler(targets, sample_interval)
+    sampler.start()
+    step_start = time.perf_counter()
+    deadline = step_start + duration
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if rate:
+            next_arrival = step_start
+            while next_arrival < deadline:
+                time.sleep(max(0.0, next_arrival - time.perf_counter()))
+                submit(executor)
+                next_arrival += random.expovariate(rate)
+        else:
+            # Closed loop: keep exactly `concurrency` requests outstanding
+            futures = [submit(executor) for _ in range(concurrency)]
+            while time.perf_counter() < deadline:
+                for i, future in enumerate(futures):
+                    if future.done() and time.perf_counter() < deadline:
+                        futures[i] = submit(executor)
+                time.sleep(0.05)
+
+    elapsed = time.perf_counter() - step_start
+    sampler.stop()
+
+    latencies = [r['latency'] for r in results if r['ok']]
+    errors = [r for r in results if not r['ok']]
+    by_duration = {}
+    for r in results:
+        if r['ok']:
+            by_duration.setdefault(str(r['test_duration'] or 'full'), []).append(r['latency'])
+
+    return {
+        'offered_rate': rate,
+        'concurrency': concurrency,
+        'requests': len(results),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 4) if elapsed else 0.0,
+        'error_rate': round(len(errors) / len(results), 4) if results else 0.0,
+        'error_statuses': sorted({str(r['status']) for r in errors}),
+        'latency': summarize(latencies),
+        'latency_by_duration': {k: summarize(v) for k, v in sorted(by_duration.items())},
+        'queue_wait': summarize([r['queue_wait'] for r in results]),
+        'max_client_queue_depth': state['max_queued'],
+        'max_in_flight': state['max_active'],
+        'instances': sampler.summary(),
+    }
+
+def find_knee(steps, latency_factor, max_error_rate):
+    """Last step before p95 latency blows up or errors appear"""
+    base = next((s['latency'].get('p95') for s in steps if s['latency'].get('p95')), None)
+    knee = None
+    for step in steps:
+        p95 = step['latency'].get('p95')
+        if step['error_rate'] > max_error_rate or p95 is None or (base and p95 > base * latency_factor):
+            break
+        knee = step
+    return knee
+
+def print_curve(steps):
+    print(f"\n{'rate':>8}{'conc':>6}{'req':>6}{'rps':>9}{'err%':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'queue':>7}{'cpu':>7}{'rss':>8}")
+    for s in steps:
+        lat = s['latency']
+        cpu = max((i['cpu_cores_max'] or 0 for i in s['instances'].values()), default=0)
+        rss = max((i['rss_mb_max'] for i in s['instances'].values()), default=0)
+        rate = f"{s['offered_rate']:.3f}" if s['offered_rate'] else 'closed'
+        print(f"{rate:>8}{s['concurrency']:>6}{s['requests']:>6}{s['throughput_rps']:>9.4f}"
+              f"{s['error_rate']*100:>7.1f}{lat.get('p50', 0):>9.2f}{lat.get('p95', 0):>9.2f}"
+              f"{lat.get('p99', 0):>9.2f}{s['max_client_queue_depth']:>7}{cpu:>7.2f}{rss:>8.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Saturation load test for the karaoke services")
+    parser.add_argument('--target', action='append', required=True,
+                        help="Base URL of a service instance (repeat for several instances)")
+    parser.add_argument('--endpoint', default='/process', help="Job endpoint, e.g. /process or /download")
+    parser.add_argument('--media-url', help="video_url sent to /process")
+    parser.add_argument('--youtube-url', default='https://www.youtube.com/watch?v=Fbv6-50S1lc', help="url sent to /download")
+    parser.add_argument('--payload', default='{}', help="Extra JSON merged into every request body")
+    parser.add_argument('--vocal-levels', default='0.0', help="Comma-separated vocal levels for /process")
+    parser.add_argument('--duration-mix', default='10:0.4,30:0.4,full:0.2',
+                        help="test_duration:weight pairs; 'full' sends no test_duration")
+    parser.add_argument('--rates', default='', help="Comma-separated arrival rates in req/s (empty = closed loop)")
+    parser.add_argument('--concurrency', default='1,2,4', help="Comma-separated client concurrency levels")
+    parser.add_argument('--step-duration', type=float, default=120, help="Seconds per load step")
+    parser.add_argument('--timeout', type=float, default=1800, help="Per-request timeout in seconds")
+    parser.add_argument('--sample-interval', type=float, default=2.0, help="Seconds between /metrics polls")
+    parser.add_argument('--latency-factor', type=float, default=2.0, help="p95 growth that marks saturation")
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--output', help="Write the JSON saturation report to this path")
+    args = parser.parse_args()
+
+    if args.endpoint != '/download' and not args.media_url:
+        parser.error('--media-url is required for job endpoints other than /download')
+
+    targets = [t.rstrip('/') for t in args.target]
+    rates = [float(r) for r in args.rates.split(',') if r] or [None]
+    concurrencies = [int(c) for c in args.concurrency.split(',') if c]
+    factory = make_payload_factory(
+        args.endpoint, args.media_url, args.youtube_url, parse_duration_mix(args.duration_mix),
+        [float(v) for v in args.vocal_levels.split(',')], json.loads(args.payload))
+
+    print("📈 KARAOKE SERVICE LOAD TEST 📈")
+    print("=" * 60)
+    print(f"🎯 {args.endpoint} on {len(targets)} instance(s): {', '.join(targets)}")
+
+    steps = []
+    for concurrency in concurrencies:
+        for rate in rates:
+            label = f"{rate} req/s" if rate else "closed loop"
+            print(f"\n⏳ Step: {label}, concurrency {concurrency}, {args.step_duration:.0f}s")
+            step = run_step(targets, args.endpoint, factory, rate, concurrency,
+                            args.step_duration, args.timeout, args.sample_interval)
+            steps.append(step)
+            print(f"   ✅ {step['requests']} requests, {step['throughput_rps']} rps, "
+                  f"p95 {step['latency'].get('p95')}s, errors {step['error_rate']:.1%}")
+
+    print_curve(steps)
+
+    knee = find_knee(steps, args.latency_factor, args.max_error_rate)
+    report = {
+        'endpoint': args.endpoint,
+        'targets': targets,
+        'duration_mix': {str(k or 'full'): v for k, v in parse_duration_mix(args.duration_mix).items()},
+        'steps': steps,
+        'saturation': None,
+    }
+    if knee:
+        per_instance_rps = knee['throughput_rps'] / len(targets)
+        report['saturation'] = {
+            'concurrency': knee['concurrency'],
+            'offered_rate': knee['offered_rate'],
+            'throughput_rps_per_instance': round(per_instance_rps, 4),
+            'p95_latency': knee['latency'].get('p95'),
+        }
+        print(f"\n🎯 Saturation point: concurrency {knee['concurrency']} "
+              f"({per_instance_rps:.4f} rps per instance, p95 {knee['latency'].get('p95')}s)")
+    else:
+        print("\n⚠️ Service was saturated at the first load step")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report saved to: {args.output}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Loudness Analysis
+Measures both stems once and derives, for any vocal level, the gain that brings
+accompaniment + level * vocals to a target loudness without another pass over the mix:
+
+- K-weighted power per 100ms hop (ITU-R BS.1770), computed in the frequency domain:
+  each hop is one row of a batched rfft and the power is weighted by |H(f)|^2 of the
+  K filter. The cross power of the two stems is kept too, so the power of the mix
+  at level v is Pa + v^2 Pv + 2v Pav for every hop and the gated integrated loudness
+  of any mix follows from three arrays
+- true peak by 4x band-limited oversampling, per stem and per requested mix
+
+analyze() returns a JSON-ready dict that goes into the job metadata; mix_settings()
+and mix_gain() work from that dict alone, so re-renders need no re-analysis.
+"""
+import numpy as np
+from stem_store import StemFormatError, to_float
+
+TARGET_LUFS = -14.0
+TRUE_PEAK_CEILING = -1.0           # dBTP
+MAX_GAIN_DB = 20.0                 # never boost near-silent mixes further than this
+HOP_SECONDS = 0.1                  # gating blocks are 4 hops (400ms, 75% overlap)
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+OVERSAMPLE = 4
+PEAK_SEGMENT_FRAMES = 4096
+PEAK_BATCH = 32                    # segments per batched FFT
+PEAK_MARGIN_FRAMES = 256
+MAX_OVERSHOOT_DB = 1.0             # segments this far below a signal's sample peak are not oversampled
+HOPS_PER_BLOCK = 100               # hops per batched rfft
+FLOOR_DB = -120.0
+VERSION = 1
+
+def _biquads(sample_rate):
+    """(b, a) of the BS.1770 pre-filter (high shelf) and RLB high-pass at any sample rate"""
+    k = np.tan(np.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = ([(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0],
+             [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    k = np.tan(np.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass = ([1.0, -2.0, 1.0], [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    return shelf, highpass
+
+def k_weighting_power(sample_rate, n):
+    """|H(f)|^2 of the K filter at the rfft bins of an n-sample frame"""
+    z = np.exp(-1j * 2 * np.pi * np.fft.rfftfreq(n))
+    response = np.ones(len(z), dtype=np.complex128)
+    for b, a in _biquads(sample_rate):
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return np.abs(response) ** 2
+
+def _check(vocals, accompaniment):
+    if vocals.sample_rate != accompaniment.sample_rate or vocals.channels != accompaniment.channels:
+        raise StemFormatError("stems differ in sample rate or channel count")
+
+def _padded(stem, start, end):
+    block = to_float(stem.samples[start:end])
+    if len(block) < end - start:
+        block = np.concatenate([block, np.zeros((end - start - len(block), stem.channels), dtype=np.float32)])
+    return block
+
+def hop_powers(vocals, accompaniment, hop_seconds=HOP_SECONDS):
+    """K-weighted mean square per hop, summed over channels: (vocals, accompaniment, cross)"""
+    _check(vocals, accompaniment)
+    hop = max(1, int(round(hop_seconds * vocals.sample_rate)))
+    frames = max(vocals.frames, accompaniment.frames)
+    hops = -(-frames // hop)
+    # Parseval for a real rfft: interior bins count twice; scale to a mean square
+    weight = k_weighting_power(vocals.sample_rate, hop) * 2.0
+    weight[0] /= 2
+    if hop % 2 == 0:
+        weight[-1] /= 2
+    weight /= float(hop) ** 2
+    powers = np.zeros((3, hops))
+    for first in range(0, hops, HOPS_PER_BLOCK):
+        count = min(HOPS_PER_BLOCK, hops - first)
+        span = (first * hop, (first + count) * hop)
+        v = np.fft.rfft(_padded(vocals, *span).reshape(count, hop, -1), axis=1)
+        a = np.fft.rfft(_padded(accompaniment, *span).reshape(count, hop, -1), axis=1)
+        powers[0, first:first + count] = np.einsum('hfc,f->h', np.abs(v) ** 2, weight)
+        powers[1, first:first + count] = np.einsum('hfc,f->h', np.abs(a) ** 2, weight)
+        powers[2, first:first + count] = np.einsum('hfc,f->h', (a * np.conj(v)).real, weight)
+    return powers[0], powers[1], powers[2]
+
+def gated_loudness(powers):
+    """Integrated loudness (LUFS) of per-hop powers with BS.1770 gating; None if all gated"""
+    powers = np.asarray(powers, dtype=np.float64)
+    if len(powers) == 0:
+        return None
+    blocks = np.convolve(powers, np.ones(4) / 4, mode='valid') if len(powers) >= 4 else powers[None].mean(axis=1)
+    with np.errstate(divide='ignore'):
+        levels = -0.691 + 10 * np.log10(blocks)
+    gated = blocks[levels > ABSOLUTE_GATE]
+    if len(gated) == 0:
+        return None
+    relative = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    with np.errstate(divide='ignore'):
+        gated = gated[-0.691 + 10 * np.log10(gated) > relative]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+def _envelope(powers):
+    return np.round(np.maximum(FLOOR_DB, 10 * np.log10(np.maximum(powers, 1e-30))), 2).tolist()
+
+def _db(value):
+    return round(float(max(FLOOR_DB, 20 * np.log10(value))) if value > 0 else FLOOR_DB, 2)
+
+def _oversampled(stem, starts, length):
+    """4x band-limited interpolation of equal-length frame ranges, batched as (ranges, frames, channels)
+
+    Each range is transformed with PEAK_MARGIN_FRAMES of context on both sides, which
+    keeps the circular FFT from wrapping the ends into each other.
+    """
+    margin = PEAK_MARGIN_FRAMES
+    blocks = np.stack([_padded(stem, max(0, start - margin), start + length + margin) if start >= margin else
+                       np.concatenate([np.zeros((margin - start, stem.channels), dtype=np.float32),
+                                       _padded(stem, 0, start + length + margin)])
+                       for start in starts])
+    n = blocks.shape[1]
+    up = np.fft.irfft(np.fft.rfft(blocks, axis=1), n * OVERSAMPLE, axis=1) * OVERSAMPLE
+    return up[:, margin * OVERSAMPLE:(margin + length) * OVERSAMPLE]
+
+def true_peaks(vocals, accompaniment, vocal_levels=()):
+    """Linear true peaks of both stems and of accompaniment + level * vocals for each level
+
+    Sample peaks are taken per segment for every signal at once; only segments whose
+    sample peak is within MAX_OVERSHOOT_DB of a signal's maximum are oversampled.
+    """
+    _check(vocals, accompaniment)
+    levels = list(vocal_levels)
+    frames = max(vocals.frames, accompaniment.frames)
+    segment = PEAK_SEGMENT_FRAMES
+    sample = np.zeros((2 + len(levels), -(-frames // segment)))
+    step = segment * 64
+    for start in range(0, frames, step):
+        count = -(-(min(frames, start + step) - start) // segment)
+        end = start + count * segment
+        v = _padded(vocals, start, end).reshape(count, -1)
+        a = _padded(accompaniment, start, end).reshape(count, -1)
+        rows = slice(start // segment, start // segment + count)
+        sample[0, rows] = np.abs(v).max(axis=1)
+        sample[1, rows] = np.abs(a).max(axis=1)
+        for i, level in enumerate(levels):
+            sample[2 + i, rows] = np.abs(a + level * v).max(axis=1)
+    peaks = sample.max(axis=1) if sample.size else np.zeros(len(sample))
+    overshoot = 10 ** (MAX_OVERSHOOT_DB / 20)
+    # Oversampling is linear, so one upsampled copy of each stem gives every mix too
+    candidates = np.flatnonzero((sample * overshoot > peaks[:, None]).any(axis=0)) * segment
+    for first in range(0, len(candidates), PEAK_BATCH):
+        starts = candidates[first:first + PEAK_BATCH]
+        v, a = _oversampled(vocals, starts, segment), _oversampled(accompaniment, starts, segment)
+        signals = [v, a] + [a + level * v for level in levels]
+        peaks = np.maximum(peaks, [np.abs(signal).max() for signal in signals])
+    peaks = [float(peak) for peak in peaks]
+    return peaks[0], peaks[1], dict(zip(levels, peaks[2:]))
+
+def level_key(vocal_level):
+    return f"{float(vocal_level):g}"
+
+def analyze(vocals, accompaniment, vocal_levels=(), target_lufs=TARGET_LUFS,
+            true_peak_ceiling=TRUE_PEAK_CEILING, hop_seconds=HOP_SECONDS):
+    """Loudness of both stems and the gain for each vocal level, from two mapped Stems"""
+    power_v, power_a, cross = hop_powers(vocals, accompaniment, hop_seconds)
+    peak_v, peak_a, mix_peaks = true_peaks(vocals, accompaniment, vocal_levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation = np.nan_to_num(cross / np.sqrt(power_v * power_a))
+    analysis = {
+        'version': VERSION,
+        'sample_rate': vocals.sample_rate,
+        'hop_seconds': hop_seconds,
+        'target_lufs': target_lufs,
+        'true_peak_ceiling': true_peak_ceiling,
+        'stems': {
+            'vocals': {'integrated_lufs': _round(gated_loudness(power_v)), 'true_peak_db': _db(peak_v)},
+            'accompaniment': {'integrated_lufs': _round(gated_loudness(power_a)), 'true_peak_db': _db(peak_a)},
+        },
+        # K-weighted power per hop in dB, and the stems' normalized cross power
+        'envelopes': {'vocals': _envelope(power_v), 'accompaniment': _envelope(power_a)},
+        'correlation': np.round(np.clip(correlation, -1, 1), 3).tolist(),
+        'mix_true_peaks': {level_key(level): _db(peak) for level, peak in mix_peaks.items()},
+    }
+    analysis['mixes'] = {level_key(level): mix_settings(analysis, level) for level in vocal_levels}
+    return analysis
+
+def mix_powers(analysis, vocal_level):
+    """Per-hop power of accompaniment + vocal_level * vocals, from a stored analysis"""
+    power_v = 10 ** (np.asarray(analysis['envelopes']['vocals']) / 10)
+    power_a = 10 ** (np.asarray(analysis['envelopes']['accompaniment']) / 10)
+    cross = np.asarray(analysis['correlation']) * np.sqrt(power_v * power_a)
+    return np.maximum(0.0, power_a + vocal_level ** 2 * power_v + 2 * vocal_level * cross)
+
+def mix_settings(analysis, vocal_level):
+    """Loudness, true peak and normalizing gain of the mix at vocal_level
+
+    The true peak is the measured one for levels analyzed up front, otherwise the
+    bound peak(accompaniment) + level * peak(vocals).
+    """
+    lufs = gated_loudness(mix_powers(analysis, vocal_level))
+    peak = analysis['mix_true_peaks'].get(level_key(vocal_level))
+    if peak is None:
+        stems = analysis['stems']
+        peak = _db(10 ** (stems['accompaniment']['true_peak_db'] / 20) +
+                   vocal_level * 10 ** (stems['vocals']['true_peak_db'] / 20))
+    gain_db = 0.0 if lufs is None else min(MAX_GAIN_DB, analysis['target_lufs'] - lufs)
+    gain_db = min(gain_db, analysis['true_peak_ceiling'] - peak)
+    return {'vocal_level': vocal_level, 'integrated_lufs': _round(lufs), 'true_peak_db': peak,
+            'gain_db': round(gain_db, 2)}
+
+def mix_gain(analysis, vocal_level):
+    """Linear gain for accompaniment + vocal_level * vocals"""
+    settings = analysis.get('mixes', {}).get(level_key(vocal_level)) or mix_settings(analysis, vocal_level)
+    return 10 ** (settings['gain_db'] / 20)
+
+def summary(analysis):
+    """The analysis without its per-hop arrays, for API responses and logs"""
+    return {key: value for key, value in analysis.items() if key not in ('envelopes', 'correlation')}
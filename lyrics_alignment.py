@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Lyrics Alignment
+Word timings for known lyric text from the vocal stem, without transcribing it.
+
+The vocal stem is reduced once to per-hop features (vectorized over all hops): a
+voice-activity probability from the band-limited energy and an onset strength from
+the spectral flux. The lyric words then go through a left-to-right HMM
+
+    gap_0 -> word_1 -> gap_1 -> word_2 -> ... -> word_K -> gap_K
+
+(gaps may be skipped) decoded with Viterbi. Words emit voiced hops and gaps unvoiced
+ones, entering a word is rewarded at onsets, and word durations follow the syllable
+count. The search is banded around the position expected from the cumulative voiced
+time, so it costs O(hops x band) instead of O(hops x words).
+"""
+import os
+import re
+from functools import lru_cache
+import numpy as np
+from stem_store import open_wav, to_float
+from word_timing import Word, Transcript
+
+HOP_SECONDS = 0.02
+VOICE_BAND_HZ = (150.0, 4000.0)
+ONSET_CONTEXT_SECONDS = 0.25
+FLUX_FLOOR_DB = 50.0                # spectral flux ignores bins this far below the loudest
+SYLLABLE_SECONDS = (0.12, 0.6)      # clamp for the per-song syllable length estimate
+GAP_SECONDS = 0.4                   # expected length of a pause between words
+MID_LINE_GAP_PENALTY = 3.0          # log cost of a pause inside a lyric line
+LINE_END_SKIP_PENALTY = 3.0         # log cost of running one lyric line into the next
+ONSET_WEIGHT = 3.0                  # log bonus for entering a word on a full-strength onset
+PRIOR_WEIGHT = 0.5                  # log cost per hop at the edge of the band
+BAND_WORDS = 24                     # minimum band half-width in words
+MIN_CONFIDENCE = 0.55               # mean voice activity under the aligned words
+SECTION_LINE = re.compile(r"^\s*[\[(].*[\])]\s*$")       # [Chorus], (x2)
+PUNCTUATION = ".,!?;:\"“”‘’'()[]{}…-–—*"
+LYRICS_HEADER = re.compile(r"^\s*lyrics\s*:?\s*$", re.IGNORECASE)
+# Links, tags and credits ("Produced by ...", "Director: ...") end a lyrics block
+NOT_LYRICS = re.compile(r"https?://|www\.|#\w|@\w|©|℗|\b(?:produced|written|directed|mixed|mastered|performed) by\b"
+                        r"|^\s*[A-Z][\w &/]{0,30}:\s", re.IGNORECASE)
+
+def extract_lyrics(description, min_lines=4):
+    """Lyric text following a 'Lyrics:' line in a video description, or None"""
+    lines = (description or '').splitlines()
+    start = next((i + 1 for i, line in enumerate(lines) if LYRICS_HEADER.match(line)), None)
+    if start is None:
+        return None
+    lyrics = []
+    for line in lines[start:]:
+        if NOT_LYRICS.search(line):
+            break
+        lyrics.append(line.rstrip())
+    lyrics = [line for line in lyrics if line.strip()]
+    return "\n".join(lyrics) if len(lyrics) >= min_lines else None
+
+def lyric_lines(text):
+    """Sung lines of lyric text as word lists; section labels and punctuation are dropped"""
+    lines = []
+    for line in text.splitlines():
+        if SECTION_LINE.match(line):
+            continue
+        words = [token.strip(PUNCTUATION) for token in line.split()]
+        words = [word for word in words if word]
+        if words:
+            lines.append(words)
+    return lines
+
+def tokenize_lyrics(text):
+    """Sung words of lyric text in order"""
+    return [word for line in lyric_lines(text) for word in line]
+
+def syllable_count(word):
+    """Syllables of a sung word, estimated from its spelling; at least 1"""
+    lower = word.lower()
+    if all(ord(c) < 0x250 for c in lower):
+        count = len(re.findall(r"[aeiouy]+", lower))
+        # Silent final e ('time', 'comes', 'loved') unless it is sung ('little', 'free', 'wanted')
+        if count > 1 and (re.search(r"[^aeiouy]e[sd]?$", lower) and not re.search(r"(?:le|[td]ed|[sxz]es|[cs]hes)$", lower)):
+            count -= 1
+        return max(1, count)
+    letters = sum(1 for c in word if c.isalpha())
+    # Brahmic (Devanagari to Sinhala, incl. Gurmukhi) and CJK letters are about a syllable each
+    if any('\u0900' <= c <= '\u0dff' or c >= '\u3040' for c in word):
+        return max(1, letters)
+    return max(1, int(round(letters / 2.5)))
+
+def vocal_features(samples, sample_rate, hop_seconds=HOP_SECONDS):
+    """(activity, onset) per hop: voice-activity probability and normalized onset strength in [0, 1]"""
+    hop = max(1, int(hop_seconds * sample_rate))
+    frames = len(samples) // hop
+    mono = np.zeros(frames * hop, dtype=np.float32)
+    # Mono downmix block by block so a mapped stem is never converted whole
+    for start in range(0, frames * hop, hop * 4096):
+        block = to_float(samples[start:min(frames * hop, start + hop * 4096)])
+        mono[start:start + len(block)] = block.mean(axis=1) if block.ndim == 2 else block
+    spectra = np.abs(np.fft.rfft(mono.reshape(frames, hop) * np.hanning(hop).astype(np.float32), axis=1))
+    freqs = np.fft.rfftfreq(hop, 1.0 / sample_rate)
+    band = (freqs >= VOICE_BAND_HZ[0]) & (freqs <= VOICE_BAND_HZ[1])
+    voice = spectra[:, band]
+    level = 10 * np.log10(np.mean(voice ** 2, axis=1) + 1e-12)
+    floor, peak = np.percentile(level, [10, 95])
+    threshold = floor + 0.35 * max(peak - floor, 1e-6)
+    activity = 1.0 / (1.0 + np.exp(-(level - threshold) / 3.0))
+    # Bins under the floor are constant, so background noise and bleed add no flux
+    log_spec = np.log(np.maximum(voice, voice.max() * 10 ** (-FLUX_FLOOR_DB / 20) + 1e-12))
+    flux = np.zeros(frames)
+    flux[1:] = np.maximum(log_spec[1:] - log_spec[:-1], 0).sum(axis=1)
+    # Onsets stand out against the flux of the surrounding ONSET_CONTEXT_SECONDS
+    context = max(1, int(ONSET_CONTEXT_SECONDS / hop_seconds))
+    running = np.concatenate([[0.0], np.cumsum(flux)])
+    lo, hi = np.clip(np.arange(frames) - context, 0, frames), np.clip(np.arange(frames) + context + 1, 0, frames)
+    flux = np.maximum(flux - (running[hi] - running[lo]) / np.maximum(hi - lo, 1), 0)
+    # Only local peaks count, so one onset smeared over two hops cannot start two words
+    peaks = np.zeros(frames, dtype=bool)
+    peaks[1:-1] = (flux[1:-1] >= flux[:-2]) & (flux[1:-1] > flux[2:])
+    flux = np.where(peaks, flux, 0.0)
+    scale = np.percentile(flux, 99) if frames else 0
+    onset = np.clip(flux / scale, 0, 1) if scale > 0 else flux
+    return activity, onset
+
+@lru_cache(maxsize=4)
+def _stem_features(path, size, mtime_ns):
+    stem = open_wav(path)
+    return vocal_features(stem.samples, stem.sample_rate)
+
+def stem_features(vocals_path):
+    """vocal_features of a stem WAV, memoized per file version (alignment and refinement share them)"""
+    stat = os.stat(vocals_path)
+    return _stem_features(os.path.abspath(vocals_path), stat.st_size, stat.st_mtime_ns)
+
+def _band(centers, half, states):
+    """First state of each hop's band, non-decreasing and inside [0, states - width]"""
+    width = min(states, 2 * half + 1)
+    lo = np.clip(np.round(centers).astype(int) - half, 0, states - width)
+    return np.maximum.accumulate(lo), width
+
+def viterbi_align(syllables, line_ends, activity, onset, hop_seconds=HOP_SECONDS):
+    """Hop index spans [(first, last)] of each word, or None when the words cannot fit
+
+    line_ends flags the words that end a lyric line; pauses are expected after those.
+    """
+    words, hops = len(syllables), len(activity)
+    if words == 0 or hops < words:
+        return None
+    states = 2 * words + 1
+    is_word = np.arange(states) % 2 == 1
+    voiced = float(activity.sum())
+    syllable_hops = np.clip(voiced / max(1, sum(syllables)), SYLLABLE_SECONDS[0] / hop_seconds,
+                            SYLLABLE_SECONDS[1] / hop_seconds)
+    expected = np.full(states, GAP_SECONDS / hop_seconds)
+    expected[is_word] = np.maximum(2.0, np.asarray(syllables) * syllable_hops)
+    stay = np.log1p(-1.0 / expected)
+    advance = np.log(1.0 / expected)
+    # Extra cost of entering gap s (even) from its word, and of skipping it into word s + 1
+    line_end = np.zeros(states, dtype=bool)
+    line_end[2::2] = np.asarray(line_ends, dtype=bool)
+    enter_gap = np.where(line_end, 0.0, -MID_LINE_GAP_PENALTY)
+    skip_gap = np.where(line_end, -LINE_END_SKIP_PENALTY, 0.0)
+
+    # Expected state per hop: words spread over the voiced time in proportion to their syllables
+    edges = np.concatenate([[0.0], np.cumsum(syllables)]) / max(1, sum(syllables))
+    voiced_fraction = np.cumsum(activity) / max(voiced, 1e-9)
+    centers = 2 * np.interp(voiced_fraction, edges, np.arange(words + 1))
+    half = max(2 * BAND_WORDS, int(0.15 * states))
+    lo, width = _band(centers, half, states)
+
+    emit_word = np.log(activity + 1e-6)
+    emit_gap = np.log(1.0 - activity + 1e-6)
+    back = np.zeros((hops, width), dtype=np.int8)
+    neg = -np.inf
+    offsets = np.arange(width)
+
+    def emissions(t, s):
+        prior = -PRIOR_WEIGHT * ((s - centers[t]) / half) ** 2
+        return np.where(is_word[s], emit_word[t], emit_gap[t]) + prior
+
+    s = lo[0] + offsets
+    score = np.full(width, neg)
+    first = (s <= 1)
+    score[first] = emissions(0, s[first]) + np.where(is_word[s[first]], ONSET_WEIGHT * onset[0], 0)
+    for t in range(1, hops):
+        shift = lo[t] - lo[t - 1]
+        s = lo[t] + offsets
+        padded = np.concatenate([[neg, neg], score, np.full(shift + 1, neg)])
+        source = offsets + shift + 2           # index of state s in padded (previous band)
+        from_stay = padded[source] + stay[s]
+        entry_bonus = np.where(is_word[s], ONSET_WEIGHT * onset[t], 0.0)
+        from_advance = padded[source - 1] + advance[np.maximum(s - 1, 0)] + np.where(is_word[s], entry_bonus,
+                                                                                      enter_gap[s])
+        from_skip = np.where(is_word[s] & (s >= 3),
+                             padded[source - 2] + advance[np.maximum(s - 2, 0)] + skip_gap[s - 1] + entry_bonus, neg)
+        moves = np.stack([from_stay, from_advance, from_skip])
+        best = np.argmax(moves, axis=0)
+        score = moves[best, offsets] + emissions(t, s)
+        back[t] = best
+
+    last = lo[-1] + offsets
+    final = np.where(last >= states - 2, score, neg)
+    if not np.isfinite(final.max()):
+        return None
+    state = int(last[np.argmax(final)])
+    path = np.empty(hops, dtype=np.int64)
+    for t in range(hops - 1, 0, -1):
+        path[t] = state
+        state -= int(back[t, state - lo[t]])
+    path[0] = state
+    spans = []
+    for k in range(words):
+        where = np.flatnonzero(path == 2 * k + 1)
+        if len(where) == 0:
+            return None
+        spans.append((int(where[0]), int(where[-1])))
+    return spans
+
+def align(lines, samples, sample_rate, hop_seconds=HOP_SECONDS, features=None):
+    """(Transcript, confidence) for lyric lines against vocal samples; (None, 0.0) when they cannot fit
+
+    features: precomputed (activity, onset) of the samples.
+    """
+    words = [word for line in lines for word in line]
+    line_ends = [i == len(line) - 1 for line in lines for i in range(len(line))]
+    activity, onset = features or vocal_features(samples, sample_rate, hop_seconds)
+    spans = viterbi_align([syllable_count(w) for w in words], line_ends, activity, onset, hop_seconds)
+    if spans is None:
+        return None, 0.0
+    timed = [Word(word, first * hop_seconds, (last + 1) * hop_seconds) for word, (first, last) in zip(words, spans)]
+    confidence = float(np.mean([activity[first:last + 1].mean() for first, last in spans]))
+    return Transcript(timed, " ".join(words)), confidence
+
+def align_lyrics(vocals_path, lyrics, min_confidence=MIN_CONFIDENCE):
+    """Transcript of known lyrics aligned to a vocal stem WAV, or None when the alignment is not trustworthy"""
+    lines = lyric_lines(lyrics or '')
+    if not lines:
+        return None
+    transcript, confidence = align(lines, None, None, features=stem_features(vocals_path))
+    if transcript is None or confidence < min_confidence:
+        print(f"⚠️ Lyrics alignment rejected (confidence {confidence:.2f})")
+        return None
+    print(f"✅ Aligned {len(transcript.words)} lyric words (confidence {confidence:.2f})")
+    return transcript
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Media Probe
+Duration, streams and codecs of a media file or URL from its container headers,
+without decoding it: WAVs the stem store can map are read directly, everything
+else goes through one `ffprobe -print_format json` call.
+
+Results are memoized per (path, size, mtime) for files and per (URL, ETag) for URLs,
+so every stage that needs media facts can call probe() instead of passing them around.
+"""
+import os
+import json
+import threading
+from collections import OrderedDict
+from pipeline_profiler import run_subprocess
+
+FFPROBE = os.getenv('FFPROBE_PATH', 'ffprobe')
+CACHE_SIZE = 256
+HEAD_TIMEOUT = 10
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+class MediaProbeError(ValueError):
+    """ffprobe could not read the input (missing, not media, or ffprobe itself failed)"""
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+def _rate(value):
+    """ffprobe's '30000/1001' frame rates as a float; None for '0/0'"""
+    if not value or '/' not in value:
+        return _number(value)
+    num, den = (_number(part) for part in value.split('/', 1))
+    return num / den if num and den else None
+
+class StreamInfo:
+    """One stream of a container; video-only fields are None for audio and vice versa"""
+
+    __slots__ = ('index', 'type', 'codec', 'duration', 'sample_rate', 'channels', 'width', 'height', 'fps')
+
+    def __init__(self, index, type, codec, duration=None, sample_rate=None, channels=None,
+                 width=None, height=None, fps=None):
+        self.index = index
+        self.type = type
+        self.codec = codec
+        self.duration = duration
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    @classmethod
+    def from_ffprobe(cls, stream):
+        return cls(stream.get('index'), stream.get('codec_type'), stream.get('codec_name'),
+                   duration=_number(stream.get('duration')),
+                   sample_rate=_number(stream.get('sample_rate'), int),
+                   channels=_number(stream.get('channels'), int),
+                   width=_number(stream.get('width'), int),
+                   height=_number(stream.get('height'), int),
+                   fps=_rate(stream.get('avg_frame_rate')) or _rate(stream.get('r_frame_rate')))
+
+    def __repr__(self):
+        return f"StreamInfo({self.index}, {self.type!r}, {self.codec!r})"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+class MediaInfo:
+    """Container-level facts plus its streams"""
+
+    def __init__(self, source, duration, format_name=None, bit_rate=None, size=None, streams=()):
+        self.source = source
+        self.duration = duration
+        self.format_name = format_name
+        self.bit_rate = bit_rate
+        self.size = size
+        self.streams = list(streams)
+
+    def __repr__(self):
+        return f"MediaInfo({self.source!r}, {self.duration}s, {[s.type for s in self.streams]})"
+
+    def _first(self, stream_type):
+        return next((s for s in self.streams if s.type == stream_type), None)
+
+    @property
+    def audio(self):
+        """First audio stream, or None"""
+        return self._first('audio')
+
+    @property
+    def video(self):
+        """First video stream, or None"""
+        return self._first('video')
+
+    @property
+    def sample_rate(self):
+        return self.audio.sample_rate if self.audio else None
+
+    @property
+    def channels(self):
+        return self.audio.channels if self.audio else None
+
+    @property
+    def resolution(self):
+        """(width, height) of the first video stream, or None"""
+        return (self.video.width, self.video.height) if self.video else None
+
+    @property
+    def fps(self):
+        return self.video.fps if self.video else None
+
+    def to_dict(self):
+        return {'duration': self.duration, 'format': self.format_name, 'bit_rate': self.bit_rate,
+                'size': self.size, 'streams': [s.to_dict() for s in self.streams]}
+
+def from_ffprobe(source, data):
+    """MediaInfo from ffprobe's -show_format -show_streams JSON"""
+    fmt = data.get('format', {})
+    streams = [StreamInfo.from_ffprobe(s) for s in data.get('streams', [])]
+    duration = _number(fmt.get('duration'))
+    if duration is None:
+        duration = max((s.duration for s in streams if s.duration is not None), default=None)
+    return MediaInfo(source, duration, fmt.get('format_name'), _number(fmt.get('bit_rate'), int),
+                     _number(fmt.get('size'), int), streams)
+
+def _probe_wav(path):
+    """MediaInfo from a WAV header the stem store can map, or None"""
+    if not path.lower().endswith('.wav'):
+        return None
+    from stem_store import try_open
+    stem = try_open(path)
+    if stem is None:
+        return None
+    codec = 'pcm_s16le' if stem.samples.dtype.kind == 'i' else 'pcm_f32le'
+    stream = StreamInfo(0, 'audio', codec, duration=stem.seconds, sample_rate=stem.sample_rate,
+                        channels=stem.channels)
+    return MediaInfo(path, stem.seconds, 'wav', size=os.path.getsize(path), streams=[stream])
+
+def _run_ffprobe(source, ffprobe):
+    try:
+        result = run_subprocess([ffprobe, '-v', 'error', '-print_format', 'json',
+                                 '-show_format', '-show_streams', source])
+    except OSError as e:
+        raise MediaProbeError(f"cannot run {ffprobe}: {e}")
+    if result.returncode != 0:
+        raise MediaProbeError(f"ffprobe failed on {source}: {result.stderr.strip()[-300:]}")
+    try:
+        return from_ffprobe(source, json.loads(result.stdout))
+    except ValueError:
+        raise MediaProbeError(f"ffprobe returned unreadable output for {source}")
+
+def is_url(source):
+    return source.startswith(('http://', 'https://'))
+
+def cache_key(source):
+    """(source, version) identifying this content, or None when it cannot be pinned down"""
+    if is_url(source):
+        import requests
+        try:
+            response = requests.head(source, allow_redirects=True, timeout=HEAD_TIMEOUT)
+        except requests.RequestException:
+            return None
+        version = response.headers.get('ETag') or response.headers.get('Last-Modified')
+        return (source, version) if response.ok and version else None
+    stat = os.stat(source)
+    return (os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+
+def probe(source, ffprobe=FFPROBE):
+    """MediaInfo for a path or URL; raises MediaProbeError when it cannot be read"""
+    source = os.fspath(source)
+    if not is_url(source) and not os.path.exists(source):
+        raise MediaProbeError(f"{source} does not exist")
+    key = cache_key(source)
+    if key is not None:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+    info = (None if is_url(source) else _probe_wav(source)) or _run_ffprobe(source, ffprobe)
+    if key is not None:
+        with _cache_lock:
+            _cache[key] = info
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return info
+
+def duration(source, ffprobe=FFPROBE):
+    """Duration in seconds, or None when the input cannot be probed"""
+    try:
+        return probe(source, ffprobe).duration
+    except MediaProbeError as e:
+        print(f"⚠️ {e}")
+        return None
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Pipeline Engine
+Runs a karaoke job as a DAG of stages: each stage declares the artifacts it consumes
+and produces, independent branches run concurrently on a thread pool, artifacts are
+passed in memory, and hooks add profiling and caching around every stage
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pipeline_profiler import use_profiler
+
+class PipelineError(Exception):
+    """Raised for an invalid stage graph"""
+
+class StageFailed(Exception):
+    """A stage produced None for one of its outputs"""
+
+class Stage:
+    """One unit of work: func(**inputs) returns its outputs
+
+    A stage with a single output may return the value directly; otherwise it returns a
+    tuple in the order of `outputs` or a dict keyed by output name. Returning None for
+    any output marks the stage as failed and skips everything that depends on it.
+
+    `cache` is False, True, or a hashable of the settings `func` closes over (backend,
+    limits, ...); cache hooks key on it alongside the inputs, so a stage built with
+    other settings never reuses these outputs.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), profile_as=None, cache=False):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.profile_as = profile_as or name
+        self.cache = cache
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={self.inputs}, outputs={self.outputs})"
+
+    def unpack(self, value):
+        """Map a stage function's return value onto its declared outputs"""
+        if not self.outputs:
+            return {}
+        if isinstance(value, dict):
+            return {name: value.get(name) for name in self.outputs}
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: value}
+        if value is None:
+            return {name: None for name in self.outputs}
+        values = tuple(value)
+        if len(values) != len(self.outputs):
+            raise PipelineError(f"Stage {self.name} returned {len(values)} values for {len(self.outputs)} outputs")
+        return dict(zip(self.outputs, values))
+
+class PipelineHook:
+    """Extension point around each stage; the default does nothing
+
+    lookup() may return previously stored outputs to skip running a cacheable stage,
+    stage_context() wraps the stage call (and the lookup) on the worker thread,
+    produced() sees every stage's outputs inside that context, and store() sees
+    the outputs of cacheable stages that actually ran.
+    """
+
+    def lookup(self, stage, inputs):
+        return None
+
+    @contextmanager
+    def stage_context(self, stage, inputs):
+        yield None
+
+    def produced(self, stage, outputs):
+        pass
+
+    def store(self, stage, inputs, outputs):
+        pass
+
+class PipelineResult:
+    """Artifacts plus a per-stage record of what ran, failed, was skipped or cached"""
+
+    def __init__(self, artifacts, records, wall_seconds):
+        self.artifacts = artifacts
+        self.records = records
+        self.wall_seconds = wall_seconds
+
+    @property
+    def failed(self):
+        return [r for r in self.records if r['status'] == 'failed']
+
+    @property
+    def skipped(self):
+        return [r for r in self.records if r['status'] == 'skipped']
+
+    @property
+    def ok(self):
+        return not self.failed and not self.skipped
+
+    def status(self, stage_name):
+        return next((r['status'] for r in self.records if r['stage'] == stage_name), None)
+
+    def error(self):
+        """Error of the first stage that failed, if any"""
+        failed = self.failed
+        return failed[0].get('error') if failed else None
+
+    def get(self, name, default=None):
+        return self.artifacts.get(name, default)
+
+class Pipeline:
+    """A validated stage graph that can be run many times"""
+
+    def __init__(self, stages, max_workers=None):
+        self.stages = list(stages)
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 2)
+        self._validate()
+
+    def _validate(self):
+        names = set()
+        producers = {}
+        for stage in self.stages:
+            if stage.name in names:
+                raise PipelineError(f"Duplicate stage name: {stage.name}")
+            names.add(stage.name)
+            for output in stage.outputs:
+                if output in producers:
+                    raise PipelineError(f"Artifact {output} produced by both {producers[output]} and {stage.name}")
+                producers[output] = stage.name
+        self.producers = producers
+
+        # Reject cycles with a depth-first walk over producer edges
+        state = {}
+
+        def visit(stage):
+            if state.get(stage.name) == 'done':
+                return
+            if state.get(stage.name) == 'visiting':
+                raise PipelineError(f"Cycle through stage {stage.name}")
+            state[stage.name] = 'visiting'
+            for name in stage.inputs:
+                if name in producers:
+                    visit(self.stage(producers[name]))
+            state[stage.name] = 'done'
+
+        for stage in self.stages:
+            visit(stage)
+
+    def stage(self, name):
+        return next(s for s in self.stages if s.name == name)
+
+    def dependencies(self, stage):
+        """Names of the stages whose outputs this stage consumes"""
+        return {self.producers[name] for name in stage.inputs if name in self.producers}
+
+    def run(self, artifacts=None, hooks=(), max_workers=None):
+        """Run every stage whose inputs are available and return a PipelineResult
+
+        `artifacts` seeds the run with external inputs (URLs, paths, settings). A stage
+        runs as soon as all of its inputs exist; stages whose inputs can never appear
+        because an upstream stage failed are recorded as skipped.
+        """
+        artifacts = dict(artifacts or {})
+        records = {}
+        started = time.perf_counter()
+
+        missing = [(s.name, n) for s in self.stages for n in s.inputs
+                   if n not in self.producers and n not in artifacts]
+        if missing:
+            raise PipelineError("Missing pipeline inputs: " + ", ".join(f"{n} (for {s})" for s, n in missing))
+
+        pending = list(self.stages)
+        running = {}
+
+        def blocked(stage):
+            return any(records.get(dep, {}).get('status') in ('failed', 'skipped')
+                       for dep in self.dependencies(stage))
+
+        def ready(stage):
+            return all(name in artifacts for name in stage.inputs)
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers,
+                                thread_name_prefix='pipeline') as executor:
+            while pending or running:
+                # Skips cascade, so rescan until nothing else becomes blocked
+                changed = True
+                while changed:
+                    changed = False
+                    for stage in list(pending):
+                        if blocked(stage):
+                            pending.remove(stage)
+                            changed = True
+                            failed_deps = sorted(d for d in self.dependencies(stage)
+                                                 if records.get(d, {}).get('status') in ('failed', 'skipped'))
+                            records[stage.name] = {'stage': stage.name, 'status': 'skipped',
+                                                   'reason': f"upstream {', '.join(failed_deps)} did not complete"}
+                        elif ready(stage):
+                            pending.remove(stage)
+                            inputs = {name: artifacts[name] for name in stage.inputs}
+                            running[executor.submit(self._run_stage, stage, inputs, hooks, started)] = stage
+
+                if not running:
+                    if pending:
+                        raise PipelineError("Stages can never run: " + ", ".join(s.name for s in pending))
+                    break
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    record, outputs = future.result()
+                    records[stage.name] = record
+                    if record['status'] in ('success', 'cached'):
+                        artifacts.update(outputs)
+
+        ordered = [records[s.name] for s in self.stages if s.name in records]
+        return PipelineResult(artifacts, ordered, round(time.perf_counter() - started, 3))
+
+    def _run_stage(self, stage, inputs, hooks, pipeline_started):
+        """Run one stage on a worker thread; never raises"""
+        record = {'stage': stage.name, 'status': 'success',
+                  'offset_seconds': round(time.perf_counter() - pipeline_started, 3)}
+        start = time.perf_counter()
+        outputs = {}
+        try:
+            with ExitStack() as stack:
+                for hook in hooks:
+                    stack.enter_context(hook.stage_context(stage, inputs))
+
+                cached = None
+                if stage.cache:
+                    cached = next((found for found in (h.lookup(stage, inputs) for h in hooks) if found is not None), None)
+
+                if cached is not None:
+                    outputs = cached
+                    record['status'] = 'cached'
+                else:
+                    outputs = stage.unpack(stage.func(**inputs))
+                    empty = [name for name, value in outputs.items() if value is None]
+                    if empty:
+                        raise StageFailed(f"produced no {', '.join(empty)}")
+                    if stage.cache:
+                        for hook in hooks:
+                            hook.store(stage, inputs, outputs)
+                for hook in hooks:
+                    hook.produced(stage, outputs)
+        except Exception as e:
+            outputs = {}
+            record['status'] = 'failed'
+            record['error'] = f"{stage.name}: {e}"
+            record['error_type'] = type(e).__name__
+        record['wall_seconds'] = round(time.perf_counter() - start, 3)
+        return record, outputs
+
+def artifact_size(value):
+    """Bytes held by an artifact: file size for paths, nbytes for arrays, len for bytes"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, str) and os.path.isfile(value):
+        return os.path.getsize(value)
+    return 0
+
+class ProfilerHook(PipelineHook):
+    """Records every stage on a JobProfiler, including stages on worker threads
+
+    Input and output artifacts are counted as the stage's bytes in and out. CPU time
+    is the worker thread's own, so concurrent stages do not see each other's.
+    """
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self._local = threading.local()
+
+    @contextmanager
+    def stage_context(self, stage, inputs):
+        with use_profiler(self.profiler), self.profiler.stage(stage.profile_as) as timer:
+            for value in inputs.values():
+                timer.add_input(artifact_size(value))
+            self._local.timer = timer
+            try:
+                yield timer
+            finally:
+                self._local.timer = None
+
+    def produced(self, stage, outputs):
+        timer = getattr(self._local, 'timer', None)
+        if timer is not None:
+            for value in outputs.values():
+                timer.add_output(artifact_size(value))
+
+def file_digest(path, block_size=1024 * 1024):
+    """SHA-1 of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class MemoCacheHook(PipelineHook):
+    """In-process memo of cacheable stages keyed by stage name and input contents
+
+    File inputs are identified by a content digest, so the same audio in a different
+    job directory still hits. Cached file outputs are only reused while they exist.
+    Stages with an input that is neither a file, a container of them nor hashable
+    always run.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fingerprint(self, value):
+        """Hashable identity of an artifact; TypeError if it cannot be identified by content"""
+        if isinstance(value, str) and os.path.isfile(value):
+            stat = os.stat(value)
+            key = (value, stat.st_size, stat.st_mtime_ns)
+            with self._lock:
+                digest = self._digests.get(key)
+            if digest is None:
+                digest = file_digest(value)
+                with self._lock:
+                    self._digests[key] = digest
+                    if len(self._digests) > self.max_entries:
+                        self._digests.popitem(last=False)
+            return ('file', stat.st_size, digest)
+        if isinstance(value, (list, tuple)):
+            return tuple(self.fingerprint(v) for v in value)
+        if isinstance(value, dict):
+            return tuple(sorted((k, self.fingerprint(v)) for k, v in value.items()))
+        # Hashable values key by themselves; an id() would be reused once the object is freed
+        hash(value)
+        return value
+
+    def _key(self, stage, inputs):
+        """Cache key, or None when an input cannot be fingerprinted (the stage is not cached)"""
+        try:
+            return (stage.name, None if stage.cache is True else stage.cache, self.fingerprint(inputs))
+        except TypeError:
+            return None
+
+    def lookup(self, stage, inputs):
+        key = self._key(stage, inputs)
+        if key is None:
+            self.misses += 1
+            return None
+        with self._lock:
+            outputs = self.entries.get(key)
+            if outputs is not None:
+                self.entries.move_to_end(key)
+        if outputs is not None and all(not isinstance(v, str) or not os.path.isabs(v) or os.path.exists(v)
+                                       for v in outputs.values()):
+            self.hits += 1
+            return dict(outputs)
+        self.misses += 1
+        return None
+
+    def store(self, stage, inputs, outputs):
+        key = self._key(stage, inputs)
+        if key is None:
+            return
+        with self._lock:
+            self.entries[key] = dict(outputs)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Pipeline Stage Profiler
+Records wall time, CPU time, peak RSS, bytes in/out and child-process usage
+for each stage of a karaoke job, and exposes Prometheus-style metrics
+
+A stage's CPU time is that of the thread running it, and its child CPU time is the
+sum over the processes it started through run_subprocess (each reaped with wait4),
+so stages running concurrently are not charged for each other.
+"""
+import os
+import json
+import time
+import resource
+import threading
+import subprocess
+from contextlib import contextmanager
+
+# Canonical stage names shared by every pipeline
+STAGES = ('download', 'decode', 'separate', 'analyze', 'encode', 'upload', 'transcribe', 'subtitle', 'mix', 'render')
+
+# Upper bounds (seconds) for the stage duration histogram
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+_local = threading.local()
+_metrics_lock = threading.Lock()
+
+def _rss_bytes():
+    """Current resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return _peak_rss_bytes(resource.RUSAGE_SELF)
+
+def _peak_rss_bytes(who):
+    """Peak RSS reported by getrusage (KB on Linux, bytes on macOS)"""
+    return _maxrss_bytes(resource.getrusage(who))
+
+def _cpu_seconds(usage):
+    return usage.ru_utime + usage.ru_stime
+
+def _maxrss_bytes(usage):
+    return usage.ru_maxrss if os.uname().sysname == 'Darwin' else usage.ru_maxrss * 1024
+
+def _size_of(path_or_bytes):
+    if isinstance(path_or_bytes, int):
+        return path_or_bytes
+    if path_or_bytes and os.path.isfile(path_or_bytes):
+        return os.path.getsize(path_or_bytes)
+    return 0
+
+class _Metrics:
+    """Process-wide counters rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, labels, value=1.0):
+        key = (name, tuple(sorted(labels.items())))
+        with _metrics_lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def add_gauge(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with _metrics_lock:
+            self.gauges[key] = self.gauges.get(key, 0.0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with _metrics_lock:
+            buckets, total, count = self.histograms.get(key, ([0] * len(DURATION_BUCKETS), 0.0, 0))
+            buckets = [n + (1 if value <= bound else 0) for n, bound in zip(buckets, DURATION_BUCKETS)]
+            self.histograms[key] = (buckets, total + value, count + 1)
+
+    def render(self):
+        with _metrics_lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = dict(self.histograms)
+
+        lines = []
+        for name in sorted({key[0] for key in counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+        for name in sorted({key[0] for key in gauges}):
+            lines.append(f"# TYPE {name} gauge")
+            for (metric, labels), value in sorted(gauges.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+        for name in sorted({key[0] for key in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, n in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {n}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        lines.extend([
+            "# TYPE process_cpu_seconds_total counter",
+            f"process_cpu_seconds_total {_cpu_seconds(self_usage):g}",
+            "# TYPE process_children_cpu_seconds_total counter",
+            f"process_children_cpu_seconds_total {_cpu_seconds(child_usage):g}",
+            "# TYPE process_resident_memory_bytes gauge",
+            f"process_resident_memory_bytes {_rss_bytes()}",
+            "# TYPE process_peak_resident_memory_bytes gauge",
+            f"process_peak_resident_memory_bytes {_peak_rss_bytes(resource.RUSAGE_SELF)}",
+            "# TYPE process_children_peak_resident_memory_bytes gauge",
+            f"process_children_peak_resident_memory_bytes {_peak_rss_bytes(resource.RUSAGE_CHILDREN)}",
+        ])
+        return "\n".join(lines) + "\n"
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+METRICS = _Metrics()
+
+class StageTimer:
+    """Resource accounting for a single pipeline stage (on the thread that runs it)"""
+
+    def __init__(self, name, job_started):
+        self.name = name
+        self.offset = time.time() - job_started
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.subprocesses = []
+        self.status = 'success'
+        self.error = None
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+        self._child_cpu = 0.0
+        self._child_peak = 0
+        self._rss_start = _rss_bytes()
+        self.record = None
+
+    def add_input(self, path_or_bytes):
+        """Count a file (by path) or a byte count as consumed by this stage"""
+        self.bytes_in += _size_of(path_or_bytes)
+
+    def add_output(self, path_or_bytes):
+        """Count a file (by path) or a byte count as produced by this stage"""
+        self.bytes_out += _size_of(path_or_bytes)
+
+    def add_subprocess(self, cmd, returncode, seconds, usage=None):
+        """Record a finished child process; `usage` is its own rusage (from wait4)"""
+        entry = {
+            'command': os.path.basename(str(cmd[0])) if cmd else '',
+            'returncode': returncode,
+            'seconds': round(seconds, 3)
+        }
+        if usage is not None:
+            entry['cpu_seconds'] = round(_cpu_seconds(usage), 3)
+            self._child_cpu += _cpu_seconds(usage)
+            self._child_peak = max(self._child_peak, _maxrss_bytes(usage))
+        self.subprocesses.append(entry)
+
+    def close(self):
+        self.record = {
+            'stage': self.name,
+            'offset_seconds': round(self.offset, 3),
+            'wall_seconds': round(time.perf_counter() - self._wall_start, 3),
+            'cpu_seconds': round(time.thread_time() - self._cpu_start, 3),
+            'child_cpu_seconds': round(self._child_cpu, 3),
+            'rss_start_mb': round(self._rss_start / (1024 * 1024), 1),
+            'rss_end_mb': round(_rss_bytes() / (1024 * 1024), 1),
+            'peak_rss_mb': round(_peak_rss_bytes(resource.RUSAGE_SELF) / (1024 * 1024), 1),
+            'child_peak_rss_mb': round(self._child_peak / (1024 * 1024), 1),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'subprocesses': self.subprocesses,
+            'status': self.status
+        }
+        if self.error:
+            self.record['error'] = self.error
+        return self.record
+
+class _NullStage:
+    """Stage stand-in used when no job profiler is active"""
+
+    def add_input(self, path_or_bytes):
+        pass
+
+    def add_output(self, path_or_bytes):
+        pass
+
+    def add_subprocess(self, cmd, returncode, seconds, usage=None):
+        pass
+
+class JobProfiler:
+    """Collects a per-job timeline of stage records"""
+
+    def __init__(self, job_id, service='karaoke'):
+        self.job_id = job_id
+        self.service = service
+        self.started_at = time.time()
+        self.finished_at = None
+        self.status = 'running'
+        self.error = None
+        self.stages = []
+        self.info = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        _local.profiler = self
+        METRICS.add_gauge('karaoke_jobs_in_flight', {'service': self.service}, 1)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.profiler = None
+        METRICS.add_gauge('karaoke_jobs_in_flight', {'service': self.service}, -1)
+        if exc is not None:
+            self.fail(str(exc))
+        self.finish()
+        return False
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work as the named stage"""
+        timer = StageTimer(name, self.started_at)
+        previous = getattr(_local, 'stage', None)
+        _local.stage = timer
+        try:
+            yield timer
+        except Exception as e:
+            timer.status = 'error'
+            timer.error = str(e)
+            raise
+        finally:
+            _local.stage = previous
+            record = timer.close()
+            with self._lock:
+                self.stages.append(record)
+            labels = {'service': self.service, 'stage': name}
+            METRICS.inc('karaoke_stage_runs_total', dict(labels, status=record['status']))
+            METRICS.observe('karaoke_stage_wall_seconds', labels, record['wall_seconds'])
+            METRICS.inc('karaoke_stage_cpu_seconds_total', labels, record['cpu_seconds'])
+            METRICS.inc('karaoke_stage_child_cpu_seconds_total', labels, record['child_cpu_seconds'])
+            METRICS.inc('karaoke_stage_bytes_in_total', labels, record['bytes_in'])
+            METRICS.inc('karaoke_stage_bytes_out_total', labels, record['bytes_out'])
+
+    def annotate(self, **fields):
+        """Attach extra job-level fields (e.g. workspace usage) to the timeline"""
+        with self._lock:
+            self.info.update(fields)
+
+    def fail(self, error):
+        """Mark the job as failed (used for early error returns)"""
+        self.status = 'failed'
+        self.error = error
+
+    def finish(self):
+        if self.finished_at is not None:
+            return self.timeline()
+        self.finished_at = time.time()
+        if self.status == 'running':
+            self.status = 'success'
+        METRICS.inc('karaoke_jobs_total', {'service': self.service, 'status': self.status})
+        METRICS.observe('karaoke_job_wall_seconds', {'service': self.service}, self.finished_at - self.started_at)
+        return self.timeline()
+
+    def timeline(self):
+        """Per-job timeline as a JSON-serialisable dict"""
+        end = self.finished_at or time.time()
+        totals = {}
+        for record in self.stages:
+            total = totals.setdefault(record['stage'], {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'child_cpu_seconds': 0.0})
+            for field in total:
+                total[field] = round(total[field] + record[field], 3)
+
+        timeline = {
+            'job_id': self.job_id,
+            'service': self.service,
+            'status': self.status,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'wall_seconds': round(end - self.started_at, 3),
+            'peak_rss_mb': round(_peak_rss_bytes(resource.RUSAGE_SELF) / (1024 * 1024), 1),
+            'stage_totals': totals,
+            'stages': list(self.stages)
+        }
+        timeline.update(self.info)
+        if self.error:
+            timeline['error'] = self.error
+        return timeline
+
+    def save(self, path):
+        """Write the timeline JSON to a local file and return its path"""
+        with open(path, 'w') as f:
+            json.dump(self.timeline(), f, indent=2)
+        return path
+
+def current_profiler():
+    """The job profiler active on this thread, if any"""
+    return getattr(_local, 'profiler', None)
+
+@contextmanager
+def use_profiler(profiler):
+    """Make `profiler` the active job profiler on this thread (e.g. a pipeline worker)"""
+    previous = getattr(_local, 'profiler', None)
+    _local.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _local.profiler = previous
+
+@contextmanager
+def profile_stage(name):
+    """Time a stage against the active job profiler, or do nothing without one"""
+    profiler = current_profiler()
+    if profiler is None:
+        yield _NullStage()
+        return
+    with profiler.stage(name) as timer:
+        yield timer
+
+class _RusagePopen(subprocess.Popen):
+    """Popen that keeps the child's own rusage when it is reaped (wait4 instead of waitpid)"""
+
+    rusage = None
+
+    def _try_wait(self, wait_flags):
+        try:
+            pid, status, usage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            # Reaped elsewhere (e.g. SIGCHLD ignored); same fallback as Popen._try_wait
+            return self.pid, 0
+        if pid == self.pid:
+            self.rusage = usage
+        return pid, status
+
+def _run(cmd, input=None, capture_output=False, timeout=None, check=False, **kwargs):
+    """subprocess.run that also returns the child's rusage (None where wait4 is missing)"""
+    if not hasattr(os, 'wait4'):
+        return subprocess.run(cmd, input=input, capture_output=capture_output, timeout=timeout,
+                              check=check, **kwargs), None
+    if input is not None:
+        kwargs['stdin'] = subprocess.PIPE
+    if capture_output:
+        kwargs['stdout'] = kwargs['stderr'] = subprocess.PIPE
+    with _RusagePopen(cmd, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(input, timeout=timeout)
+        except BaseException:
+            process.kill()
+            raise
+        returncode = process.wait()
+    result = subprocess.CompletedProcess(process.args, returncode, stdout, stderr)
+    if check:
+        result.check_returncode()
+    return result, process.rusage
+
+def run_subprocess(cmd, **kwargs):
+    """subprocess.run wrapper that records return code, duration and CPU on the current stage"""
+    kwargs.setdefault('capture_output', True)
+    kwargs.setdefault('text', True)
+    start = time.perf_counter()
+    result, usage = _run(cmd, **kwargs)
+    stage = getattr(_local, 'stage', None)
+    if stage is not None:
+        stage.add_subprocess(cmd, result.returncode, time.perf_counter() - start, usage)
+    if result.returncode != 0:
+        METRICS.inc('karaoke_subprocess_failures_total', {'command': os.path.basename(str(cmd[0]))})
+    return result
+
+def render_metrics():
+    """Prometheus text exposition of all metrics collected in this process"""
+    return METRICS.render()
@@ -5,18 +5,22 @@ Takes downloaded video URL and creates karaoke versions
 """
 import os
 import tempfile
-import subprocess
-import uuid
 import json
 import time
-from flask import Flask, request, jsonify
-import openai
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify, Response
 import requests
-from google.cloud import storage
-import numpy as np
-import librosa
-import soundfile as sf
-from spleeter.separator import Separator
+from pipeline_profiler import JobProfiler, profile_stage, use_profiler, current_profiler, run_subprocess, render_metrics
+from pipeline_engine import Pipeline, Stage, ProfilerHook
+from job_workspace import JobWorkspace, WorkspaceHook, WorkspaceFull, sweep_stale
+from job_coalescing import JobCoalescer, GcsJobStore, job_key
+from batch_runner import BatchItem, run_batch, summarize
+from stem_models import DEFAULT_STEMS, GcsStemIndex, normalize_stems, choose_model, derive_stems, source_key
+from transcription_backends import get_backend, TRANSCRIPTION_BACKEND
+from timed_lyrics import write_timed_lyrics, CONTENT_TYPES as TIMED_LYRICS_TYPES
+from karaoke_stages import (transcribe_vocals, lyrics_or_transcription, refine_word_timing, write_subtitles,
+                            render_lyric_video, analyze_loudness, quietest_cut, SpeculativeTranscriber)
 
 app = Flask(__name__)
 
@@ -25,6 +29,89 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
 BUCKET_NAME = os.getenv('BUCKET_NAME', 'soniq-karaoke-videos')
 TEMP_DIR = tempfile.gettempdir()
 FFMPEG_PATH = os.getenv('FFMPEG_PATH', '/usr/bin/ffmpeg')  # Cloud Run path, configurable for local testing
+FFPROBE_PATH = os.getenv('FFPROBE_PATH', os.path.join(os.path.dirname(FFMPEG_PATH), 'ffprobe'))
+SERVICE_NAME = 'karaoke-processor'
+SPLEETER_MODEL = 'spleeter:2stems-16kHz'         # default model; requests for other stems pick theirs (stem_models)
+DEFAULT_VOCAL_LEVELS = [0.0, 0.25, 0.5]
+
+# /batch: songs decoded ahead of the separator, and audio seconds per Spleeter call
+BATCH_PREFETCH = int(os.getenv('BATCH_PREFETCH', '2'))
+BATCH_MAX_SECONDS = float(os.getenv('BATCH_MAX_SECONDS', '300'))
+BATCH_ATTACH_WORKERS = int(os.getenv('BATCH_ATTACH_WORKERS', '4'))   # items running elsewhere, waited on at once
+BATCH_GAP_SAMPLES = 44100
+
+# Uploaded stems: a chunked stem pack (flac, pcm16, opus) or 'wav' for the old full WAVs
+STEM_CODEC = os.getenv('STEM_CODEC', 'wav')
+
+# "transcribe": true jobs separate in windows of about this length (cut at quiet points)
+# and transcribe each finished vocal window while the next one is being separated
+SEPARATION_WINDOW_SECONDS = float(os.getenv('SEPARATION_WINDOW_SECONDS', '30'))
+
+# Heavy dependencies (TensorFlow via Spleeter, numpy, openai, google-cloud-storage)
+# are imported inside the stages that need them so /health answers as soon as Flask is up.
+# Shared per process; with PRELOAD_MODELS=1 gunicorn creates them in the master before fork
+_separators = {}
+_storage_client = None
+_separator_lock = threading.Lock()
+_storage_lock = threading.Lock()
+_ready = threading.Event()
+_started_at = time.time()
+_warm_up_error = None
+
+def get_separator(model=SPLEETER_MODEL):
+    """Process-wide Spleeter separator for a model, created on first use"""
+    with _separator_lock:
+        if model not in _separators:
+            print(f"🔧 Initializing Spleeter ({model})...")
+            from spleeter.separator import Separator
+            _separators[model] = Separator(model)
+        return _separators[model]
+
+def get_storage_client():
+    """Process-wide GCS client, created on first use"""
+    global _storage_client
+    with _storage_lock:
+        if _storage_client is None:
+            from google.cloud import storage
+            _storage_client = storage.Client()
+        return _storage_client
+
+def warm_up():
+    """Import stage dependencies and load the separator and storage client"""
+    import numpy, stem_store, openai  # noqa: F401 - imported for their load cost
+    get_separator()
+    try:
+        get_storage_client()
+    except Exception as e:
+        print(f"⚠️ Storage client not initialised during warm-up: {e}")
+
+def _background_warm_up():
+    global _warm_up_error
+    try:
+        removed = sweep_stale()
+        if removed:
+            print(f"🧹 Removed {removed} stale job workspaces")
+        warm_up()
+        # TensorFlow sessions are not fork-safe, so inference warm-up only ever runs in workers
+        if os.getenv('WARMUP_INFERENCE', '0') == '1':
+            import numpy as np
+            get_separator().separate(np.zeros((44100, 2), dtype=np.float32))
+        print(f"✅ Models ready after {time.time() - _started_at:.1f}s")
+    except Exception as e:
+        _warm_up_error = str(e)
+        print(f"❌ Warm-up failed: {e}")
+    finally:
+        _ready.set()
+
+def start_background_warm_up():
+    """Warm up on a daemon thread; /ready reports when it has finished"""
+    threading.Thread(target=_background_warm_up, name='warm-up', daemon=True).start()
+
+def after_fork():
+    """Called by gunicorn in each worker after fork"""
+    global _started_at
+    _started_at = time.time()
+    start_background_warm_up()
 
 def download_from_url(url, local_filename):
     """Download file from URL to local storage"""
@@ -41,14 +128,14 @@ def download_from_url(url, local_filename):
         print(f"❌ Download failed: {e}")
         return False
 
-def upload_to_gcs(local_path, gcs_filename):
+def upload_to_gcs(local_path, gcs_filename, content_type=None):
     """Upload file to Google Cloud Storage"""
     try:
-        client = storage.Client()
+        client = get_storage_client()
         bucket = client.bucket(BUCKET_NAME)
         blob = bucket.blob(f"karaoke/{gcs_filename}")
         
-        blob.upload_from_filename(local_path)
+        blob.upload_from_filename(local_path, content_type=content_type)
         blob.make_public()
         
         return f"https://storage.googleapis.com/{BUCKET_NAME}/karaoke/{gcs_filename}"
@@ -56,14 +143,23 @@ def upload_to_gcs(local_path, gcs_filename):
         print(f"❌ GCS upload failed: {e}")
         return None
 
-def python_spleeter_separation(video_path, test_duration=None):
-    """Use Python Spleeter library for audio separation"""
-    print("🎤 Python Spleeter Audio Separation")
-    
-    # Extract audio from video
-    audio_path = os.path.join(TEMP_DIR, "input_audio.wav")
+def decode_audio(video_path, audio_path, test_duration=None):
+    """Decode the video's audio into memory; returns (waveform, sample_rate)"""
+    from media_probe import probe, MediaProbeError
+    try:
+        media = probe(video_path, FFPROBE_PATH)
+    except MediaProbeError as e:
+        print(f"⚠️ Probe failed, decoding anyway: {e}")
+    else:
+        profiler = current_profiler()
+        if profiler is not None:
+            profiler.annotate(media=media.to_dict())
+        if media.audio is None:
+            print(f"❌ {os.path.basename(video_path)} has no audio stream")
+            return None, None
+        print(f"🎞️ {media.duration or 0:.1f}s, {media.audio.codec} {media.sample_rate}Hz"
+              f"{f', {media.video.width}x{media.video.height}' if media.video else ''}")
     print("🎵 Extracting audio from video...")
-    
     extract_cmd = [
         FFMPEG_PATH, '-i', video_path,
         '-vn', '-acodec', 'pcm_s16le', '-ar', '44100', '-ac', '2'
@@ -75,53 +171,148 @@ def python_spleeter_separation(video_path, test_duration=None):
         print(f"⏱️ Test mode: limiting to {test_duration} seconds")
     
     extract_cmd.extend([audio_path, '-y'])
-    
-    result = subprocess.run(extract_cmd, capture_output=True, text=True)
+    result = run_subprocess(extract_cmd)
     if not os.path.exists(audio_path):
         print("❌ Audio extraction failed")
         print(f"FFmpeg stderr: {result.stderr}")
         return None, None
     
+    # Map the 16-bit WAV ffmpeg just wrote and convert it once to float (no librosa decode/resample pass)
+    print("📂 Loading audio...")
+    from stem_store import open_wav, to_float
+    stem = open_wav(audio_path)
+    waveform, sample_rate = to_float(stem.samples).T, stem.sample_rate
+    del stem
+    os.remove(audio_path)
+    return waveform, sample_rate
+
+def stereo_frames(waveform):
+    """(time, 2) array in the layout Spleeter expects, from a (channels, time) or mono waveform"""
+    import numpy as np
+    
+    # Ensure stereo format
+    if len(waveform.shape) == 1:
+        waveform = np.array([waveform, waveform])
+    elif waveform.shape[0] == 1:
+        waveform = np.repeat(waveform, 2, axis=0)
+    
+    # Transpose for Spleeter (time, channels)
+    return waveform.T
+
+def stem_paths(workspace, stems):
+    """{stem: path} of the WAVs a job writes for its stems"""
+    return {stem: workspace.path(f"{stem}.wav") for stem in stems}
+
+def write_stems(prediction, sample_rate, paths):
+    """Write the stems named in paths ({stem: path}) as float32 WAVs that later stages memory-map
+
+    Stems of the prediction that are not in paths are never written; derived stems
+    (accompaniment, no_bass...) are summed from the model's stems (see stem_models).
+    """
+    from stem_store import write_wav
+    for stem, samples in derive_stems(prediction, list(paths)).items():
+        write_wav(paths[stem], samples, int(sample_rate))
+        print(f"💾 Saved {stem}: {paths[stem]}")
+    return paths
+
+def separate_waveform(waveform, sample_rate, paths, model=SPLEETER_MODEL, on_vocals=None):
+    """Run Spleeter on an in-memory waveform and write the stems in paths ({stem: path})
+
+    With on_vocals, the waveform is separated window by window (see separate_windows)
+    and on_vocals(block) receives each window's vocals as soon as it is separated.
+    """
+    separator = get_separator(model)
+    waveform = stereo_frames(waveform)
+    print(f"🎵 Audio shape: {waveform.shape}, Sample rate: {sample_rate}")
+    if on_vocals is not None:
+        return separate_windows(separator, waveform, sample_rate, paths, on_vocals)
+    
+    # Separate using Spleeter
+    print(f"🎤 Running Spleeter ML separation ({model})...")
+    prediction = separator.separate(waveform)
+    return write_stems(prediction, sample_rate, paths)
+
+def window_bounds(waveform, sample_rate, window_seconds=SEPARATION_WINDOW_SECONDS):
+    """(start, end) frames of consecutive windows, each cut at the quietest point before its nominal end"""
+    window = max(1, int(window_seconds * sample_rate))
+    bounds, start = [], 0
+    while start < len(waveform):
+        end = len(waveform) if len(waveform) - start <= window else quietest_cut(
+            waveform, sample_rate, start + window, min(window_seconds / 4, 5))
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+def separate_windows(separator, waveform, sample_rate, paths, on_vocals):
+    """Separate a (time, 2) waveform window by window into the stem WAVs of paths
+
+    Each window is written straight into its place in the memory-mapped stems, and its
+    vocals are handed to on_vocals before the next window starts.
+    """
+    from stem_store import create_wav
+    import numpy as np
+    outputs = {stem: create_wav(path, len(waveform), 2, int(sample_rate)) for stem, path in paths.items()}
+    bounds = window_bounds(waveform, sample_rate)
+    print(f"🎤 Running Spleeter ML separation in {len(bounds)} window(s)...")
+    for start, end in bounds:
+        prediction = separator.separate(waveform[start:end])
+        for stem, samples in derive_stems(prediction, list(paths)).items():
+            outputs[stem][start:start + len(samples)] = samples[:end - start]
+        on_vocals(prediction['vocals'][:end - start])
+    for stem, out in outputs.items():
+        if isinstance(out, np.memmap):
+            out.flush()
+        print(f"💾 Saved {stem}: {paths[stem]}")
+    return paths
+
+def separate_waveforms(waveforms, model=SPLEETER_MODEL):
+    """Separate several (time, 2) waveforms with a single Spleeter call
+
+    The inputs are joined with a second of silence between them, so the model runs
+    once per batch, and the stems are cut back apart. Returns one prediction per input.
+    """
+    import numpy as np
+    separator = get_separator(model)
+    gap = np.zeros((BATCH_GAP_SAMPLES, 2), dtype=waveforms[0].dtype)
+    pieces, spans, offset = [], [], 0
+    for waveform in waveforms:
+        if pieces:
+            pieces.append(gap)
+            offset += len(gap)
+        pieces.append(waveform)
+        spans.append((offset, offset + len(waveform)))
+        offset += len(waveform)
+    
+    print(f"🎤 Running Spleeter ML separation on {len(waveforms)} item(s), {offset / 44100:.0f}s of audio...")
+    prediction = separator.separate(np.concatenate(pieces) if len(pieces) > 1 else pieces[0])
+    return [{stem: audio[start:end] for stem, audio in prediction.items()} for start, end in spans]
+
+def python_spleeter_separation(video_path, test_duration=None, work_dir=None):
+    """Use Python Spleeter library for audio separation
+
+    The stems are written to work_dir (a fresh directory under TEMP_DIR when not
+    given), which the caller removes once it is done with them.
+    """
+    print("🎤 Python Spleeter Audio Separation")
+    work_dir = work_dir or tempfile.mkdtemp(prefix='separation_', dir=TEMP_DIR)
+    
     try:
-        # Initialize Spleeter separator
-        print("🔧 Initializing Spleeter...")
-        separator = Separator('spleeter:2stems-16kHz')
-        
-        # Load audio file
-        print("📂 Loading audio...")
-        waveform, sample_rate = librosa.load(audio_path, sr=44100, mono=False)
-        
-        # Ensure stereo format
-        if len(waveform.shape) == 1:
-            waveform = np.array([waveform, waveform])
-        elif waveform.shape[0] == 1:
-            waveform = np.repeat(waveform, 2, axis=0)
-        
-        # Transpose for Spleeter (time, channels)
-        waveform = waveform.T
-        
-        print(f"🎵 Audio shape: {waveform.shape}, Sample rate: {sample_rate}")
-        
-        # Separate using Spleeter
-        print("🎤 Running Spleeter ML separation...")
-        prediction = separator.separate(waveform)
-        
-        # Save separated tracks
-        vocals_path = os.path.join(TEMP_DIR, "vocals.wav")
-        accompaniment_path = os.path.join(TEMP_DIR, "accompaniment.wav")
-        
-        # Save vocals
-        vocals_audio = prediction['vocals']
-        sf.write(vocals_path, vocals_audio, sample_rate)
-        print(f"💾 Saved vocals: {vocals_path}")
-        
-        # Save accompaniment
-        accompaniment_audio = prediction['accompaniment']
-        sf.write(accompaniment_path, accompaniment_audio, sample_rate)
-        print(f"💾 Saved accompaniment: {accompaniment_path}")
-        
-        # Cleanup original audio
-        os.remove(audio_path)
+        with profile_stage('decode') as stage:
+            stage.add_input(video_path)
+            waveform, sample_rate = decode_audio(video_path, os.path.join(work_dir, "input_audio.wav"), test_duration)
+            if waveform is None:
+                return None, None
+            stage.add_output(waveform.nbytes)
+        
+        with profile_stage('separate') as stage:
+            stage.add_input(waveform.nbytes)
+            paths = separate_waveform(waveform, sample_rate, {
+                'vocals': os.path.join(work_dir, "vocals.wav"),
+                'accompaniment': os.path.join(work_dir, "accompaniment.wav"),
+            })
+            vocals_path, accompaniment_path = paths['vocals'], paths['accompaniment']
+            stage.add_output(vocals_path)
+            stage.add_output(accompaniment_path)
         
         print("✅ Python Spleeter separation successful!")
         return vocals_path, accompaniment_path
@@ -133,184 +324,58 @@ def python_spleeter_separation(video_path, test_duration=None):
         return None, None
 
 def transcribe_audio(audio_path):
-    """Transcribe audio using OpenAI Whisper"""
+    """Transcribe audio using OpenAI Whisper (chunked above the upload limit)"""
     print("🎙️ Transcribing with OpenAI Whisper...")
     
     try:
-        openai.api_key = OPENAI_API_KEY
-        
-        # Check file size and chunk if needed
-        file_size = os.path.getsize(audio_path)
-        if file_size > 20 * 1024 * 1024:  # 20MB limit
-            return transcribe_chunked(audio_path)
-        
-        with open(audio_path, 'rb') as audio_file:
-            transcript = openai.Audio.transcribe(
-                model="whisper-1",
-                file=audio_file,
-                response_format="verbose_json",
-                timestamp_granularities=["word"]
-            )
-        
-        print(f"✅ Transcribed: {len(transcript.words)} words")
+        with profile_stage('transcribe') as stage:
+            stage.add_input(audio_path)
+            transcript = transcribe_vocals(FFMPEG_PATH, audio_path, OPENAI_API_KEY,
+                                           backend=get_backend(api_key=OPENAI_API_KEY))
+        with profile_stage('analyze'):
+            transcript = refine_word_timing(transcript, audio_path)
+        
+        if transcript:
+            print(f"✅ Transcribed: {len(transcript.words)} words")
         return transcript
         
     except Exception as e:
         print(f"❌ Transcription failed: {e}")
         return None
 
-def transcribe_chunked(audio_path):
-    """Transcribe large audio files in chunks"""
-    print("📦 Chunking large audio file...")
-    
-    chunk_dir = os.path.join(TEMP_DIR, "audio_chunks")
-    os.makedirs(chunk_dir, exist_ok=True)
-    
-    # Split into 5-minute chunks
-    chunk_duration = 300
-    chunk_files = []
-    chunk_index = 0
-    start_time = 0
-    
-    while start_time < 600:  # Process up to 10 minutes
-        chunk_path = os.path.join(chunk_dir, f"chunk_{chunk_index:03d}.wav")
-        
-        chunk_cmd = [
-            FFMPEG_PATH, '-i', audio_path,
-            '-ss', str(start_time),
-            '-t', str(chunk_duration),
-            '-acodec', 'pcm_s16le',
-            chunk_path, '-y'
-        ]
-        
-        result = subprocess.run(chunk_cmd, capture_output=True, text=True)
-        
-        if os.path.exists(chunk_path) and os.path.getsize(chunk_path) > 1000:
-            chunk_files.append((start_time, chunk_path))
-            chunk_index += 1
-            start_time += chunk_duration
-        else:
-            break
-    
-    # Transcribe each chunk
-    all_words = []
-    
-    for start_offset, chunk_path in chunk_files:
-        try:
-            with open(chunk_path, 'rb') as audio_file:
-                transcript = openai.Audio.transcribe(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="verbose_json",
-                    timestamp_granularities=["word"]
-                )
-            
-            # Adjust timestamps
-            for word in transcript.words:
-                word.start += start_offset
-                word.end += start_offset
-                all_words.append(word)
-                
-            print(f"✅ Chunk transcribed: {len(transcript.words)} words")
-            
-        except Exception as e:
-            print(f"❌ Chunk failed: {e}")
-        
-        os.remove(chunk_path)
-    
-    # Return combined transcript
-    class CombinedTranscript:
-        def __init__(self, words):
-            self.words = words
-    
-    return CombinedTranscript(all_words)
+def align_transcript(vocals_path, lyrics):
+    """Known lyrics aligned to the vocal stem (transcribed when they do not fit), or None"""
+    return lyrics_or_transcription(FFMPEG_PATH, vocals_path, lyrics, OPENAI_API_KEY,
+                                   backend=get_backend(api_key=OPENAI_API_KEY))
 
-def create_karaoke_video(accompaniment_path, transcript, vocal_level, output_filename):
+def create_karaoke_video(accompaniment_path, transcript, vocal_level, output_filename, work_dir=None):
     """Create karaoke video with specified vocal level"""
     print(f"🎬 Creating karaoke video ({int(vocal_level*100)}% vocal)...")
     
     if not transcript or not transcript.words:
         return None
     
-    # Create ASS subtitle file
-    ass_path = os.path.join(TEMP_DIR, "karaoke_subtitles.ass")
+    work_dir = work_dir or TEMP_DIR
+    with profile_stage('subtitle') as stage:
+        ass_path = write_subtitles(transcript, os.path.join(work_dir, f"{os.path.splitext(output_filename)[0]}.ass"), 'lyrics')
+        stage.add_output(ass_path)
     
-    ass_content = """[Script Info]
-Title: Karaoke Video
-ScriptType: v4.00+
+    output_path = os.path.join(work_dir, output_filename)
+    with profile_stage('render') as stage:
+        stage.add_input(accompaniment_path)
+        output_path = render_lyric_video(FFMPEG_PATH, accompaniment_path, ass_path, output_path,
+                                         min(300, transcript.words[-1].end))
+        stage.add_output(output_path)
+    return output_path
 
-[V4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-Style: Default,Arial,28,&Hffffff,&Hffffff,&H000000,&H80000000,1,0,0,0,100,100,0,0,1,3,0,2,10,10,30,1
-
-[Events]
-Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
-"""
-    
-    # Group words into lines
-    lines = []
-    current_line = []
-    
-    for word in transcript.words:
-        current_line.append(word)
-        if len(current_line) >= 8 or (word.word.rstrip() and word.word.rstrip()[-1] in '.!?'):
-            if current_line:
-                lines.append(current_line)
-                current_line = []
-    
-    if current_line:
-        lines.append(current_line)
-    
-    # Create karaoke subtitles
-    for line_words in lines:
-        if not line_words:
-            continue
-        
-        line_start = line_words[0].start
-        line_end = line_words[-1].end
-        
-        # ASS time format
-        start_time = f"{int(line_start//3600):01d}:{int((line_start%3600)//60):02d}:{int(line_start%60):02d}.{int((line_start%1)*100):02d}"
-        end_time = f"{int(line_end//3600):01d}:{int((line_end%3600)//60):02d}:{int(line_end%60):02d}.{int((line_end%1)*100):02d}"
-        
-        # Build karaoke effect
-        text_parts = []
-        current_time = line_start
-        
-        for word in line_words:
-            word_duration = max(0.1, word.end - current_time)
-            highlight_duration = int(word_duration * 100)
-            
-            clean_word = word.word.strip()
-            text_parts.append(f"{{\\k{highlight_duration}}}{clean_word}")
-            current_time = word.end
-        
-        karaoke_text = "".join(text_parts)
-        ass_content += f"Dialogue: 0,{start_time},{end_time},Default,,0,0,0,,{karaoke_text}\\N\n"
-    
-    with open(ass_path, 'w', encoding='utf-8') as f:
-        f.write(ass_content)
-    
-    # Create video
-    output_path = os.path.join(TEMP_DIR, output_filename)
-    
-    ffmpeg_cmd = [
-        FFMPEG_PATH,
-        '-i', accompaniment_path,
-        '-vf', f"color=black:size=1280x720:duration={min(300, transcript.words[-1].end)},subtitles={ass_path}:force_style='FontSize=32'",
-        '-c:a', 'aac',
-        '-c:v', 'libx264',
-        '-t', str(min(300, transcript.words[-1].end)),
-        output_path, '-y'
-    ]
-    
-    result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-    
-    if os.path.exists(output_path):
-        return output_path
-    else:
-        print(f"❌ Video creation failed: {result.stderr}")
-        return None
+def save_job_timeline(profiler):
+    """Upload the job's stage timeline next to its request metadata"""
+    timeline_path = os.path.join(TEMP_DIR, f"request_timeline_{profiler.job_id}.json")
+    profiler.save(timeline_path)
+    timeline_gcs_url = upload_to_gcs(timeline_path, f"requests/{profiler.job_id}_timeline.json")
+    if os.path.exists(timeline_path):
+        os.remove(timeline_path)
+    return timeline_gcs_url
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -321,108 +386,563 @@ def health():
         'version': '1.0'
     })
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness endpoint: 200 once models are loaded, 503 while warming up"""
+    if not _ready.is_set():
+        return jsonify({
+            'status': 'warming_up',
+            'elapsed_seconds': round(time.time() - _started_at, 1)
+        }), 503
+    if _warm_up_error:
+        return jsonify({'status': 'error', 'error': _warm_up_error}), 503
+    return jsonify({'status': 'ready', 'service': SERVICE_NAME})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus-style stage and process metrics"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/process', methods=['POST'])
 def process_video():
-    """Process downloaded video into karaoke versions"""
+    """Process downloaded video into karaoke versions
+
+    Requests with the same video_url, vocal_levels, test_duration and stems (or the
+    same Idempotency-Key header / idempotency_key field) share one job: a retry attaches
+    to the running job or gets the stored result of the finished one.
+    
+    "stems" lists the stems to return (default vocals + accompaniment; see
+    stem_models.STEMS), e.g. ["drums"] or ["no_bass"] for practice tracks.
+    "transcribe": true also returns the vocals' word-timed transcript; with "lyrics"
+    (the song's lyric text) the words are aligned to the vocals instead of transcribed.
+    """
     try:
         data = request.get_json()
         
         if not data or 'video_url' not in data:
             return jsonify({'error': 'Missing video_url'}), 400
+        try:
+            data = dict(data, stems=normalize_stems(data.get('stems')))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if (data.get('transcribe') and not data.get('lyrics') and TRANSCRIPTION_BACKEND == 'openai'
+                and not OPENAI_API_KEY):
+            return jsonify({'error': 'Transcription is not configured (no OPENAI_API_KEY)'}), 400
+        
+        job_id = request_key(data, request.headers.get('Idempotency-Key'))
+        payload, status, deduplicated = COALESCER.run(job_id, lambda: run_profiled_job(job_id, data))
+        if deduplicated:
+            payload = dict(payload, deduplicated=True)
+        return jsonify(payload), status
         
-        video_url = data['video_url']
-        vocal_levels = data.get('vocal_levels', [0.0, 0.25, 0.5])
-        
-        print(f"🎯 Processing: {video_url}")
-        
-        # Download video from storage
-        job_id = str(uuid.uuid4())[:8]
-        local_video_path = os.path.join(TEMP_DIR, f"input_{job_id}.mp4")
-        
-        if not download_from_url(video_url, local_video_path):
-            return jsonify({'error': 'Failed to download video from URL'}), 500
-        
-        # Check for test mode
-        test_duration = data.get('test_duration')  # 30 seconds for testing
-        
-        # Separate audio
-        vocals_path, accompaniment_path = python_spleeter_separation(local_video_path, test_duration)
-        
-        if not vocals_path or not accompaniment_path:
-            return jsonify({'error': 'Audio separation failed'}), 500
-        
-        # Upload separated audio files to GCS for preservation
-        separated_audio_files = []
-        
-        # Upload vocals
-        vocals_filename = f"separated_audio/{job_id}_vocals.wav"
-        vocals_gcs_url = upload_to_gcs(vocals_path, vocals_filename)
-        if vocals_gcs_url:
-            separated_audio_files.append({
-                'type': 'vocals',
-                'filename': vocals_filename,
-                'url': vocals_gcs_url
-            })
-            print(f"💾 Uploaded vocals to GCS: {vocals_gcs_url}")
-        
-        # Upload accompaniment
-        accompaniment_filename = f"separated_audio/{job_id}_accompaniment.wav"
-        accompaniment_gcs_url = upload_to_gcs(accompaniment_path, accompaniment_filename)
-        if accompaniment_gcs_url:
-            separated_audio_files.append({
-                'type': 'accompaniment', 
-                'filename': accompaniment_filename,
-                'url': accompaniment_gcs_url
-            })
-            print(f"💾 Uploaded accompaniment to GCS: {accompaniment_gcs_url}")
-        
-        # Save input request metadata to GCS
-        request_metadata = {
-            'job_id': job_id,
-            'timestamp': time.time(),
+    except Exception as e:
+        print(f"❌ Processing error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def request_key(data, supplied=None):
+    """Job id of a request (see job_coalescing.job_key); data['stems'] is already normalized"""
+    stems = data['stems'] if data['stems'] != list(DEFAULT_STEMS) else None
+    return job_key(data['video_url'], data.get('vocal_levels', DEFAULT_VOCAL_LEVELS), data.get('test_duration'),
+                   supplied=data.get('idempotency_key') or supplied, stems=stems,
+                   transcribe=bool(data.get('transcribe')), lyrics=data.get('lyrics') if data.get('transcribe') else None)
+
+def run_profiled_job(job_id, data):
+    """Run a job under a profiler and upload its timeline; returns (payload, status)"""
+    profiler = JobProfiler(job_id, SERVICE_NAME)
+    try:
+        with profiler:
+            return run_processing_job(job_id, data, profiler)
+    finally:
+        timeline_gcs_url = save_job_timeline(profiler)
+        if timeline_gcs_url:
+            print(f"⏱️ Uploaded job timeline to GCS: {timeline_gcs_url}")
+
+def completed_response(job_id, separated_audio, metadata_url, transcript=None, lyrics_files=None):
+    """Success payload of a separation job"""
+    payload = {
+        'success': True,
+        'job_id': job_id,
+        'message': 'Audio separation completed successfully',
+        'separated_audio': separated_audio,
+        'metadata_url': metadata_url,
+        'note': 'Transcription and video creation skipped - audio separation only'
+    }
+    if transcript is not None:
+        payload['transcript'] = transcript
+        payload['note'] = 'Video creation skipped - audio separation and transcription only'
+    if lyrics_files:
+        payload['lyrics_files'] = lyrics_files
+    return payload
+
+def stored_response(job_id, metadata):
+    """Success payload rebuilt from a finished job's requests/{job_id}_metadata.json"""
+    return completed_response(job_id, metadata['separated_audio_files'],
+                              f"https://storage.googleapis.com/{BUCKET_NAME}/karaoke/requests/{job_id}_metadata.json",
+                              metadata.get('transcript'), metadata.get('lyrics_files'))
+
+# One job per key in this process; the claim and metadata objects in GCS extend that across instances
+COALESCER = JobCoalescer(GcsJobStore(lambda: get_storage_client().bucket(BUCKET_NAME)), respond=stored_response)
+
+# Stems already separated for a source, reused by later requests for the same audio
+STEM_INDEX = GcsStemIndex(lambda: get_storage_client().bucket(BUCKET_NAME))
+
+# Message returned when a job stops at a stage
+STAGE_ERRORS = {
+    'download': 'Failed to download video from URL',
+    'decode': 'Audio separation failed',
+    'separate': 'Audio separation failed',
+    'transcribe': 'Transcription failed',
+}
+
+def pack_stem(workspace, stem, path, codec=None):
+    """Encode a stem WAV for upload; returns {'path', 'codec', 'bytes', 'source_bytes'}
+
+    Falls back to the WAV itself when the codec is 'wav' or encoding fails.
+    """
+    from stem_pack import pack_wav, EXTENSIONS
+    codec = codec or STEM_CODEC
+    size = os.path.getsize(path)
+    unpacked = {'path': path, 'codec': 'wav', 'bytes': size, 'source_bytes': size}
+    if codec == 'wav':
+        return unpacked
+    try:
+        packed = pack_wav(path, workspace.path(f"{stem}.{EXTENSIONS[codec]}"), codec, ffmpeg=FFMPEG_PATH)
+    except Exception as e:
+        print(f"⚠️ Packing {stem} as {codec} failed, uploading the WAV: {e}")
+        return unpacked
+    print(f"🗜️ Packed {stem} as {codec}: {packed['source_bytes'] / 1e6:.1f}MB -> {packed['bytes'] / 1e6:.1f}MB")
+    return packed
+
+def upload_stem(job_id, stem, packed, model=SPLEETER_MODEL):
+    """Upload one packed stem; returns its separated_audio entries (empty on failure)"""
+    from stem_pack import EXTENSIONS
+    extension = EXTENSIONS.get(packed['codec'], 'wav')
+    filename = f"separated_audio/{job_id}_{stem}.{extension}"
+    gcs_url = upload_to_gcs(packed['path'], filename)
+    if not gcs_url:
+        return []
+    print(f"💾 Uploaded {stem} to GCS: {gcs_url}")
+    return [{'type': stem, 'filename': filename, 'url': gcs_url, 'codec': packed['codec'], 'bytes': packed['bytes'],
+             'model': model}]
+
+def stored_stems(source):
+    """Per-stem index entries of a source; {} when the index cannot be read"""
+    try:
+        return STEM_INDEX.load(source)
+    except Exception as e:
+        print(f"⚠️ Stem index lookup failed for {source}: {e}")
+        return {}
+
+def remember_stems(source, separated_audio, loudness=None, transcript=None):
+    """Record uploaded stems (and their loudness analysis and transcript) in the per-stem index"""
+    try:
+        for entry in separated_audio:
+            STEM_INDEX.save(source, entry['type'], entry)
+        if loudness:
+            STEM_INDEX.save(source, 'loudness', loudness)
+        if transcript is not None:
+            STEM_INDEX.save(source, 'transcript', transcript)
+    except Exception as e:
+        # Costs a later request a separation, nothing else
+        print(f"⚠️ Could not record stems for {source}: {e}")
+
+def publish_timed_lyrics(job_id, workspace, transcript):
+    """Upload the transcript as JSON, LRC and WebVTT lyric files (timed_lyrics); returns {format: url}"""
+    if not transcript:
+        return {}
+    urls = {}
+    for fmt, path in write_timed_lyrics(transcript, workspace.subdir('lyrics'), job_id).items():
+        url = upload_to_gcs(path, f"lyrics/{job_id}.{fmt}", TIMED_LYRICS_TYPES[fmt])
+        if url:
+            urls[fmt] = url
+    if urls:
+        print(f"💾 Uploaded timed lyrics: {', '.join(urls)}")
+    return urls
+
+def save_request_metadata(job_id, workspace, video_url, vocal_levels, test_duration, separated_audio, loudness=None,
+                          stems=DEFAULT_STEMS, transcript=None, lyrics_files=None):
+    """Write requests/{job_id}_metadata.json (the job's stored result); returns its URL or ''
+
+    The loudness analysis is stored with it, so mixes rendered later from the stems
+    take their gains from the metadata instead of analyzing again. So is the
+    transcript ({'text', 'words'}) of jobs that asked for one.
+    """
+    request_metadata = {
+        'job_id': job_id,
+        'timestamp': time.time(),
+        'video_url': video_url,
+        'vocal_levels': vocal_levels,
+        'test_duration': test_duration,
+        'stems': list(stems),
+        'separated_audio_files': separated_audio,
+        'loudness': loudness or {}
+    }
+    if transcript is not None:
+        request_metadata['transcript'] = transcript
+    if lyrics_files:
+        request_metadata['lyrics_files'] = lyrics_files
+    
+    metadata_path = workspace.path("request_metadata.json")
+    with open(metadata_path, 'w') as f:
+        json.dump(request_metadata, f, indent=2)
+    
+    metadata_gcs_url = upload_to_gcs(metadata_path, f"requests/{job_id}_metadata.json")
+    if metadata_gcs_url:
+        print(f"💾 Uploaded request metadata to GCS: {metadata_gcs_url}")
+    return metadata_gcs_url or ''
+
+def build_processing_pipeline(job_id, workspace, stems=DEFAULT_STEMS, model=SPLEETER_MODEL, analyze=True,
+                              transcribe=False, lyrics=None):
+    """download -> decode -> separate -> {loudness, transcribe -> refine, encode + upload per stem} -> metadata
+
+    Only `stems` are written, encoded and uploaded (concurrently, on the pipeline's
+    worker threads); the metadata stage lists them in `requested_stems` order together
+    with the `cached_audio` entries of stems that earlier jobs stored. The loudness analysis needs both vocals and accompaniment;
+    with analyze=False `loudness` is an input artifact instead. The decoded waveform
+    stays in memory between decode and separate, and every local file lives in the
+    job's workspace.
+
+    With transcribe=True (stems must include vocals) separation runs window by window
+    and feeds a SpeculativeTranscriber; the transcribe stage only waits for the windows
+    still in flight. With `lyrics` as well, separation runs in one pass and the transcribe
+    stage aligns the lyrics to the vocal stem (transcribing it only if they do not fit).
+    Either way the refine stage snaps the word times to the vocal stem. Otherwise `transcript` (None or a stored one) is an input artifact.
+    """
+    def download(video_url):
+        local_video_path = workspace.path("input.mp4")
+        return local_video_path if download_from_url(video_url, local_video_path) else None
+    
+    def separate(waveform, sample_rate):
+        transcriber = None
+        if transcribe and not lyrics:
+            transcriber = SpeculativeTranscriber(FFMPEG_PATH, OPENAI_API_KEY, workspace.subdir('transcription'),
+                                                 sample_rate, backend=get_backend(api_key=OPENAI_API_KEY))
+        try:
+            paths = separate_waveform(waveform, sample_rate, stem_paths(workspace, stems), model,
+                                      transcriber.feed if transcriber else None)
+        except Exception:
+            if transcriber:
+                transcriber.cancel()
+            raise
+        outputs = {f"{stem}_path": path for stem, path in paths.items()}
+        if transcriber:
+            outputs['transcription'] = transcriber
+        return outputs
+    
+    def save_metadata(video_url, vocal_levels, test_duration, requested_stems, cached_audio, loudness, transcript,
+                      lyrics_files, **uploaded):
+        entries = {entry['type']: entry for entry in cached_audio}
+        for files in uploaded.values():
+            entries.update((entry['type'], entry) for entry in files)
+        separated_audio = [entries[stem] for stem in requested_stems if stem in entries]
+        metadata_url = save_request_metadata(job_id, workspace, video_url, vocal_levels, test_duration,
+                                             separated_audio, loudness, requested_stems, transcript, lyrics_files)
+        return {'metadata_url': metadata_url, 'separated_audio': separated_audio}
+    
+    def encode_stage(stem):
+        return Stage(f'encode_{stem}', lambda **paths: {f"{stem}_pack": pack_stem(workspace, stem, paths[f"{stem}_path"])},
+                     inputs=[f"{stem}_path"], outputs=[f"{stem}_pack"], profile_as='encode')
+    
+    def upload_stage(stem):
+        return Stage(f'upload_{stem}', lambda **packs: upload_stem(job_id, stem, packs[f"{stem}_pack"], model),
+                     inputs=[f"{stem}_pack"], outputs=[f"{stem}_files"], profile_as='upload')
+    
+    graph = [
+        Stage('download', download, inputs=['video_url'], outputs=['video_path']),
+        Stage('decode',
+              lambda video_path, test_duration: decode_audio(
+                  video_path, workspace.path("audio.wav"), test_duration),
+              inputs=['video_path', 'test_duration'], outputs=['waveform', 'sample_rate']),
+        Stage('separate', separate, inputs=['waveform', 'sample_rate'],
+              outputs=[f"{stem}_path" for stem in stems] + (['transcription'] if transcribe and not lyrics else [])),
+    ]
+    if analyze:
+        graph.append(Stage(
+            'loudness',
+            lambda vocals_path, accompaniment_path, vocal_levels: {
+                'loudness': analyze_loudness(vocals_path, accompaniment_path, vocal_levels)},
+            inputs=['vocals_path', 'accompaniment_path', 'vocal_levels'], outputs=['loudness'],
+            profile_as='analyze'))
+    if transcribe and lyrics:
+        graph.append(Stage('transcribe', lambda vocals_path: {'raw_transcript': align_transcript(vocals_path, lyrics)},
+                           inputs=['vocals_path'], outputs=['raw_transcript']))
+    elif transcribe:
+        graph.append(Stage('transcribe', lambda transcription: {'raw_transcript': transcription.finish()},
+                           inputs=['transcription'], outputs=['raw_transcript']))
+    if transcribe:
+        graph.append(Stage('refine', lambda raw_transcript, vocals_path: {
+            'transcript': refine_word_timing(raw_transcript, vocals_path).to_dict()},
+            inputs=['raw_transcript', 'vocals_path'], outputs=['transcript'], profile_as='analyze'))
+    graph.append(Stage('timed_lyrics', lambda transcript: {
+        'lyrics_files': publish_timed_lyrics(job_id, workspace, transcript)},
+        inputs=['transcript'], outputs=['lyrics_files'], profile_as='subtitle'))
+    for stem in stems:
+        graph.extend([encode_stage(stem), upload_stage(stem)])
+    graph.append(Stage(
+        'metadata', save_metadata,
+        inputs=['video_url', 'vocal_levels', 'test_duration', 'requested_stems', 'cached_audio', 'loudness',
+                'transcript', 'lyrics_files'] + [f"{stem}_files" for stem in stems],
+        outputs=['metadata_url', 'separated_audio'], profile_as='upload'))
+    return Pipeline(graph, max_workers=min(8, 1 + len(stems)))
+
+def run_processing_job(job_id, data, profiler):
+    """Download, separate and upload one job, recording each stage on the profiler
+
+    Stems that an earlier job already separated from the same audio are taken from
+    the per-stem index; only the missing ones are separated, with the cheapest model
+    that provides them. "transcribe": true jobs reuse a stored transcript too, or
+    separate the vocals (even if stored) to transcribe them while separating, or to align
+    the request's "lyrics" to them (whole songs only, not test_duration clips).
+    Returns (payload, status); the metadata object it writes is the job's stored result.
+    """
+    video_url = data['video_url']
+    vocal_levels = data.get('vocal_levels', DEFAULT_VOCAL_LEVELS)
+    test_duration = data.get('test_duration')  # 30 seconds for testing
+    stems = normalize_stems(data.get('stems'))
+    source = source_key(video_url, test_duration)
+    stored = stored_stems(source)
+    cached_audio = [stored[stem] for stem in stems if stem in stored]
+    missing = [stem for stem in stems if stem not in stored]
+    transcript = stored.get('transcript') if data.get('transcribe') else None
+    transcribe = bool(data.get('transcribe')) and transcript is None
+    lyrics = data.get('lyrics') if transcribe and not test_duration else None
+    if transcribe and 'vocals' not in missing:
+        missing = normalize_stems(missing + ['vocals'])
+    print(f"🎯 Processing: {video_url} ({', '.join(stems)})")
+    if cached_audio:
+        print(f"♻️ Reusing stored stems: {', '.join(entry['type'] for entry in cached_audio)}")
+    profiler.annotate(stems=stems, reused_stems=[entry['type'] for entry in cached_audio])
+    
+    # The workspace (and every local file of the job) is removed on success and failure alike
+    with JobWorkspace(job_id) as workspace:
+        if not missing:
+            lyrics_files = publish_timed_lyrics(job_id, workspace, transcript)
+            metadata_url = save_request_metadata(job_id, workspace, video_url, vocal_levels, test_duration,
+                                                 cached_audio, stored.get('loudness'), stems, transcript, lyrics_files)
+            print("✅ All requested stems were already separated")
+            return completed_response(job_id, cached_audio, metadata_url or None, transcript, lyrics_files), 200
+        
+        model = choose_model(missing)
+        analyze = 'vocals' in missing and 'accompaniment' in missing
+        profiler.annotate(model=model)
+        artifacts = {
             'video_url': video_url,
             'vocal_levels': vocal_levels,
             'test_duration': test_duration,
-            'separated_audio_files': separated_audio_files
+            'requested_stems': stems,
+            'cached_audio': cached_audio,
         }
+        if not analyze:
+            artifacts['loudness'] = stored.get('loudness') or {}
+        if not transcribe:
+            artifacts['transcript'] = transcript
+        result = build_processing_pipeline(job_id, workspace, missing, model, analyze, transcribe, lyrics).run(
+            artifacts, hooks=[ProfilerHook(profiler), WorkspaceHook(workspace)])
+    profiler.annotate(workspace=workspace.summary())
+    
+    if not result.ok:
+        if any(r.get('error_type') == WorkspaceFull.__name__ for r in result.failed):
+            print(f"❌ {result.error()}")
+            profiler.fail('Temporary storage full')
+            return {'error': 'Temporary storage full, retry later'}, 503
+        failed = result.failed[0]['stage'] if result.failed else None
+        error = STAGE_ERRORS.get(failed, result.error() or 'Processing failed')
+        print(f"❌ {result.error()}")
+        profiler.fail(error)
+        return {'error': error}, 500
+    
+    remember_stems(source, [entry for entry in result.get('separated_audio') if entry['type'] in missing],
+                   result.get('loudness') if analyze else None, result.get('transcript') if transcribe else None)
+    
+    # Skip video creation for now - just return successful audio separation (and transcript)
+    print("✅ Audio separation completed successfully")
+    print("ℹ️ Skipping karaoke video creation")
+    
+    return completed_response(job_id, result.get('separated_audio'), result.get('metadata_url') or None,
+                              result.get('transcript'), result.get('lyrics_files')), 200
+
+@app.route('/batch', methods=['POST'])
+def process_batch():
+    """Separate a manifest of songs in one request
+
+    Body: {"items": [{"video_url": ..., "vocal_levels": [...], "test_duration": 30, "stems": [...]}, ...]}
+    Items already processed (by /process or an earlier batch) are returned from their
+    stored result; items running elsewhere (a /process here, or another instance) are
+    waited on instead of separated twice. Batch items are never transcribed, so "transcribe" and "lyrics" are
+    rejected (they would change the job key). The response is the consolidated manifest, also uploaded as
+    requests/batch_{batch_id}_manifest.json.
+    """
+    try:
+        data = request.get_json()
+        entries = data.get('items') if data else None
         
-        metadata_path = os.path.join(TEMP_DIR, f"request_metadata_{job_id}.json")
-        with open(metadata_path, 'w') as f:
-            json.dump(request_metadata, f, indent=2)
-        
-        metadata_filename = f"requests/{job_id}_metadata.json"
-        metadata_gcs_url = upload_to_gcs(metadata_path, metadata_filename)
-        if metadata_gcs_url:
-            print(f"💾 Uploaded request metadata to GCS: {metadata_gcs_url}")
-        
-        # Cleanup metadata file
-        if os.path.exists(metadata_path):
-            os.remove(metadata_path)
-        
-        # Skip transcription and video creation for now - just return successful audio separation
-        print("✅ Audio separation completed successfully")
-        print("ℹ️ Skipping transcription and karaoke video creation")
-        
-        # Cleanup local files
-        os.remove(local_video_path)
-        if os.path.exists(vocals_path):
-            os.remove(vocals_path)
-        if os.path.exists(accompaniment_path):
-            os.remove(accompaniment_path)
+        if not entries or any(not isinstance(entry, dict) or 'video_url' not in entry for entry in entries):
+            return jsonify({'error': 'Missing items (each needs a video_url)'}), 400
+        if any(entry.get('transcribe') or entry.get('lyrics') for entry in entries):
+            return jsonify({'error': 'Batch items are not transcribed; use /process for transcribe/lyrics'}), 400
+        try:
+            for entry in entries:
+                normalize_stems(entry.get('stems'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        return jsonify({
-            'success': True,
-            'job_id': job_id,
-            'message': 'Audio separation completed successfully',
-            'separated_audio': separated_audio_files,
-            'metadata_url': metadata_gcs_url,
-            'note': 'Transcription and video creation skipped - audio separation only'
-        })
+        manifest = run_batch_job(entries)
+        status = 500 if manifest['summary']['failed'] == len(entries) else 200
+        return jsonify(manifest), status
         
     except Exception as e:
-        print(f"❌ Processing error: {e}")
+        print(f"❌ Batch error: {e}")
         return jsonify({'error': str(e)}), 500
 
+def attach_batch_item(item):
+    """Wait for a batch item that runs elsewhere (or run it alone if its holder gives it up)"""
+    try:
+        payload, status, _ = COALESCER.run(item.job_id, lambda: run_profiled_job(item.job_id, item.data))
+    except Exception as e:
+        item.fail('attach', e)
+        return
+    if status == 200:
+        item.status, item.result = 'cached', payload
+    else:
+        item.fail('attach', payload.get('error', 'Processing failed'))
+
+def run_batch_job(entries):
+    """Download/decode ahead, separate on the shared separator, upload behind; returns the manifest"""
+    items = []
+    for index, entry in enumerate(entries):
+        # Not transcribed here, so the item must not take a transcribing job's key
+        entry = {key: value for key, value in entry.items() if key not in ('transcribe', 'lyrics')}
+        entry.update(vocal_levels=entry.get('vocal_levels', DEFAULT_VOCAL_LEVELS), stems=normalize_stems(entry.get('stems')))
+        entry['model'] = choose_model(entry['stems'])
+        items.append(BatchItem(index, request_key(entry), entry))
+    batch_id = job_key('batch', supplied=','.join(item.job_id for item in items))
+    print(f"📦 Batch {batch_id}: {len(items)} items")
+    
+    profiler = JobProfiler(f"batch_{batch_id}", SERVICE_NAME)
+    workspaces = {}
+    
+    def prepare(item):
+        workspace = workspaces[item.job_id] = JobWorkspace(item.job_id).open()
+        video_path = workspace.path("input.mp4")
+        with use_profiler(profiler):
+            with profile_stage('download') as stage:
+                if not download_from_url(item.data['video_url'], video_path):
+                    return None
+                stage.add_output(video_path)
+            with profile_stage('decode') as stage:
+                stage.add_input(video_path)
+                waveform, sample_rate = decode_audio(video_path, workspace.path("audio.wav"), item.data.get('test_duration'))
+                if waveform is None:
+                    return None
+                stage.add_output(waveform.nbytes)
+        # The video is not needed once decoded; free the space while the item waits
+        workspace.remove(video_path)
+        return stereo_frames(waveform), sample_rate
+    
+    def separate_many(batch):
+        # One separator call per model among the batch's items
+        predictions = [None] * len(batch)
+        by_model = {}
+        for position, item in enumerate(batch):
+            by_model.setdefault(item.data['model'], []).append(position)
+        with use_profiler(profiler), profile_stage('separate') as stage:
+            for model, positions in by_model.items():
+                waveforms = [batch[position].prepared[0] for position in positions]
+                for waveform in waveforms:
+                    stage.add_input(waveform.nbytes)
+                for position, prediction in zip(positions, separate_waveforms(waveforms, model)):
+                    predictions[position] = prediction
+        return predictions
+    
+    def finish(item, prediction):
+        from stem_pack import get_encoder
+        workspace = workspaces[item.job_id]
+        try:
+            stems = item.data['stems']
+            with use_profiler(profiler):
+                paths = write_stems(prediction, item.prepared[1], stem_paths(workspace, stems))
+                # The stems encode in the background while the loudness analysis runs here
+                futures = {stem: get_encoder().submit(pack_stem, workspace, stem, path) for stem, path in paths.items()}
+                loudness = {}
+                if 'vocals' in paths and 'accompaniment' in paths:
+                    with profile_stage('analyze'):
+                        loudness = analyze_loudness(paths['vocals'], paths['accompaniment'], item.data['vocal_levels'])
+                with profile_stage('encode') as stage:
+                    packs = {stem: future.result() for stem, future in futures.items()}
+                    for packed in packs.values():
+                        stage.add_output(packed['path'])
+                with profile_stage('upload') as stage:
+                    separated_audio = []
+                    for stem, packed in packs.items():
+                        stage.add_input(packed['path'])
+                        separated_audio += upload_stem(item.job_id, stem, packed, item.data['model'])
+                    if len(separated_audio) < len(stems):
+                        return None
+                    metadata_url = save_request_metadata(item.job_id, workspace, item.data['video_url'],
+                                                         item.data['vocal_levels'], item.data.get('test_duration'),
+                                                         separated_audio, loudness, stems)
+            remember_stems(source_key(item.data['video_url'], item.data.get('test_duration')), separated_audio, loudness)
+            result = completed_response(item.job_id, separated_audio, metadata_url or None)
+            COALESCER.end(item.job_id, result if metadata_url else None)
+            return result
+        finally:
+            workspace.close()
+    
+    started = time.time()
+    with profiler:
+        # Claim every item like /process does: stored results are reused, and items
+        # running here or on another instance are attached to after the batch
+        stored, busy, leads = {}, [], []
+        for item in items:
+            state, payload = COALESCER.begin(item.job_id)
+            if state == 'stored':
+                stored[item.job_id] = payload
+            else:
+                (leads if state == 'lead' else busy).append(item)
+        # Busy items are waited on while the batch runs; one whose holder gives it up
+        # runs as a single job there, so a stale claim costs at most one job's time
+        attach_pool = ThreadPoolExecutor(max_workers=BATCH_ATTACH_WORKERS, thread_name_prefix='batch-attach')
+        attached = [attach_pool.submit(attach_batch_item, item) for item in busy]
+        try:
+            run_batch(leads, prepare, separate_many, finish,
+                      seconds_of=lambda prepared: len(prepared[0]) / prepared[1],
+                      prefetch=BATCH_PREFETCH, max_batch_seconds=BATCH_MAX_SECONDS)
+        finally:
+            for item in leads:
+                COALESCER.end(item.job_id)      # no-op for items whose finish ended them
+            for workspace in workspaces.values():
+                workspace.close()
+            for future in attached:
+                future.result()
+            attach_pool.shutdown(wait=True)
+        for item in items:
+            if item.job_id in stored:
+                item.status, item.result = 'cached', stored[item.job_id]
+        summary = summarize(items, time.time() - started)
+        if summary['failed']:
+            profiler.fail(f"{summary['failed']} of {summary['total']} items failed")
+    
+    manifest = {
+        'batch_id': batch_id,
+        'timestamp': started,
+        'summary': summary,
+        'items': [dict(item.result or {}, index=item.index, job_id=item.job_id,
+                       video_url=item.data['video_url'], status=item.status,
+                       error=item.error, timings=item.timings) for item in items],
+    }
+    with JobWorkspace(f"batch_{batch_id}") as workspace:
+        manifest_path = workspace.path("manifest.json")
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        manifest['manifest_url'] = upload_to_gcs(manifest_path, f"requests/batch_{batch_id}_manifest.json")
+    
+    timeline_gcs_url = save_job_timeline(profiler)
+    if timeline_gcs_url:
+        print(f"⏱️ Uploaded batch timeline to GCS: {timeline_gcs_url}")
+    print(f"✅ Batch {batch_id}: {summary}")
+    return manifest
+
 if __name__ == '__main__':
+    start_background_warm_up()
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Stem Models
+Which Spleeter model to run for the stems a request asks for, and a per-stem index of
+stems already separated and uploaded for a source.
+
+Requests name stems from STEMS. Model stems come straight out of the separator;
+'accompaniment' (everything but the vocals) and the 'no_<stem>' practice tracks are
+sums of them. choose_model() picks the cheapest model that can produce every
+requested stem, and derive_stems() only builds the requested ones.
+"""
+import json
+import hashlib
+
+# Cheapest first; the cost is relative separator time
+MODELS = (
+    {'name': 'spleeter:2stems-16kHz', 'stems': ('vocals', 'accompaniment'), 'cost': 1},
+    {'name': 'spleeter:4stems-16kHz', 'stems': ('vocals', 'drums', 'bass', 'other'), 'cost': 2},
+    {'name': 'spleeter:5stems-16kHz', 'stems': ('vocals', 'drums', 'bass', 'piano', 'other'), 'cost': 3},
+)
+DEFAULT_STEMS = ('vocals', 'accompaniment')
+# Derived stem -> model stem it leaves out of the sum
+DERIVED = {'accompaniment': 'vocals', 'no_drums': 'drums', 'no_bass': 'bass', 'no_piano': 'piano'}
+STEMS = ('vocals', 'accompaniment', 'drums', 'bass', 'piano', 'other', 'no_drums', 'no_bass', 'no_piano')
+
+def model_stems(model):
+    """Every stem a model can provide, its own and the derived ones"""
+    own = next(m['stems'] for m in MODELS if m['name'] == model)
+    return tuple(own) + tuple(stem for stem, left_out in DERIVED.items() if stem not in own and left_out in own)
+
+def normalize_stems(stems):
+    """Validated, de-duplicated stem list in STEMS order; raises ValueError for unknown names"""
+    stems = list(DEFAULT_STEMS) if not stems else [stems] if isinstance(stems, str) else list(stems)
+    unknown = sorted(set(stems) - set(STEMS))
+    if unknown:
+        raise ValueError(f"Unknown stems: {', '.join(unknown)} (choose from {', '.join(STEMS)})")
+    return [stem for stem in STEMS if stem in stems]
+
+def choose_model(stems):
+    """Name of the cheapest model that provides all of `stems`"""
+    for model in MODELS:
+        if set(stems) <= set(model_stems(model['name'])):
+            return model['name']
+    raise ValueError(f"No model provides {', '.join(stems)}")
+
+def derive_stems(prediction, stems):
+    """{stem: samples} for the requested stems from a separator prediction"""
+    derived = {}
+    for stem in stems:
+        if stem in prediction:
+            derived[stem] = prediction[stem]
+        elif stem in DERIVED:
+            parts = [samples for name, samples in prediction.items() if name != DERIVED[stem]]
+            total = parts[0].copy()
+            for samples in parts[1:]:
+                total += samples
+            derived[stem] = total
+        else:
+            raise ValueError(f"Prediction has no {stem} stem")
+    return derived
+
+def source_key(video_url, test_duration=None):
+    """Identity of the audio a stem was separated from: 16 hex chars"""
+    source = json.dumps({'video_url': video_url, 'test_duration': float(test_duration) if test_duration else None},
+                        sort_keys=True)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+
+class GcsStemIndex:
+    """One small object per separated stem under `prefix`{source}/, so jobs never rewrite each other's entries"""
+
+    def __init__(self, bucket_fn, prefix='karaoke/stems/'):
+        self.bucket_fn = bucket_fn
+        self.prefix = prefix
+
+    def load(self, source):
+        """{name: entry} of everything stored for a source"""
+        entries = {}
+        for blob in self.bucket_fn().list_blobs(prefix=f"{self.prefix}{source}/"):
+            name = blob.name.rsplit('/', 1)[-1]
+            if name.endswith('.json'):
+                entries[name[:-len('.json')]] = json.loads(blob.download_as_text())
+        return entries
+
+    def save(self, source, name, entry):
+        blob = self.bucket_fn().blob(f"{self.prefix}{source}/{name}.json")
+        blob.upload_from_string(json.dumps(entry), content_type='application/json')
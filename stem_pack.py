@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Stem Pack
+Compact container for the stems a job uploads. The stem is cut into fixed-length
+chunks that are encoded independently and stored behind a JSON index:
+
+    b'KSTP' | u32 index length | index JSON | chunk 0 | chunk 1 | ...
+
+so a reader fetches the header, then only the byte range of the chunks covering the
+time window it wants (an HTTP Range request or a ranged GCS download).
+
+Codecs: 'flac' (lossless 16-bit, the default), 'pcm16' (raw, no encoder needed) and
+'opus' (lossy, for previews). FLAC and Opus chunks are encoded by ffmpeg, or by
+soundfile for FLAC when it is installed.
+"""
+import io
+import os
+import json
+import shutil
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pipeline_profiler import run_subprocess
+from stem_store import open_wav, to_float
+
+MAGIC = b'KSTP'
+VERSION = 1
+CODECS = ('flac', 'pcm16', 'opus')
+EXTENSIONS = {'flac': 'flac.kstp', 'pcm16': 'pcm16.kstp', 'opus': 'opus.kstp'}
+CHUNK_SECONDS = 10
+OPUS_BITRATE = '96k'
+HEAD_PROBE_BYTES = 16 * 1024       # first fetch; holds the whole index for songs up to ~1h
+ENCODE_WORKERS = int(os.getenv('STEM_ENCODE_WORKERS', '2'))
+FFMPEG = os.getenv('FFMPEG_PATH', 'ffmpeg')
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+class StemPackError(ValueError):
+    """Not a stem pack, or a chunk that cannot be decoded"""
+
+def _pcm16(block):
+    return np.clip(to_float(block) * 32768.0, -32768, 32767).astype('<i2')
+
+def _ffmpeg(ffmpeg, input_args, data, output_args):
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error'] + input_args + ['-i', 'pipe:0'] + output_args + ['pipe:1']
+    result = run_subprocess(cmd, input=data, text=False)
+    if result.returncode != 0:
+        raise StemPackError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace')[-300:]}")
+    return result.stdout
+
+def encode_chunk(block, sample_rate, codec, ffmpeg=FFMPEG):
+    """Encode one (frames, channels) block as a standalone payload"""
+    pcm = _pcm16(block)
+    if codec == 'pcm16':
+        return pcm.tobytes()
+    if codec == 'flac':
+        try:
+            import soundfile
+            buffer = io.BytesIO()
+            soundfile.write(buffer, pcm, sample_rate, format='FLAC', subtype='PCM_16')
+            return buffer.getvalue()
+        except ImportError:
+            pass
+    raw_input = ['-f', 's16le', '-ar', str(sample_rate), '-ac', str(pcm.shape[1])]
+    if codec == 'flac':
+        return _ffmpeg(ffmpeg, raw_input, pcm.tobytes(), ['-c:a', 'flac', '-f', 'flac'])
+    if codec == 'opus':
+        return _ffmpeg(ffmpeg, raw_input, pcm.tobytes(), ['-c:a', 'libopus', '-b:a', OPUS_BITRATE, '-f', 'ogg'])
+    raise StemPackError(f"unknown codec {codec!r}")
+
+def decode_chunk(payload, codec, frames, channels, sample_rate, ffmpeg=FFMPEG):
+    """float32 (frames, channels) samples of one payload, trimmed or padded to its indexed length"""
+    if codec == 'pcm16':
+        samples = np.frombuffer(payload, dtype='<i2').reshape(-1, channels)
+    else:
+        samples = None
+        if codec == 'flac':
+            try:
+                import soundfile
+                samples, _ = soundfile.read(io.BytesIO(payload), dtype='int16', always_2d=True)
+            except ImportError:
+                pass
+        if samples is None:
+            # Opus decodes at 48kHz; ffmpeg resamples back to the stem's rate
+            raw = _ffmpeg(ffmpeg, [], payload, ['-f', 's16le', '-ar', str(sample_rate), '-ac', str(channels)])
+            samples = np.frombuffer(raw, dtype='<i2').reshape(-1, channels)
+    samples = to_float(samples)
+    if len(samples) >= frames:
+        return samples[:frames]
+    return np.concatenate([samples, np.zeros((frames - len(samples), channels), dtype=np.float32)])
+
+def write_pack(stem, output_path, codec='flac', chunk_seconds=CHUNK_SECONDS, ffmpeg=FFMPEG):
+    """Encode a mapped Stem into a pack at output_path; returns the index"""
+    if codec not in CODECS:
+        raise StemPackError(f"unknown codec {codec!r}")
+    step = max(1, int(chunk_seconds * stem.sample_rate))
+    chunks, offset = [], 0
+    data_path = f"{output_path}.data"
+    try:
+        # Chunks go to a side file first because the index (with their offsets) precedes them
+        with open(data_path, 'wb') as data:
+            for start in range(0, stem.frames, step):
+                block = stem.samples[start:start + step]
+                payload = encode_chunk(block, stem.sample_rate, codec, ffmpeg)
+                data.write(payload)
+                chunks.append([start, len(block), offset, len(payload)])
+                offset += len(payload)
+        index = {
+            'version': VERSION, 'codec': codec, 'sample_rate': stem.sample_rate, 'channels': stem.channels,
+            'frames': stem.frames, 'chunk_seconds': chunk_seconds, 'chunks': chunks,
+        }
+        encoded = json.dumps(index, separators=(',', ':')).encode('utf-8')
+        with open(output_path, 'wb') as out, open(data_path, 'rb') as data:
+            out.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+            shutil.copyfileobj(data, out, 1024 * 1024)
+    finally:
+        if os.path.exists(data_path):
+            os.remove(data_path)
+    return index
+
+def pack_wav(wav_path, output_path, codec='flac', chunk_seconds=CHUNK_SECONDS, ffmpeg=FFMPEG):
+    """write_pack() for a stem WAV on disk; returns {'path', 'codec', 'bytes', 'source_bytes'}"""
+    write_pack(open_wav(wav_path), output_path, codec, chunk_seconds, ffmpeg)
+    return {'path': output_path, 'codec': codec, 'bytes': os.path.getsize(output_path),
+            'source_bytes': os.path.getsize(wav_path)}
+
+def get_encoder():
+    """Process-wide pool for encoding packs off the caller's thread"""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            _encoder = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix='stem-encode')
+        return _encoder
+
+class StemPack:
+    """Reader over fetch(offset, length) -> bytes; read() pulls only the chunks a window needs"""
+
+    def __init__(self, fetch, ffmpeg=FFMPEG):
+        self._fetch = fetch
+        self.ffmpeg = ffmpeg
+        self.bytes_fetched = 0
+        head = self.fetch(0, HEAD_PROBE_BYTES)
+        if len(head) < 8 or head[:4] != MAGIC:
+            raise StemPackError("not a stem pack")
+        index_bytes = struct.unpack('<I', head[4:8])[0]
+        if 8 + index_bytes > len(head):
+            head += self.fetch(len(head), 8 + index_bytes - len(head))
+        self.index = json.loads(head[8:8 + index_bytes].decode('utf-8'))
+        self.data_offset = 8 + index_bytes
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        def fetch(offset, length):
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+        return cls(fetch, **kwargs)
+
+    @classmethod
+    def from_url(cls, url, session=None, **kwargs):
+        """Ranged HTTP reads, e.g. the public storage.googleapis.com URL of an uploaded pack"""
+        import requests
+        http = session or requests
+
+        def fetch(offset, length):
+            response = http.get(url, headers={'Range': f"bytes={offset}-{offset + length - 1}"}, timeout=60)
+            if response.status_code not in (200, 206):
+                raise StemPackError(f"HTTP {response.status_code} reading {url}")
+            # A server that ignores Range sends the whole object
+            return response.content[offset:offset + length] if response.status_code == 200 else response.content
+        return cls(fetch, **kwargs)
+
+    @classmethod
+    def from_blob(cls, blob, **kwargs):
+        """Ranged reads of a google-cloud-storage Blob"""
+        return cls(lambda offset, length: blob.download_as_bytes(start=offset, end=offset + length - 1), **kwargs)
+
+    def fetch(self, offset, length):
+        data = self._fetch(offset, length)
+        self.bytes_fetched += len(data)
+        return data
+
+    @property
+    def codec(self):
+        return self.index['codec']
+
+    @property
+    def sample_rate(self):
+        return self.index['sample_rate']
+
+    @property
+    def channels(self):
+        return self.index['channels']
+
+    @property
+    def frames(self):
+        return self.index['frames']
+
+    @property
+    def seconds(self):
+        return self.frames / float(self.sample_rate)
+
+    def chunks_for(self, start=0.0, end=None):
+        """Index entries [start_frame, frames, offset, length] overlapping a time window"""
+        first = int(start * self.sample_rate)
+        last = self.frames if end is None else int(end * self.sample_rate)
+        return [c for c in self.index['chunks'] if c[0] < last and c[0] + c[1] > first]
+
+    def read(self, start=0.0, end=None):
+        """float32 (frames, channels) samples between two times, from one ranged fetch"""
+        chunks = self.chunks_for(start, end)
+        first = max(0, int(start * self.sample_rate))
+        last = self.frames if end is None else min(self.frames, int(end * self.sample_rate))
+        if not chunks or last <= first:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        # Chunks are stored back to back, so a window is one contiguous byte range
+        base = chunks[0][2]
+        data = self.fetch(self.data_offset + base, chunks[-1][2] + chunks[-1][3] - base)
+        blocks = [decode_chunk(data[offset - base:offset - base + length], self.codec, frames,
+                               self.channels, self.sample_rate, self.ffmpeg)
+                  for _, frames, offset, length in chunks]
+        samples = np.concatenate(blocks)
+        return samples[first - chunks[0][0]:last - chunks[0][0]]
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Stem Store
+Stems live in the job workspace as plain WAV files (16-bit PCM or 32-bit float) whose
+sample data starts at a known offset, so the same file is
+
+- readable by ffmpeg, Whisper and the Spleeter image as an ordinary WAV, and
+- opened here as a read-only numpy memmap of shape (frames, channels)
+
+Mixing, chunking for transcription and loudness analysis take slices of that mapping
+instead of decoding the file again; only the pages they touch are read from disk.
+"""
+import os
+import struct
+import numpy as np
+from pipeline_profiler import run_subprocess
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+HEADER_BYTES = 44                  # RIFF + fmt (16 bytes) + data chunk header, as written here
+BLOCK_SECONDS = 10                 # working set of block-wise operations
+
+_DTYPES = {(WAVE_FORMAT_PCM, 16): np.dtype('<i2'), (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype('<f4')}
+_FFMPEG_FORMATS = {np.dtype('<i2'): 's16le', np.dtype('<f4'): 'f32le'}
+
+class StemFormatError(ValueError):
+    """Not a WAV layout the store can map (compressed, 24-bit, truncated...)"""
+
+class Stem:
+    """A memory-mapped WAV: `samples` is a read-only (frames, channels) array"""
+
+    def __init__(self, path, samples, sample_rate):
+        self.path = path
+        self.samples = samples
+        self.sample_rate = sample_rate
+
+    @property
+    def frames(self):
+        return self.samples.shape[0]
+
+    @property
+    def channels(self):
+        return self.samples.shape[1]
+
+    @property
+    def seconds(self):
+        return self.frames / float(self.sample_rate)
+
+    def frame_at(self, seconds):
+        return min(self.frames, max(0, int(round(seconds * self.sample_rate))))
+
+    def window(self, start=0.0, end=None):
+        """View of the samples between two times in seconds (no copy)"""
+        return self.samples[self.frame_at(start):self.frame_at(self.seconds if end is None else end)]
+
+    def blocks(self, block_seconds=BLOCK_SECONDS):
+        """(start_frame, view) pairs covering the whole stem"""
+        step = max(1, int(block_seconds * self.sample_rate))
+        for start in range(0, self.frames, step):
+            yield start, self.samples[start:start + step]
+
+def to_float(block):
+    """float32 copy of a block in [-1, 1] (int16 is scaled)"""
+    if block.dtype == np.int16:
+        return block.astype(np.float32) / 32768.0
+    return np.asarray(block, dtype=np.float32)
+
+def _header(frames, channels, sample_rate, dtype):
+    dtype = np.dtype(dtype)
+    tag = WAVE_FORMAT_PCM if dtype.kind == 'i' else WAVE_FORMAT_IEEE_FLOAT
+    block_align = channels * dtype.itemsize
+    data_bytes = frames * block_align
+    return (b'RIFF' + struct.pack('<I', 36 + data_bytes) + b'WAVE' +
+            b'fmt ' + struct.pack('<IHHIIHH', 16, tag, channels, sample_rate,
+                                  sample_rate * block_align, block_align, dtype.itemsize * 8) +
+            b'data' + struct.pack('<I', data_bytes))
+
+def create_wav(path, frames, channels, sample_rate, dtype=np.float32):
+    """Create a WAV of the given shape and return a writable (frames, channels) memmap of its data"""
+    dtype = np.dtype(dtype).newbyteorder('<')
+    with open(path, 'wb') as f:
+        f.write(_header(frames, channels, sample_rate, dtype))
+        f.truncate(HEADER_BYTES + frames * channels * dtype.itemsize)
+    if frames == 0:
+        return np.zeros((0, channels), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r+', offset=HEADER_BYTES, shape=(frames, channels))
+
+def write_wav(path, samples, sample_rate, dtype=np.float32):
+    """Write (frames, channels) or mono samples block by block; returns path"""
+    samples = samples if samples.ndim == 2 else samples[:, None]
+    out = create_wav(path, samples.shape[0], samples.shape[1], sample_rate, dtype)
+    step = BLOCK_SECONDS * sample_rate
+    for start in range(0, samples.shape[0], step):
+        block = samples[start:start + step]
+        if out.dtype == np.int16:
+            block = np.clip(to_float(block) * 32768.0, -32768, 32767)
+        out[start:start + step] = block
+    if isinstance(out, np.memmap):
+        out.flush()
+    del out
+    return path
+
+def open_wav(path):
+    """Map a PCM16 or float32 WAV written by any tool; raises StemFormatError otherwise"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise StemFormatError(f"{path} is not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise StemFormatError(f"{path} has no data chunk")
+            chunk_id, chunk_size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+            if chunk_id == b'fmt ':
+                body = f.read(chunk_size + (chunk_size & 1))
+                tag, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                    tag = struct.unpack('<H', body[24:26])[0]
+                fmt = (tag, channels, sample_rate, bits)
+            elif chunk_id == b'data':
+                offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    if fmt is None:
+        raise StemFormatError(f"{path} has no fmt chunk")
+    tag, channels, sample_rate, bits = fmt
+    dtype = _DTYPES.get((tag, bits))
+    if dtype is None:
+        raise StemFormatError(f"{path}: unsupported WAV encoding (format {tag}, {bits} bits)")
+    # Streaming writers leave the data size at 0 or 0xFFFFFFFF; trust the file length instead
+    data_bytes = chunk_size if 0 < chunk_size <= size - offset else size - offset
+    frames = data_bytes // (channels * dtype.itemsize)
+    if frames == 0:
+        return Stem(path, np.zeros((0, channels), dtype=dtype), sample_rate)
+    samples = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(frames, channels))
+    return Stem(path, samples, sample_rate)
+
+def try_open(path):
+    """open_wav(), or None when the file cannot be mapped (callers fall back to ffmpeg)"""
+    try:
+        return open_wav(path)
+    except (OSError, StemFormatError):
+        return None
+
+def mix_stems(vocals, accompaniment, vocal_level, output_path, vocal_gain=1.0, accompaniment_gain=1.0,
+              dtype=np.int16):
+    """accompaniment * accompaniment_gain + vocals * vocal_level * vocal_gain, block by block
+
+    Both stems must share sample rate and channel count; the shorter one is padded
+    with silence. Returns output_path.
+    """
+    if vocals.sample_rate != accompaniment.sample_rate or vocals.channels != accompaniment.channels:
+        raise StemFormatError("stems differ in sample rate or channel count")
+    frames = max(vocals.frames, accompaniment.frames)
+    out = create_wav(output_path, frames, accompaniment.channels, accompaniment.sample_rate, dtype)
+    step = BLOCK_SECONDS * accompaniment.sample_rate
+    for start in range(0, frames, step):
+        end = min(frames, start + step)
+        block = np.zeros((end - start, accompaniment.channels), dtype=np.float32)
+        acc = accompaniment.samples[start:end]
+        block[:len(acc)] += to_float(acc) * accompaniment_gain
+        voc = vocals.samples[start:end]
+        block[:len(voc)] += to_float(voc) * (vocal_level * vocal_gain)
+        if out.dtype == np.int16:
+            block = np.clip(block * 32768.0, -32768, 32767)
+        out[start:end] = block
+    if isinstance(out, np.memmap):
+        out.flush()
+    del out
+    return output_path
+
+def encode_window(ffmpeg, stem, start, end, output_path, output_args):
+    """Encode a time window of a mapped stem by piping its raw samples into ffmpeg"""
+    window = stem.window(start, end)
+    if len(window) == 0:
+        return None
+    cmd = [
+        ffmpeg, '-f', _FFMPEG_FORMATS[window.dtype.newbyteorder('<')],
+        '-ar', str(stem.sample_rate), '-ac', str(stem.channels), '-i', 'pipe:0'
+    ] + list(output_args) + [output_path, '-y']
+    run_subprocess(cmd, input=np.ascontiguousarray(window).tobytes(), text=False)
+    return output_path if os.path.exists(output_path) else None
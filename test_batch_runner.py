@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Offline test for the batch runner
+Checks download/separation overlap, batched separator calls, stored results and failures
+"""
+import time
+import threading
+from batch_runner import BatchItem, run_batch, summarize
+
+def make_items(n):
+    return [BatchItem(i, f"job{i}", {'video_url': f"https://x/{i}.mp4", 'seconds': 30}) for i in range(n)]
+
+def test_prepare_overlaps_separation():
+    """Item k+1 is prepared while item k separates, and results come back in order"""
+    events = []
+    lock = threading.Lock()
+
+    def log(event):
+        with lock:
+            events.append((event, time.perf_counter()))
+
+    def prepare(item):
+        log(f"prepare_start_{item.index}")
+        time.sleep(0.1)
+        log(f"prepare_end_{item.index}")
+        return item.data['seconds']
+
+    def separate_many(batch):
+        for item in batch:
+            log(f"separate_start_{item.index}")
+        time.sleep(0.1)
+        return [f"stems{item.index}" for item in batch]
+
+    def finish(item, separated):
+        return {'separated': separated}
+
+    items = run_batch(make_items(3), prepare, separate_many, finish, prefetch=2, max_batch_seconds=30)
+    times = dict(events)
+    assert [item.result['separated'] for item in items] == ['stems0', 'stems1', 'stems2']
+    assert all(item.status == 'completed' for item in items)
+    # Item 1 was being prepared before item 0 finished separating
+    assert times['prepare_start_1'] < times['separate_start_0'] + 0.1
+
+def test_ready_items_share_a_separator_call():
+    """Prepared items behind the head are separated together up to max_batch_seconds"""
+    calls = []
+
+    def separate_many(batch):
+        calls.append([item.index for item in batch])
+        return [item.index for item in batch]
+
+    items = run_batch(make_items(4), lambda item: item.data['seconds'], separate_many,
+                      lambda item, separated: {'stems': separated},
+                      seconds_of=lambda prepared: prepared, prefetch=4, max_batch_seconds=60)
+    assert sum(len(call) for call in calls) == 4
+    assert max(len(call) for call in calls) <= 2
+    assert [item.result['stems'] for item in items] == [0, 1, 2, 3]
+
+def test_stored_results_and_failures():
+    """Stored items are skipped; a failed download only fails its own item"""
+    prepared = []
+
+    def prepare(item):
+        prepared.append(item.index)
+        return None if item.index == 2 else 1
+
+    items = run_batch(make_items(4), prepare, lambda batch: [1] * len(batch),
+                      lambda item, separated: {'ok': True},
+                      lookup=lambda item: {'stored': True} if item.index == 0 else None)
+    assert 0 not in prepared
+    assert [item.status for item in items] == ['cached', 'completed', 'failed', 'completed']
+    assert items[2].error.startswith('prepare')
+    summary = summarize(items, 1.0)
+    assert summary['completed'] == 2 and summary['cached'] == 1 and summary['failed'] == 1
+
+if __name__ == "__main__":
+    print("🧪 Testing batch runner...")
+    test_prepare_overlaps_separation()
+    test_ready_items_share_a_separator_call()
+    test_stored_results_and_failures()
+    print("✅ Batch runner works!")
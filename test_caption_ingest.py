@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Offline test for caption ingest
+Stored caption fixtures (caption_fixtures/) and the trending_music .info.json files
+"""
+import os
+import json
+import glob
+import shutil
+import tempfile
+from stem_store import write_wav
+from caption_ingest import choose_track, download_options, find_caption_file, load_captions, caption_quality
+from karaoke_stages import lyrics_or_transcription
+from transcription_backends import TranscriptionBackend
+from word_timing import Word, Transcript
+from test_lyrics_alignment import synth_vocals, SAMPLE_RATE
+
+FIXTURES = 'caption_fixtures'
+LINES = ["Neon rivers run tonight", "we keep dancing in the light", "every heartbeat calls your name",
+         "nothing ever feels the same", "hold me closer through the rain", "we will sing it all again"]
+WORDS = " ".join(LINES).split()
+
+class Fixed(TranscriptionBackend):
+    name = 'fixed'
+
+    def transcribe(self, audio_path):
+        return Transcript([Word('la', 1.0, 1.2)])
+
+def fixture(name):
+    return load_captions(os.path.join(FIXTURES, name))
+
+def info(prefix):
+    with open(glob.glob(f'trending_music/{prefix}_*.info.json')[0]) as f:
+        return json.load(f)
+
+def test_track_choice():
+    assert choose_track(info('04')) == ('en-nP7-2PuUl7o', False)     # uploaded English captions
+    assert choose_track(info('05')) == ('en-orig', True)             # speech recognition, not a translation
+    assert choose_track(info('01')) is None                          # only live chat
+    assert download_options(info('05'))['subtitleslangs'] == ['en-orig']
+    assert download_options(info('01')) == {}
+
+def test_word_timed_tracks():
+    for name in ('song.en-orig.json3', 'song.en-orig.vtt'):
+        track = fixture(name)
+        assert track.word_timed and track.noise == 1
+        assert [w.word for w in track.transcript.words] == WORDS, name
+        assert track.lines == LINES
+        first = track.transcript.words[:2]
+        assert (first[0].start, first[0].end, first[1].start) == (2.0, 2.4, 2.4)
+        assert caption_quality(track, duration=30) is None
+
+def test_line_timed_track():
+    track = fixture('song.en.vtt')
+    assert not track.word_timed
+    assert track.lines == LINES                                      # the repeated cue is dropped
+    words = track.transcript.words
+    assert [w.word for w in words] == WORDS
+    assert words[0].start == 2.0 and abs(words[3].end - 3.6) < 1e-9
+    assert caption_quality(track) is None
+
+def test_quality_fallbacks():
+    music = fixture('intro.en-orig.json3')
+    assert caption_quality(music).startswith('only 1 words (6 [Music]')
+    song = fixture('song.en-orig.json3')
+    assert caption_quality(song, duration=10).startswith('runs past the audio')
+    assert caption_quality(song, duration=600).startswith('too sparse')
+    song.transcript.words[5].start = 0.5
+    assert caption_quality(song) == 'word times out of order'
+
+def test_captions_replace_transcription():
+    directory = tempfile.mkdtemp(prefix='caption_ingest_test_')
+    samples, _ = synth_vocals([line.split() for line in LINES])
+    vocals = write_wav(os.path.join(directory, 'vocals.wav'), samples, SAMPLE_RATE)
+    captions = shutil.copy(os.path.join(FIXTURES, 'song.en.vtt'), os.path.join(directory, 'video.en.vtt'))
+    music = shutil.copy(os.path.join(FIXTURES, 'intro.en-orig.json3'), directory)
+    # Line-timed captions are aligned to the vocals; a track of [Music] tags falls back
+    aligned = lyrics_or_transcription('/nonexistent/ffmpeg', vocals, None, None, backend=Fixed(), captions_path=captions)
+    assert [w.word for w in aligned.words] == WORDS
+    transcribed = lyrics_or_transcription('/nonexistent/ffmpeg', vocals, None, None, backend=Fixed(), captions_path=music)
+    assert [w.word for w in transcribed.words] == ['la']
+    shutil.rmtree(directory)
+
+def test_caption_file_lookup():
+    directory = tempfile.mkdtemp(prefix='caption_ingest_test_')
+    video = os.path.join(directory, '04_Selfish [Official].mp4')
+    assert find_caption_file(video) == ''
+    for name in ('04_Selfish [Official].en.vtt', '04_Selfish [Official].en-orig.json3'):
+        open(os.path.join(directory, name), 'w').close()
+    assert find_caption_file(video).endswith('.en-orig.json3')     # json3 keeps word times
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    print("🧪 Testing caption ingest...")
+    test_track_choice()
+    test_word_timed_tracks()
+    test_line_timed_track()
+    test_quality_fallbacks()
+    test_captions_replace_transcription()
+    test_caption_file_lookup()
+    print("✅ Caption ingest works!")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Offline test for idempotent processing jobs
+Duplicates attach to the running job, finished jobs are replayed, failures rerun
+"""
+import time
+import threading
+from job_coalescing import JobCoalescer, job_key
+
+class FakeStore:
+    """In-memory stand-in for the GCS claim and metadata objects"""
+
+    def __init__(self):
+        self.metadata = {}
+        self.claims = set()
+
+    def load(self, job_id):
+        return self.metadata.get(job_id)
+
+    def claim(self, job_id, lease):
+        if job_id in self.claims:
+            return False
+        self.claims.add(job_id)
+        return True
+
+    def claimed(self, job_id):
+        return job_id in self.claims
+
+    def release(self, job_id):
+        self.claims.discard(job_id)
+
+def respond(job_id, metadata):
+    return {'job_id': job_id, 'separated_audio': metadata['separated_audio_files']}
+
+def test_job_key():
+    """Keys ignore float formatting but not the fields; a client key wins"""
+    a = job_key('https://x/v.mp4', [0, 0.25], 30)
+    assert a == job_key('https://x/v.mp4', [0.0, 0.25], 30.0)
+    assert a != job_key('https://x/v.mp4', [0.0, 0.5], 30)
+    assert a != job_key('https://x/v.mp4', [0.0, 0.25], None)
+    assert a != job_key('https://x/v.mp4', [0, 0.25], 30, transcribe=True)
+    assert job_key('https://x/v.mp4', transcribe=True, lyrics='la la') != job_key('https://x/v.mp4', transcribe=True)
+    assert job_key('https://x/v.mp4', supplied='retry-1') == job_key('https://y/w.mp4', [0.5], supplied='retry-1')
+    assert len(a) == 16
+
+def test_in_flight_duplicates_attach():
+    """Three concurrent requests for one key run the job once"""
+    coalescer = JobCoalescer(FakeStore(), respond)
+    runs = []
+    started = threading.Event()
+
+    def job():
+        runs.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {'job_id': 'k1'}, 200
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(coalescer.run('k1', job))) for _ in range(3)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(runs) == 1
+    assert sorted(r[2] for r in results) == [False, True, True]
+    assert all(r[:2] == ({'job_id': 'k1'}, 200) for r in results)
+
+    # Finished: replayed from memory without running again
+    assert coalescer.run('k1', job) == ({'job_id': 'k1'}, 200, True)
+    assert len(runs) == 1
+
+def test_stored_results_and_failures():
+    """Another instance's stored metadata is returned; failed jobs are retried"""
+    store = FakeStore()
+    store.metadata['k2'] = {'separated_audio_files': [{'type': 'vocals'}]}
+    coalescer = JobCoalescer(store, respond)
+    payload, status, deduplicated = coalescer.run('k2', lambda: ({'fresh': True}, 200))
+    assert deduplicated and payload['separated_audio'] == [{'type': 'vocals'}]
+
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        return ({'error': 'Audio separation failed'}, 500) if len(attempts) == 1 else ({'ok': True}, 200)
+    assert coalescer.run('k3', flaky)[1] == 500
+    assert coalescer.run('k3', flaky) == ({'ok': True}, 200, False)
+    assert not store.claims
+
+def test_waits_for_other_instance():
+    """A claim held elsewhere is waited on until its metadata appears"""
+    store = FakeStore()
+    store.claims.add('k4')
+    coalescer = JobCoalescer(store, respond, poll_seconds=0.05)
+
+    def finish_elsewhere():
+        time.sleep(0.2)
+        store.metadata['k4'] = {'separated_audio_files': []}
+        store.release('k4')
+    threading.Thread(target=finish_elsewhere).start()
+
+    payload, status, deduplicated = coalescer.run('k4', lambda: ({'ran_here': True}, 200))
+    assert deduplicated and status == 200 and payload == {'job_id': 'k4', 'separated_audio': []}
+
+def test_batch_leads():
+    """begin()/end() claim jobs run outside run(); run() calls attach to them"""
+    store = FakeStore()
+    store.claims.add('elsewhere')
+    store.metadata['done'] = {'separated_audio_files': []}
+    coalescer = JobCoalescer(store, respond, poll_seconds=0.05)
+    assert coalescer.begin('done') == ('stored', {'job_id': 'done', 'separated_audio': []})
+    assert coalescer.begin('elsewhere') == ('busy', None) and 'elsewhere' not in coalescer._running
+    assert coalescer.begin('b1') == ('lead', None) and store.claimed('b1')
+    assert coalescer.begin('b1') == ('busy', None)
+
+    results = []
+    attached = threading.Thread(target=lambda: results.append(coalescer.run('b1', lambda: ({'ran': True}, 200))))
+    attached.start()
+    time.sleep(0.1)
+    coalescer.end('b1', {'batch': True})
+    attached.join()
+    assert results == [({'batch': True}, 200, True)] and not store.claimed('b1')
+
+    # A failed lead is rerun by the requests that were waiting on it
+    assert coalescer.begin('b2') == ('lead', None)
+    attached = threading.Thread(target=lambda: results.append(coalescer.run('b2', lambda: ({'ran': True}, 200))))
+    attached.start()
+    time.sleep(0.1)
+    coalescer.end('b2')
+    attached.join()
+    assert results[-1] == ({'ran': True}, 200, False) and not store.claims - {'elsewhere'}
+
+if __name__ == "__main__":
+    print("🧪 Testing job coalescing...")
+    test_job_key()
+    test_in_flight_duplicates_attach()
+    test_stored_results_and_failures()
+    test_waits_for_other_instance()
+    test_batch_leads()
+    print("✅ Job coalescing works!")
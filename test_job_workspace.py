@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Offline test for per-job workspaces
+Checks isolation, byte accounting, caps and cleanup on failure
+"""
+import os
+import time
+import tempfile
+from job_workspace import JobWorkspace, WorkspaceHook, WorkspaceFull, sweep_stale, instance_bytes, PREFIX
+from pipeline_engine import Pipeline, Stage
+from pipeline_profiler import render_metrics
+
+def write_bytes(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    return path
+
+def test_jobs_are_isolated_and_cleaned_up():
+    """Two jobs writing the same names never collide, and both directories go away"""
+    with JobWorkspace('job-a') as a, JobWorkspace('job-b') as b:
+        write_bytes(a.path('vocals.wav'), 100)
+        write_bytes(b.path('vocals.wav'), 300)
+        write_bytes(a.path('audio_chunks', 'chunk_000.wav'), 50)
+        assert a.dir != b.dir
+        assert a.measure() == 150 and b.measure() == 300
+        assert instance_bytes() >= 450
+        dirs = (a.dir, b.dir)
+    assert not any(os.path.exists(d) for d in dirs)
+    assert a.peak_bytes == 150
+    assert 'karaoke_workspaces_active{backing="disk"} 0' in render_metrics()
+
+    crashed_dir = None
+    try:
+        with JobWorkspace('job-c') as c:
+            crashed_dir = c.dir
+            write_bytes(c.path('input.mp4'), 10)
+            raise RuntimeError('stage crashed')
+    except RuntimeError:
+        pass
+    assert crashed_dir and not os.path.exists(crashed_dir)
+
+def test_backings_fall_back_to_disk():
+    """shm is used when available; an unmounted tmpfs falls back to disk"""
+    with JobWorkspace('job-shm', backing='shm') as workspace:
+        expected = 'shm' if os.access('/dev/shm', os.W_OK) else 'disk'
+        assert workspace.backing == expected
+        assert os.path.isdir(workspace.dir)
+    with JobWorkspace('job-tmpfs', backing='tmpfs') as workspace:
+        assert workspace.backing in ('tmpfs', 'disk')
+
+def test_caps_fail_the_stage():
+    """A stage that starts over the job cap fails and skips its dependents"""
+    with JobWorkspace('job-cap', max_bytes=1000) as workspace:
+        pipeline = Pipeline([
+            Stage('decode', lambda: write_bytes(workspace.path('audio.wav'), 5000), outputs=['audio_path']),
+            Stage('separate', lambda audio_path: audio_path, inputs=['audio_path'], outputs=['vocals_path']),
+        ])
+        result = pipeline.run({}, hooks=[WorkspaceHook(workspace)])
+        assert result.status('decode') == 'success'
+        assert result.status('separate') == 'failed'
+        assert result.failed[0]['error_type'] == 'WorkspaceFull'
+        assert workspace.peak_bytes == 5000
+
+        try:
+            workspace.check(extra_bytes=10)
+            assert False, 'expected WorkspaceFull'
+        except WorkspaceFull:
+            pass
+
+    with JobWorkspace('job-instance', instance_max_bytes=100) as workspace:
+        write_bytes(workspace.path('a.wav'), 80)
+        workspace.check()
+        try:
+            workspace.check(extra_bytes=50)
+            assert False, 'expected WorkspaceFull'
+        except WorkspaceFull:
+            pass
+
+def test_sweep_stale():
+    """Leftovers from a crashed process are removed, open workspaces are kept"""
+    stale = tempfile.mkdtemp(prefix=f"{PREFIX}crashed-", dir=tempfile.gettempdir())
+    old = time.time() - 7200
+    os.utime(stale, (old, old))
+    with JobWorkspace('job-live') as live:
+        os.utime(live.dir, (old, old))
+        assert sweep_stale(max_age_seconds=3600, backings=('disk',)) >= 1
+        assert os.path.isdir(live.dir)
+    assert not os.path.exists(stale)
+
+if __name__ == "__main__":
+    print("🧪 Testing job workspaces...")
+    test_jobs_are_isolated_and_cleaned_up()
+    test_backings_fall_back_to_disk()
+    test_caps_fail_the_stage()
+    test_sweep_stale()
+    print("✅ Job workspaces work!")
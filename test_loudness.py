@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Offline test for the loudness analysis
+Checks BS.1770 loudness against the EBU reference tone, true peak, and that mixes
+scaled by the analytic gains land on the target
+"""
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+import loudness
+from stem_store import write_wav, open_wav, mix_stems
+from karaoke_stages import analyze_loudness, mix_vocal_level
+
+SAMPLE_RATE = 48000
+
+def tone(frequency, amplitude, seconds, phase=0.0):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    wave = amplitude * np.sin(2 * np.pi * frequency * t + phase)
+    return np.stack([wave, wave], axis=1).astype(np.float32)
+
+def stems(directory, vocals, accompaniment):
+    return (open_wav(write_wav(os.path.join(directory, 'vocals.wav'), vocals, SAMPLE_RATE)),
+            open_wav(write_wav(os.path.join(directory, 'accompaniment.wav'), accompaniment, SAMPLE_RATE)))
+
+def measured(path):
+    """Integrated loudness of a mixed file"""
+    stem = open_wav(path)
+    return loudness.gated_loudness(loudness.hop_powers(stem, stem)[0])
+
+def test_reference_tone():
+    """EBU Tech 3341: a stereo 1kHz sine at -23dBFS reads -23 LUFS"""
+    directory = tempfile.mkdtemp(prefix='loudness_test_')
+    vocals, accompaniment = stems(directory, tone(1000, 0, 20), tone(1000, 10 ** (-23 / 20), 20))
+    _, power_a, _ = loudness.hop_powers(vocals, accompaniment)
+    assert abs(loudness.gated_loudness(power_a) + 23.0) < 0.1
+    assert loudness.gated_loudness(np.zeros(50)) is None
+    shutil.rmtree(directory)
+
+def test_true_peak_finds_inter_sample_peaks():
+    """A sine at fs/4 sampled 45 degrees off its peaks has samples at 0.707 of the true peak"""
+    directory = tempfile.mkdtemp(prefix='loudness_test_')
+    signal = tone(SAMPLE_RATE / 4, 0.5, 2, phase=np.pi / 4)
+    vocals, accompaniment = stems(directory, signal, signal)
+    assert np.abs(signal).max() < 0.36
+    peak_v, _, mixes = loudness.true_peaks(vocals, accompaniment, [1.0])
+    assert 0.49 < peak_v < 0.52
+    assert 0.98 < mixes[1.0] < 1.04
+    shutil.rmtree(directory)
+
+def test_mixes_land_on_target():
+    directory = tempfile.mkdtemp(prefix='loudness_test_')
+    rng = np.random.default_rng(1)
+    vocals_samples = tone(440, 0.3, 30) * (np.arange(30 * SAMPLE_RATE) % SAMPLE_RATE < SAMPLE_RATE / 2)[:, None]
+    accompaniment_samples = tone(110, 0.2, 30) + 0.05 * rng.standard_normal((30 * SAMPLE_RATE, 2)).astype(np.float32)
+    vocals, accompaniment = stems(directory, vocals_samples, accompaniment_samples)
+    analysis = loudness.analyze(vocals, accompaniment, [0.0, 0.25, 0.5])
+    # The analysis is stored as JSON and used from there
+    analysis = json.loads(json.dumps(analysis))
+    assert set(analysis['mixes']) == {'0', '0.25', '0.5'}
+    for level in (0.0, 0.25, 0.5, 0.8):      # 0.8 was not analyzed up front
+        gain = loudness.mix_gain(analysis, level)
+        mixed = mix_stems(vocals, accompaniment, level, os.path.join(directory, f"mix_{level}.wav"),
+                          vocal_gain=gain, accompaniment_gain=gain, dtype=np.float32)
+        assert abs(measured(mixed) - loudness.TARGET_LUFS) < 0.1
+    assert 'envelopes' not in loudness.summary(analysis)
+    shutil.rmtree(directory)
+
+def test_gain_respects_true_peak_ceiling():
+    directory = tempfile.mkdtemp(prefix='loudness_test_')
+    # Quiet on average but with loud clicks: the target would push the peaks over the ceiling
+    accompaniment_samples = tone(1000, 0.01, 10)
+    accompaniment_samples[::SAMPLE_RATE] = 0.9
+    vocals, accompaniment = stems(directory, tone(1000, 0, 10), accompaniment_samples)
+    settings = loudness.analyze(vocals, accompaniment, [0.0])['mixes']['0']
+    assert settings['true_peak_db'] + settings['gain_db'] <= loudness.TRUE_PEAK_CEILING + 0.01
+    assert settings['integrated_lufs'] + settings['gain_db'] < loudness.TARGET_LUFS
+    shutil.rmtree(directory)
+
+def test_stage_functions():
+    directory = tempfile.mkdtemp(prefix='loudness_test_')
+    vocals, accompaniment = stems(directory, tone(440, 0.2, 5), tone(220, 0.2, 5))
+    analysis = analyze_loudness(vocals.path, accompaniment.path, [0.25])
+    mixed = mix_vocal_level('ffmpeg', vocals.path, accompaniment.path, 0.25,
+                            os.path.join(directory, 'mixed.wav'), analysis)
+    assert abs(measured(mixed) - loudness.TARGET_LUFS) < 0.2
+    # Without an analysis the 0% mix is the accompaniment itself
+    assert mix_vocal_level('ffmpeg', vocals.path, accompaniment.path, 0, 'unused.wav') == accompaniment.path
+    assert analyze_loudness(os.path.join(directory, 'missing.wav'), accompaniment.path) == {}
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    print("🧪 Testing loudness analysis...")
+    test_reference_tone()
+    test_true_peak_finds_inter_sample_peaks()
+    test_mixes_land_on_target()
+    test_gain_respects_true_peak_ceiling()
+    test_stage_functions()
+    print("✅ Loudness analysis works!")
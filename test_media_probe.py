@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Offline test for the media probe
+Reads WAV headers directly, parses ffprobe JSON and memoizes per path/size/mtime
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+import media_probe
+from stem_store import write_wav
+from media_probe import probe, from_ffprobe, MediaProbeError
+
+FFPROBE_JSON = {
+    'streams': [
+        {'index': 0, 'codec_type': 'video', 'codec_name': 'h264', 'width': 1920, 'height': 1080,
+         'avg_frame_rate': '30000/1001', 'r_frame_rate': '30000/1001', 'duration': '212.212000'},
+        {'index': 1, 'codec_type': 'audio', 'codec_name': 'aac', 'sample_rate': '44100', 'channels': 2,
+         'avg_frame_rate': '0/0', 'duration': '212.253000'},
+    ],
+    'format': {'format_name': 'mov,mp4,m4a,3gp,3g2,mj2', 'duration': '212.253000', 'size': '8123456',
+               'bit_rate': '306210'},
+}
+
+def test_wav_header_without_ffprobe():
+    directory = tempfile.mkdtemp(prefix='media_probe_test_')
+    path = write_wav(os.path.join(directory, 'vocals.wav'), np.zeros((8000 * 3, 2), dtype=np.float32), 8000)
+    media_probe.clear_cache()
+    info = probe(path, ffprobe='/nonexistent/ffprobe')
+    assert abs(info.duration - 3.0) < 1e-9
+    assert info.sample_rate == 8000 and info.channels == 2
+    assert info.video is None and info.resolution is None
+    shutil.rmtree(directory)
+
+def test_ffprobe_json():
+    info = from_ffprobe('song.mp4', FFPROBE_JSON)
+    assert abs(info.duration - 212.253) < 1e-9
+    assert info.audio.codec == 'aac' and info.sample_rate == 44100 and info.channels == 2
+    assert info.resolution == (1920, 1080)
+    assert abs(info.fps - 29.97) < 0.01
+    assert info.audio.fps is None
+    assert info.to_dict()['streams'][0]['codec'] == 'h264'
+
+def test_duration_falls_back_to_streams():
+    info = from_ffprobe('song.webm', {'format': {}, 'streams': FFPROBE_JSON['streams']})
+    assert abs(info.duration - 212.253) < 1e-9
+
+def test_memoized_per_mtime():
+    directory = tempfile.mkdtemp(prefix='media_probe_test_')
+    path = os.path.join(directory, 'video.mp4')
+    with open(path, 'wb') as f:
+        f.write(b'not really a video')
+    calls = []
+
+    def fake_ffprobe(source, ffprobe):
+        calls.append(source)
+        return from_ffprobe(source, FFPROBE_JSON)
+
+    original = media_probe._run_ffprobe
+    media_probe._run_ffprobe = fake_ffprobe
+    try:
+        media_probe.clear_cache()
+        first = probe(path)
+        assert probe(path) is first and len(calls) == 1
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+        probe(path)
+        assert len(calls) == 2
+    finally:
+        media_probe._run_ffprobe = original
+        shutil.rmtree(directory)
+
+def test_unreadable_inputs_raise():
+    directory = tempfile.mkdtemp(prefix='media_probe_test_')
+    try:
+        probe(os.path.join(directory, 'missing.mp4'))
+        assert False, "expected MediaProbeError"
+    except MediaProbeError:
+        pass
+    path = os.path.join(directory, 'video.mp4')
+    with open(path, 'wb') as f:
+        f.write(b'x')
+    try:
+        probe(path, ffprobe='/nonexistent/ffprobe')
+        assert False, "expected MediaProbeError"
+    except MediaProbeError:
+        pass
+    assert media_probe.duration(path, ffprobe='/nonexistent/ffprobe') is None
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    print("🧪 Testing media probe...")
+    test_wav_header_without_ffprobe()
+    test_ffprobe_json()
+    test_duration_falls_back_to_streams()
+    test_memoized_per_mtime()
+    test_unreadable_inputs_raise()
+    print("✅ Media probe works!")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Offline test for the pipeline engine and shared subtitle builders
+Runs small stage graphs with sleeps and fake files; no ffmpeg, Docker or OpenAI needed
+"""
+import os
+import sys
+import time
+import tempfile
+from pipeline_engine import Pipeline, Stage, PipelineError, ProfilerHook, MemoCacheHook
+from pipeline_profiler import JobProfiler, run_subprocess
+from word_timing import Word, Transcript, merge_transcripts
+from karaoke_stages import write_subtitles
+
+def slow(value, seconds=0.3):
+    time.sleep(seconds)
+    return value
+
+def test_independent_branches_run_concurrently():
+    """transcribe and mix only depend on separate, so they overlap"""
+    pipeline = Pipeline([
+        Stage('separate', lambda audio: (audio + ':vocals', audio + ':accompaniment'),
+              inputs=['audio'], outputs=['vocals', 'accompaniment']),
+        Stage('transcribe', lambda vocals: slow(['la', 'la']), inputs=['vocals'], outputs=['transcript']),
+        Stage('mix', lambda vocals, accompaniment: slow(accompaniment + '+' + vocals),
+              inputs=['vocals', 'accompaniment'], outputs=['mix']),
+        Stage('render', lambda transcript, mix: f"{mix} with {len(transcript)} words",
+              inputs=['transcript', 'mix'], outputs=['video']),
+    ])
+
+    start = time.perf_counter()
+    result = pipeline.run({'audio': 'song'})
+    elapsed = time.perf_counter() - start
+    print(f"⏱️ Two 0.3s branches finished in {elapsed:.2f}s")
+
+    assert result.ok
+    assert result.get('video') == 'song:accompaniment+song:vocals with 2 words'
+    assert elapsed < 0.55
+
+def test_failure_skips_dependents_only():
+    """A stage returning None fails; its dependents are skipped, other branches still run"""
+    pipeline = Pipeline([
+        Stage('transcribe', lambda vocals: None, inputs=['vocals'], outputs=['transcript']),
+        Stage('subtitle', lambda transcript: 'subs.ass', inputs=['transcript'], outputs=['subtitles']),
+        Stage('render', lambda subtitles: 'video.mp4', inputs=['subtitles'], outputs=['video']),
+        Stage('mix', lambda vocals: vocals + '.mix', inputs=['vocals'], outputs=['mix']),
+    ])
+    result = pipeline.run({'vocals': 'v'})
+
+    assert result.status('transcribe') == 'failed'
+    assert 'produced no transcript' in result.error()
+    assert result.status('subtitle') == 'skipped'
+    assert result.status('render') == 'skipped'
+    assert result.get('mix') == 'v.mix'
+
+def test_invalid_graphs():
+    try:
+        Pipeline([Stage('a', lambda y: y, inputs=['y'], outputs=['x']),
+                  Stage('b', lambda x: x, inputs=['x'], outputs=['y'])])
+        assert False, "cycle not detected"
+    except PipelineError:
+        pass
+
+    try:
+        Pipeline([Stage('a', lambda src: src, inputs=['src'], outputs=['x'])]).run({})
+        assert False, "missing input not detected"
+    except PipelineError:
+        pass
+
+def test_profiler_and_cache_hooks():
+    """Worker-thread stages land on the job profiler; cached stages skip on identical content"""
+    work_dir = tempfile.mkdtemp(prefix='engine_test_')
+    first = os.path.join(work_dir, 'job1_vocals.wav')
+    second = os.path.join(work_dir, 'job2_vocals.wav')
+    for path in (first, second):
+        with open(path, 'wb') as f:
+            f.write(b'RIFF' + b'\0' * 4096)
+
+    calls = []
+
+    def transcribe(vocals):
+        calls.append(vocals)
+        run_subprocess([sys.executable, '-c', 'pass'])
+        return Transcript([Word('hello', 0.0, 0.5)])
+
+    pipeline = Pipeline([
+        Stage('transcribe', transcribe, inputs=['vocals'], outputs=['transcript'], cache=True),
+        Stage('mix_25', lambda vocals: vocals, inputs=['vocals'], outputs=['mix_25'], profile_as='mix'),
+    ])
+    cache = MemoCacheHook()
+
+    with JobProfiler('engine01', 'engine-test') as profiler:
+        result = pipeline.run({'vocals': first}, hooks=[ProfilerHook(profiler), cache])
+    second_result = pipeline.run({'vocals': second}, hooks=[cache])
+
+    timeline = profiler.timeline()
+    stages = {s['stage']: s for s in timeline['stages']}
+    assert result.ok and second_result.ok
+    assert set(stages) == {'transcribe', 'mix'}
+    assert stages['transcribe']['subprocesses'][0]['returncode'] == 0
+    assert stages['transcribe']['bytes_in'] == 4100
+    assert stages['mix']['bytes_out'] == 4100
+    assert calls == [first]
+    assert second_result.status('transcribe') == 'cached'
+    assert cache.hits == 1
+
+    # The same vocals through a stage built with other settings (another backend) run again
+    other = Pipeline([Stage('transcribe', transcribe, inputs=['vocals'], outputs=['transcript'], cache=('local',))])
+    assert other.run({'vocals': second}, hooks=[cache]).status('transcribe') == 'success'
+    assert calls == [first, second]
+
+    # An input that cannot be fingerprinted by content (a set here) is never cached
+    uncached = Pipeline([Stage('transcribe', lambda vocals, words: transcribe(vocals), inputs=['vocals', 'words'],
+                               outputs=['transcript'], cache=True)])
+    for _ in range(2):
+        assert uncached.run({'vocals': first, 'words': {'la'}}, hooks=[cache]).status('transcribe') == 'success'
+    assert calls == [first, second, first, first]
+    os.remove(first)
+    os.remove(second)
+    os.rmdir(work_dir)
+
+def test_concurrent_stages_keep_their_own_cpu():
+    """A sleeping stage is not charged the CPU of the busy stage (or child) next to it"""
+    def spin(seconds):
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            pass
+        return 'spun'
+
+    def busy_child():
+        run_subprocess([sys.executable, '-c', 'import time\nt = time.time()\nwhile time.time() - t < 0.4: pass'])
+        return 'child'
+
+    pipeline = Pipeline([
+        Stage('spin', lambda audio: spin(0.4), inputs=['audio'], outputs=['spun'], profile_as='separate'),
+        Stage('child', lambda audio: busy_child(), inputs=['audio'], outputs=['child'], profile_as='encode'),
+        Stage('sleep', lambda audio: slow('slept', 0.4), inputs=['audio'], outputs=['slept'], profile_as='upload'),
+    ])
+    with JobProfiler('engine02', 'engine-test') as profiler:
+        assert pipeline.run({'audio': 'song'}, hooks=[ProfilerHook(profiler)]).ok
+    stages = {s['stage']: s for s in profiler.timeline()['stages']}
+    # The spinning thread shares the GIL, so it gets roughly half of its 0.4s
+    assert stages['separate']['cpu_seconds'] > 0.1 and stages['separate']['child_cpu_seconds'] == 0
+    assert stages['encode']['child_cpu_seconds'] > 0.1
+    assert stages['encode']['subprocesses'][0]['cpu_seconds'] == stages['encode']['child_cpu_seconds']
+    assert stages['upload']['cpu_seconds'] < 0.05 and stages['upload']['child_cpu_seconds'] == 0
+
+def test_subtitle_presets():
+    transcript = merge_transcripts([
+        (0.0, Transcript([Word('ਜੀ', 0.0, 0.4), Word('ਆ', 0.5, 0.9)])),
+        (5.0, Transcript([Word('hello.', 0.0, 0.5)])),
+    ])
+    path = os.path.join(tempfile.gettempdir(), 'engine_test.ass')
+
+    write_subtitles(transcript, path, 'equal_size')
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    assert 'Style: English,Arial,32' in content
+    assert 'Dialogue: 1,0:00:00.00,0:00:00.40,English,,0,0,0,,{\\c&H00ccff&\\3c&H0066cc&}ji{\\c&Hffffff&\\3c&H000000&} aa\\N' in content
+    assert 'Dialogue: 0,0:00:05.00,0:00:05.50,Gurmukhi' in content
+
+    write_subtitles(transcript, path, 'lyrics')
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    assert '{\\k40}ਜੀ{\\k50}ਆ{\\k4' in content and 'hello.\\N' in content
+    os.remove(path)
+
+if __name__ == "__main__":
+    print("🧪 Testing pipeline engine...")
+    test_independent_branches_run_concurrently()
+    test_failure_skips_dependents_only()
+    test_invalid_graphs()
+    test_profiler_and_cache_hooks()
+    test_concurrent_stages_keep_their_own_cpu()
+    test_subtitle_presets()
+    print("✅ Pipeline engine works!")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Offline test for the pipeline stage profiler
+Runs a fake job with a child process and checks the timeline and /metrics text
+"""
+import os
+import sys
+import json
+import tempfile
+from pipeline_profiler import JobProfiler, profile_stage, run_subprocess, render_metrics
+
+def test_job_timeline():
+    """Stages are recorded with timing, bytes and subprocess accounting"""
+    with JobProfiler('test0001', 'profiler-test') as profiler:
+        with profile_stage('decode') as stage:
+            stage.add_input(1024)
+            result = run_subprocess([sys.executable, '-c', 'sum(range(200000))'])
+            stage.add_output(2048)
+
+        with profile_stage('separate'):
+            sum(range(100000))
+
+    timeline = profiler.timeline()
+    print(f"⏱️ Timeline: {json.dumps(timeline['stage_totals'])}")
+
+    assert result.returncode == 0
+    assert timeline['status'] == 'success'
+    assert [s['stage'] for s in timeline['stages']] == ['decode', 'separate']
+
+    decode = timeline['stages'][0]
+    assert decode['bytes_in'] == 1024 and decode['bytes_out'] == 2048
+    assert decode['subprocesses'][0]['returncode'] == 0
+    assert decode['child_cpu_seconds'] >= 0
+    assert decode['peak_rss_mb'] > 0
+
+    path = profiler.save(os.path.join(tempfile.gettempdir(), 'test0001_timeline.json'))
+    with open(path) as f:
+        assert json.load(f)['job_id'] == 'test0001'
+    os.remove(path)
+
+def test_failed_job_and_metrics():
+    """Failed stages mark the job and show up in the metrics exposition"""
+    try:
+        with JobProfiler('test0002', 'profiler-test'):
+            with profile_stage('upload'):
+                raise RuntimeError('bucket unavailable')
+    except RuntimeError:
+        pass
+
+    metrics = render_metrics()
+    assert 'karaoke_stage_runs_total{service="profiler-test",stage="upload",status="error"} 1' in metrics
+    assert 'karaoke_jobs_total{service="profiler-test",status="failed"} 1' in metrics
+    assert 'karaoke_stage_wall_seconds_bucket' in metrics
+    assert 'process_resident_memory_bytes' in metrics
+    print("📈 Metrics exposition OK")
+
+def test_stage_without_profiler():
+    """profile_stage is a no-op outside of a job"""
+    with profile_stage('mix') as stage:
+        stage.add_input(10)
+
+if __name__ == "__main__":
+    print("🧪 Testing pipeline profiler...")
+    test_job_timeline()
+    test_failed_job_and_metrics()
+    test_stage_without_profiler()
+    print("✅ Pipeline profiler works!")
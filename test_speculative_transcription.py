@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Offline test for speculative transcription
+Windows are cut in silences and transcribed as they arrive; a stand-in Whisper
+returns one word per window at its local time
+"""
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import karaoke_stages
+from karaoke_stages import SpeculativeTranscriber, quietest_cut
+from word_timing import Transcript, Word
+
+SAMPLE_RATE = 8000
+
+def phrases(seconds, gaps):
+    """Noise everywhere except half-second silences centered on `gaps`"""
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-0.3, 0.3, (int(seconds * SAMPLE_RATE), 2)).astype(np.float32)
+    for gap in gaps:
+        samples[int((gap - 0.25) * SAMPLE_RATE):int((gap + 0.25) * SAMPLE_RATE)] = 0
+    return samples
+
+def test_quietest_cut_finds_the_gap():
+    samples = phrases(12, [7.0])
+    cut = quietest_cut(samples, SAMPLE_RATE, 10 * SAMPLE_RATE, search_seconds=5)
+    assert abs(cut / SAMPLE_RATE - 7.0) < 0.25
+
+def test_windows_transcribed_while_feeding():
+    samples = phrases(50, [8.5, 17.0, 26.0, 35.0])
+    directory = tempfile.mkdtemp(prefix='speculative_test_')
+    requests = []
+    first_request = threading.Event()
+
+    def fake_whisper(path, api_key):
+        requests.append(path)
+        first_request.set()
+        return Transcript([Word('la', 0.5, 0.9)])
+
+    original = karaoke_stages.whisper_request
+    karaoke_stages.whisper_request = fake_whisper
+    try:
+        transcriber = SpeculativeTranscriber('/nonexistent/ffmpeg', 'key', directory, SAMPLE_RATE,
+                                             window_seconds=10, max_workers=2)
+        for start in range(0, len(samples), 3 * SAMPLE_RATE):
+            transcriber.feed(samples[start:start + 3 * SAMPLE_RATE])
+            if start >= 15 * SAMPLE_RATE:
+                # Requests go out during separation, not after it
+                assert first_request.wait(5)
+        transcript = transcriber.finish()
+    finally:
+        karaoke_stages.whisper_request = original
+    starts = [word.start for word in transcript.words]
+    assert len(requests) == len(starts) >= 4
+    # Windows end in the silences, so each word lands right after a gap
+    assert all(abs(a - b) < 0.3 for a, b in zip(starts[1:], [8.5 + 0.5, 17.0 + 0.5, 26.0 + 0.5, 35.0 + 0.5]))
+    assert os.listdir(directory) == []
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    print("🧪 Testing speculative transcription...")
+    test_quietest_cut_finds_the_gap()
+    test_windows_transcribed_while_feeding()
+    print("✅ Speculative transcription works!")
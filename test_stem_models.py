@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Offline test for stem selection
+Checks model choice, derived stems, the per-stem index and job ids
+"""
+import json
+import numpy as np
+from stem_models import (normalize_stems, choose_model, model_stems, derive_stems, source_key,
+                         GcsStemIndex, DEFAULT_STEMS)
+from job_coalescing import job_key
+
+def test_cheapest_model_covers_the_request():
+    assert choose_model(['vocals', 'accompaniment']) == 'spleeter:2stems-16kHz'
+    assert choose_model(['drums']) == 'spleeter:4stems-16kHz'
+    assert choose_model(['no_bass', 'vocals']) == 'spleeter:4stems-16kHz'
+    assert choose_model(['piano']) == 'spleeter:5stems-16kHz'
+    assert 'accompaniment' in model_stems('spleeter:4stems-16kHz')
+    assert 'no_piano' not in model_stems('spleeter:4stems-16kHz')
+
+def test_normalize_stems():
+    assert normalize_stems(None) == list(DEFAULT_STEMS)
+    assert normalize_stems('drums') == ['drums']
+    assert normalize_stems(['bass', 'vocals', 'bass']) == ['vocals', 'bass']
+    try:
+        normalize_stems(['vocals', 'kazoo'])
+        assert False, 'unknown stem'
+    except ValueError as e:
+        assert 'kazoo' in str(e)
+
+def test_derive_only_requested_stems():
+    prediction = {name: np.full((4, 2), value, dtype=np.float32)
+                  for name, value in (('vocals', 1), ('drums', 2), ('bass', 4), ('other', 8))}
+    derived = derive_stems(prediction, ['accompaniment', 'no_bass'])
+    assert set(derived) == {'accompaniment', 'no_bass'}
+    assert derived['accompaniment'][0, 0] == 14
+    assert derived['no_bass'][0, 0] == 11
+    # The prediction itself is not modified
+    assert prediction['drums'][0, 0] == 2
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket.objects[self.name] = data
+
+    def download_as_text(self):
+        return self.bucket.objects[self.name]
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix=''):
+        return [FakeBlob(self, name) for name in sorted(self.objects) if name.startswith(prefix)]
+
+def test_stem_index_keeps_one_entry_per_stem():
+    bucket = FakeBucket()
+    index = GcsStemIndex(lambda: bucket)
+    source = source_key('https://x/song.mp4')
+    index.save(source, 'vocals', {'type': 'vocals', 'url': 'u1'})
+    index.save(source, 'drums', {'type': 'drums', 'url': 'u2'})
+    index.save(source_key('https://x/other.mp4'), 'vocals', {'type': 'vocals', 'url': 'u3'})
+    assert index.load(source) == {'vocals': {'type': 'vocals', 'url': 'u1'}, 'drums': {'type': 'drums', 'url': 'u2'}}
+    assert json.loads(bucket.objects[f"karaoke/stems/{source}/drums.json"])['url'] == 'u2'
+    assert source_key('https://x/song.mp4', 30) != source
+
+def test_default_stems_keep_their_job_ids():
+    assert job_key('https://x/a.mp4', [0.0], None) == job_key('https://x/a.mp4', [0.0], None, stems=None)
+    assert job_key('https://x/a.mp4', [0.0], None, stems=['drums']) != job_key('https://x/a.mp4', [0.0], None)
+
+if __name__ == "__main__":
+    print("🧪 Testing stem selection...")
+    test_cheapest_model_covers_the_request()
+    test_normalize_stems()
+    test_derive_only_requested_stems()
+    test_stem_index_keeps_one_entry_per_stem()
+    test_default_stems_keep_their_job_ids()
+    print("✅ Stem selection works!")
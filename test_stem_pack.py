@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Offline test for stem packs
+Round-trips PCM16 packs and checks that window reads fetch only the chunks they cover
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+from stem_store import write_wav, open_wav
+from stem_pack import StemPack, StemPackError, write_pack, pack_wav, decode_chunk
+
+SAMPLE_RATE = 8000
+
+def make_stem(directory, seconds=35):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    samples = np.stack([0.5 * np.sin(2 * np.pi * 220 * t), 0.25 * np.sin(2 * np.pi * 330 * t)], axis=1)
+    return write_wav(os.path.join(directory, 'vocals.wav'), samples.astype(np.float32), SAMPLE_RATE), samples
+
+def test_pcm16_round_trip():
+    directory = tempfile.mkdtemp(prefix='stem_pack_test_')
+    wav_path, samples = make_stem(directory)
+    packed = pack_wav(wav_path, os.path.join(directory, 'vocals.pcm16.kstp'), 'pcm16')
+    assert packed['bytes'] < packed['source_bytes'] * 0.6      # float32 -> int16
+    pack = StemPack.from_file(packed['path'])
+    assert pack.codec == 'pcm16' and pack.channels == 2 and pack.frames == len(samples)
+    assert len(pack.index['chunks']) == 4
+    decoded = pack.read()
+    assert decoded.shape == samples.shape
+    assert np.abs(decoded - samples).max() < 1e-3
+    shutil.rmtree(directory)
+
+def test_window_reads_fetch_only_their_chunks():
+    directory = tempfile.mkdtemp(prefix='stem_pack_test_')
+    wav_path, samples = make_stem(directory)
+    path = os.path.join(directory, 'vocals.pcm16.kstp')
+    write_pack(open_wav(wav_path), path, 'pcm16')
+    pack = StemPack.from_file(path)
+    header_bytes = pack.bytes_fetched
+    window = pack.read(12.5, 18.0)
+    assert window.shape == (int(5.5 * SAMPLE_RATE), 2)
+    assert np.abs(window - samples[int(12.5 * SAMPLE_RATE):int(18.0 * SAMPLE_RATE)]).max() < 1e-3
+    # One 10-second chunk of int16 stereo, not the whole file
+    assert pack.bytes_fetched - header_bytes == 10 * SAMPLE_RATE * 2 * 2
+    assert pack.read(40, 50).shape == (0, 2)
+    shutil.rmtree(directory)
+
+def test_rejects_other_files():
+    directory = tempfile.mkdtemp(prefix='stem_pack_test_')
+    wav_path, _ = make_stem(directory, seconds=1)
+    try:
+        StemPack.from_file(wav_path)
+        assert False, 'a WAV is not a pack'
+    except StemPackError:
+        pass
+    try:
+        write_pack(open_wav(wav_path), os.path.join(directory, 'x.kstp'), 'mp3')
+        assert False, 'unknown codec'
+    except StemPackError:
+        pass
+    shutil.rmtree(directory)
+
+def test_short_chunks_are_padded():
+    payload = np.zeros((10, 2), dtype='<i2').tobytes()
+    assert decode_chunk(payload, 'pcm16', 12, 2, SAMPLE_RATE).shape == (12, 2)
+
+if __name__ == "__main__":
+    print("🧪 Testing stem packs...")
+    test_pcm16_round_trip()
+    test_window_reads_fetch_only_their_chunks()
+    test_rejects_other_files()
+    test_short_chunks_are_padded()
+    print("✅ Stem packs work!")
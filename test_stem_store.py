@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Offline test for memory-mapped stems
+Checks the WAV layout, zero-copy windows, block mixing and foreign WAV headers
+"""
+import os
+import wave
+import struct
+import shutil
+import tempfile
+import numpy as np
+from stem_store import (open_wav, write_wav, mix_stems, try_open, to_float,
+                        StemFormatError, HEADER_BYTES)
+
+def test_round_trip_and_windows():
+    """Written stems map back unchanged and windows are views of the mapping"""
+    directory = tempfile.mkdtemp(prefix='stem_test_')
+    samples = (np.random.rand(44100 * 3, 2).astype(np.float32) - 0.5)
+    path = write_wav(os.path.join(directory, 'vocals.wav'), samples, 44100)
+    assert os.path.getsize(path) == HEADER_BYTES + samples.nbytes
+
+    stem = open_wav(path)
+    assert (stem.sample_rate, stem.channels, stem.frames) == (44100, 2, 44100 * 3)
+    assert abs(stem.seconds - 3.0) < 1e-9
+    assert np.array_equal(stem.samples, samples)
+    window = stem.window(1.0, 2.0)
+    assert window.shape == (44100, 2) and np.shares_memory(window, stem.samples)
+    assert sum(len(block) for _, block in stem.blocks(block_seconds=0.7)) == stem.frames
+
+    # 16-bit PCM output is a WAV the standard library can read
+    pcm_path = write_wav(os.path.join(directory, 'pcm.wav'), samples, 44100, dtype=np.int16)
+    with wave.open(pcm_path) as w:
+        assert (w.getnchannels(), w.getsampwidth(), w.getframerate(), w.getnframes()) == (2, 2, 44100, 44100 * 3)
+    assert np.allclose(to_float(open_wav(pcm_path).samples), samples, atol=1 / 32768 + 1e-6)
+    shutil.rmtree(directory)
+
+def test_mix_matches_formula():
+    """Block mixing pads the shorter stem and applies the gains"""
+    directory = tempfile.mkdtemp(prefix='stem_test_')
+    vocals = np.full((30000, 2), 0.2, dtype=np.float32)
+    accompaniment = np.full((25000, 2), 0.4, dtype=np.float32)
+    v = open_wav(write_wav(os.path.join(directory, 'v.wav'), vocals, 8000))
+    a = open_wav(write_wav(os.path.join(directory, 'a.wav'), accompaniment, 8000))
+
+    out = open_wav(mix_stems(v, a, 0.25, os.path.join(directory, 'mix.wav'), vocal_gain=0.5,
+                             accompaniment_gain=0.5, dtype=np.float32))
+    assert out.frames == 30000
+    assert np.allclose(out.samples[:25000], 0.4 * 0.5 + 0.2 * 0.25 * 0.5)
+    assert np.allclose(out.samples[25000:], 0.2 * 0.25 * 0.5)
+    shutil.rmtree(directory)
+
+def test_foreign_headers():
+    """WAVs with extra chunks map; compressed or 24-bit ones are refused"""
+    directory = tempfile.mkdtemp(prefix='stem_test_')
+    data = (np.arange(200, dtype=np.int16) - 100).reshape(100, 2)
+    body = (b'WAVE' + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 2, 16000, 64000, 4, 16) +
+            b'LIST' + struct.pack('<I', 5) + b'INFOx\0' +
+            b'data' + struct.pack('<I', 0xFFFFFFFF) + data.tobytes())
+    path = os.path.join(directory, 'ffmpeg.wav')
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', len(body)) + body)
+    stem = open_wav(path)
+    assert stem.sample_rate == 16000 and np.array_equal(stem.samples, data)
+
+    bad = os.path.join(directory, 'bad.wav')
+    with open(bad, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', 36) + b'WAVE' + b'fmt ' +
+                struct.pack('<IHHIIHH', 16, 1, 2, 16000, 96000, 6, 24) + b'data' + struct.pack('<I', 0))
+    try:
+        open_wav(bad)
+        assert False, 'expected StemFormatError'
+    except StemFormatError:
+        pass
+    assert try_open(bad) is None and try_open(os.path.join(directory, 'missing.wav')) is None
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    print("🧪 Testing stem store...")
+    test_round_trip_and_windows()
+    test_mix_matches_formula()
+    test_foreign_headers()
+    print("✅ Stem store works!")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Offline test for timed lyric files and the pipeline's client output mode
+"""
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+import karaoke_stages as stages
+from karaoke_pipeline import make_config, run_karaoke
+from timed_lyrics import write_timed_lyrics, timed_lines, to_lrc, format_lrc_time, format_vtt_time
+from caption_ingest import load_captions
+from lyrics_alignment import lyric_lines
+from stem_pack import StemPack
+from stem_store import write_wav
+from word_timing import Word, Transcript
+from test_lyrics_alignment import synth_vocals, LYRICS, SAMPLE_RATE
+
+TRANSCRIPT = Transcript([Word(' Hello', 1.0, 1.4), Word('<darling>', 1.5, 2.0), Word('stay', 5.0, 5.3),
+                         Word('with', 5.3, 5.5), Word('me', 5.5, 6.2)])
+
+def test_formats():
+    assert format_lrc_time(61.237) == '01:01.24' and format_lrc_time(59.999) == '01:00.00'
+    assert format_vtt_time(3661.5) == '01:01:01.500'
+    lines = timed_lines(TRANSCRIPT)
+    assert [line['text'] for line in lines] == ['Hello <darling>', 'stay with me']     # 3s line span
+    assert to_lrc(lines).splitlines()[1] == '[00:05.00]<00:05.00>stay <00:05.30>with <00:05.50>me <00:06.20>'
+
+def test_files_round_trip():
+    directory = tempfile.mkdtemp(prefix='timed_lyrics_test_')
+    paths = write_timed_lyrics(TRANSCRIPT.to_dict(), directory, 'song', title='Song')
+    assert sorted(paths) == ['json', 'lrc', 'vtt']
+    with open(paths['json'], encoding='utf-8') as f:
+        data = json.load(f)
+    assert data['title'] == 'Song' and data['lines'][1]['words'][2] == {'word': 'me', 'start': 5.5, 'end': 6.2}
+    # The WebVTT file reads back as a word-timed track
+    track = load_captions(paths['vtt'])
+    assert track.word_timed
+    assert [(w.word, w.start) for w in track.transcript.words] == [(w.word.strip(), w.start) for w in TRANSCRIPT.words]
+    assert write_timed_lyrics(Transcript([]), directory) == {}
+    shutil.rmtree(directory)
+
+def test_client_output_skips_mix_and_render():
+    directory = tempfile.mkdtemp(prefix='timed_lyrics_test_')
+    video = os.path.join(directory, 'song.mp4')
+    open(video, 'wb').close()
+    samples, _ = synth_vocals(lyric_lines(LYRICS))
+
+    def pan_separation(ffmpeg, video_path, work_dir, start=None, duration=None):
+        return (write_wav(os.path.join(work_dir, 'vocals.wav'), samples, SAMPLE_RATE),
+                write_wav(os.path.join(work_dir, 'accompaniment.wav'), samples, SAMPLE_RATE))
+
+    commands = []
+
+    def run_subprocess(cmd):
+        # Stands in for ffmpeg's FLAC encoder
+        commands.append(cmd)
+        shutil.copyfile(cmd[2], cmd[-1])
+        return subprocess.CompletedProcess(cmd, 0, '', '')
+
+    original, stages.pan_separation = stages.pan_separation, pan_separation
+    original_run, stages.run_subprocess = stages.run_subprocess, run_subprocess
+    try:
+        config = make_config(name='song', separation='pan', output='client', stem_codec='pcm16', normalize=False,
+                             lyrics=LYRICS, output_dir=directory, vocal_levels=[0.0, 0.25])
+        job = run_karaoke(config, video_path=video)
+    finally:
+        stages.pan_separation = original
+        stages.run_subprocess = original_run
+    assert job['error'] is None and job['videos'] == []
+    ran = {record['stage'] for record in job['result'].records}
+    assert not any(stage.startswith(('mix_', 'render_', 'subtitle')) for stage in ran)
+    client = job['client']
+    assert sorted(client['stems']) == ['accompaniment', 'vocals']
+    vocals = client['stems']['vocals']
+    assert vocals['codec'] == 'flac' and vocals['path'].endswith('song_vocals.flac')
+    assert sorted(cmd[-1] for cmd in commands) == [os.path.join(directory, f"song_{stem}.flac")
+                                                   for stem in ('accompaniment', 'vocals')]
+    assert all(cmd[cmd.index('-c:a') + 1] == 'flac' for cmd in commands)
+    pack = StemPack.from_file(vocals['pack']['path'])          # the optional stem pack
+    assert pack.sample_rate == SAMPLE_RATE and abs(pack.seconds - len(samples) / SAMPLE_RATE) < 1e-6
+    with open(client['lyrics']['json'], encoding='utf-8') as f:
+        assert json.load(f)['lines'][0]['words'][0]['word'] == 'Hello'
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    print("🧪 Testing timed lyrics...")
+    test_formats()
+    test_files_round_trip()
+    test_client_output_skips_mix_and_render()
+    print("✅ Timed lyrics work!")
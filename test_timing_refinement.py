@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Offline test for word timing refinement
+Drifted word times on synthetic vocals (see test_lyrics_alignment) are snapped back
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+from stem_store import write_wav
+from lyrics_alignment import HOP_SECONDS
+from timing_refinement import refine_times, MIN_WORD_SECONDS
+from karaoke_stages import refine_word_timing
+from word_timing import Word, Transcript
+from test_lyrics_alignment import synth_vocals, SAMPLE_RATE
+
+WORDS = "love night baby dancing forever heart together tonight fire oh".split()
+
+def song():
+    rng = np.random.default_rng(5)
+    lines = [[WORDS[i] for i in rng.integers(0, len(WORDS), 4)] for _ in range(20)]
+    samples, truth = synth_vocals(lines, seed=5)
+    return samples, np.array(truth)
+
+def test_drifted_words_snap_back():
+    directory = tempfile.mkdtemp(prefix='timing_refinement_test_')
+    samples, truth = song()
+    vocals = write_wav(os.path.join(directory, 'vocals.wav'), samples, SAMPLE_RATE)
+    drift = np.random.default_rng(6).uniform(-0.12, 0.12, truth.shape)
+    drifted = Transcript([Word(f"w{i}", start, end) for i, (start, end) in enumerate(truth + drift)])
+    refined = refine_word_timing(drifted, vocals)
+    starts = np.array([w.start for w in refined.words])
+    ends = np.array([w.end for w in refined.words])
+    # Most boundaries land on the sung one; a few take a neighbouring onset
+    assert np.median(np.abs(starts - truth[:, 0])) < HOP_SECONDS
+    assert np.abs(starts - truth[:, 0]).mean() < 0.6 * np.abs(drift[:, 0]).mean()
+    assert np.abs(ends - truth[:, 1]).mean() < 0.6 * np.abs(drift[:, 1]).mean()
+    assert refined.text == drifted.text
+    shutil.rmtree(directory)
+
+def test_overlaps_and_gaps_are_fixed():
+    hops = 200
+    activity, onset = np.ones(hops), np.zeros(hops)
+    # Out of order, overlapping, a 50ms gap and a zero-length word
+    starts = np.array([1.0, 0.95, 1.5, 2.0, 2.0])
+    ends = np.array([1.4, 1.45, 1.95, 2.0, 2.6])
+    new_starts, new_ends = refine_times(starts, ends, activity, onset)
+    assert (np.diff(new_starts) >= MIN_WORD_SECONDS - 1e-9).all()
+    assert (new_ends[:-1] <= new_starts[1:] + 1e-9).all()
+    assert (new_ends - new_starts >= MIN_WORD_SECONDS - 1e-9).all()
+    assert abs(new_ends[2] - new_starts[3]) < 1e-9     # the small gap is closed
+
+def test_silence_trims_word_ends():
+    activity = np.zeros(200)
+    activity[50:80] = 1.0                               # sung from 1.0s to 1.6s
+    new_starts, new_ends = refine_times([0.9], [1.7], activity, np.zeros(200))
+    assert abs(new_starts[0] - 50 * HOP_SECONDS) < 1e-9
+    assert abs(new_ends[0] - 80 * HOP_SECONDS) < 1e-9
+
+def test_unreadable_stem_keeps_times():
+    transcript = Transcript([Word('la', 1.0, 1.2)])
+    assert refine_word_timing(transcript, '/nonexistent/vocals.wav') is transcript
+
+if __name__ == "__main__":
+    print("🧪 Testing word timing refinement...")
+    test_drifted_words_snap_back()
+    test_overlaps_and_gaps_are_fixed()
+    test_silence_trims_word_ends()
+    test_unreadable_stem_keeps_times()
+    print("✅ Word timing refinement works!")
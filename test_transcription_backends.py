@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Offline test for transcription backends
+A stand-in faster_whisper module exercises the local backend; the comparison
+harness is checked on hand-made transcripts
+"""
+import os
+import sys
+import types
+import shutil
+import tempfile
+import transcription_backends
+from transcription_backends import get_backend, LocalWhisperBackend, WhisperApiBackend, TranscriptionBackend
+from compare_transcription import compare_transcripts, load_reference, find_pairs
+from karaoke_stages import transcribe_vocals
+from word_timing import Word, Transcript
+
+def fake_faster_whisper(calls):
+    def segment(text, words):
+        return types.SimpleNamespace(text=text, words=[types.SimpleNamespace(word=w, start=s, end=s + 0.3)
+                                                       for w, s in words])
+
+    class WhisperModel:
+        def __init__(self, name, device, compute_type, cpu_threads, num_workers):
+            calls.append(('load', name, compute_type, cpu_threads))
+
+        def transcribe(self, path, **kwargs):
+            calls.append(('transcribe', os.path.basename(path), kwargs.get('word_timestamps')))
+            return iter([segment(" Hello there", [(" Hello", 0.5), (" there", 0.9)])]), None
+
+    return types.SimpleNamespace(WhisperModel=WhisperModel)
+
+def test_registry():
+    assert isinstance(get_backend('openai', api_key='k'), WhisperApiBackend)
+    assert isinstance(get_backend('local', threads=2), LocalWhisperBackend)
+    try:
+        get_backend('nope')
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+def test_local_backend_words():
+    calls = []
+    sys.modules['faster_whisper'] = fake_faster_whisper(calls)
+    transcription_backends._models.clear()
+    try:
+        backend = LocalWhisperBackend(model='tiny', threads=2, workers=2)
+        transcripts = backend.transcribe_many(['a.wav', 'b.wav', 'c.wav'])
+    finally:
+        del sys.modules['faster_whisper']
+        transcription_backends._models.clear()
+    assert [c[0] for c in calls].count('load') == 1
+    assert sorted(c[1] for c in calls if c[0] == 'transcribe') == ['a.wav', 'b.wav', 'c.wav']
+    assert all(c[2] for c in calls if c[0] == 'transcribe')
+    assert transcripts[0].text == "Hello there"
+    assert [(w.word, w.start) for w in transcripts[0].words] == [(" Hello", 0.5), (" there", 0.9)]
+
+def test_missing_engine_fails_loudly():
+    transcription_backends._models.clear()
+    sys.modules['faster_whisper'] = None        # import raises ImportError
+    try:
+        LocalWhisperBackend().transcribe_many(['a.wav'])
+        assert False, "expected ImportError"
+    except ImportError:
+        pass
+    finally:
+        del sys.modules['faster_whisper']
+
+def test_transcribe_vocals_uses_backend():
+    class Fixed(TranscriptionBackend):
+        name = 'fixed'
+
+        def transcribe(self, audio_path):
+            return Transcript([Word('la', 1.0, 1.2)])
+
+    transcript = transcribe_vocals('/nonexistent/ffmpeg', os.path.abspath('test_30sec_audio.wav'), None,
+                                   backend=Fixed())
+    assert [w.word for w in transcript.words] == ['la']
+    assert os.path.exists('test_30sec_audio.wav')
+
+def test_comparison():
+    reference = Transcript([Word('Hello,', 0.5, 0.8), Word('dear', 0.9, 1.1), Word('world', 1.2, 1.5)])
+    hypothesis = Transcript([Word(' hello', 0.6, 0.8), Word(' world', 1.1, 1.5), Word(' again', 1.6, 1.9)])
+    result = compare_transcripts(reference, hypothesis)
+    assert (result['substitutions'], result['deletions'], result['insertions']) == (0, 1, 1)
+    assert abs(result['wer'] - 2 / 3) < 1e-3
+    assert abs(result['timing_mae'] - 0.1) < 1e-6
+
+def test_reference_files():
+    directory = tempfile.mkdtemp(prefix='compare_test_')
+    with open(os.path.join(directory, 'song.json'), 'w') as f:
+        f.write('{"transcript": {"text": "hi", "words": [{"word": "hi", "start": 1, "end": 2}]}}')
+    open(os.path.join(directory, 'song.ogg'), 'wb').close()
+    open(os.path.join(directory, 'orphan.json'), 'w').close()
+    pairs = find_pairs(directory)
+    assert [(name, os.path.basename(audio)) for name, audio, _ in pairs] == [('song', 'song.ogg')]
+    assert load_reference(pairs[0][2]).words[0].start == 1.0
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    print("🧪 Testing transcription backends...")
+    test_registry()
+    test_local_backend_words()
+    test_missing_engine_fails_loudly()
+    test_transcribe_vocals_uses_backend()
+    test_comparison()
+    test_reference_files()
+    print("✅ Transcription backends work!")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Offline test for the translation memo
+Uses the stub translator and an in-memory bucket for the shared snapshot
+"""
+import os
+import shutil
+import tempfile
+import translation_memo
+from translation_memo import TranslationMemo, StubBackend, TranslationBackend, get_translator, MAX_BATCH
+from karaoke_stages import write_subtitles, subtitle_translator
+from word_timing import Word, Transcript
+
+class PreconditionFailed(Exception):
+    code = 412
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def generation(self):
+        return self.bucket.generations.get(self.name, 0)
+
+    def download_to_filename(self, path, if_generation_match=None):
+        with open(path, 'wb') as f:
+            f.write(self.bucket.objects[self.name])
+
+    def upload_from_filename(self, path, if_generation_match=None):
+        if self.bucket.before_upload:
+            self.bucket.before_upload.pop()()
+        if if_generation_match is not None and if_generation_match != self.generation:
+            raise PreconditionFailed(self.name)
+        with open(path, 'rb') as f:
+            self.bucket.objects[self.name] = f.read()
+        self.bucket.generations[self.name] = self.generation + 1
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.generations = {}
+        self.before_upload = []         # callbacks run (once each) just before an upload lands
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return FakeBlob(self, name) if name in self.objects else None
+
+class FakeClient:
+    def __init__(self):
+        self._bucket = FakeBucket()
+
+    def bucket(self, name):
+        return self._bucket
+
+def test_only_new_texts_reach_the_backend():
+    directory = tempfile.mkdtemp(prefix='translation_memo_test_')
+    path = os.path.join(directory, 'memo.sqlite')
+    memo, stub = TranslationMemo(path), StubBackend()
+    assert memo.translate("ਜੀ ਆ ਜੀ ਨਾ ਜੀ".split(), stub, 'en') == ['en:ਜੀ', 'en:ਆ', 'en:ਜੀ', 'en:ਨਾ', 'en:ਜੀ']
+    assert stub.requests == [['ਜੀ', 'ਆ', 'ਨਾ']]                 # deduplicated, one bulk request
+    memo.translate("ਨਾ ਦੇ ਜੀ".split(), stub, 'en')
+    assert stub.requests[1:] == [['ਦੇ']]
+    memo.translate(["ਜੀ ਆ"], stub, 'en', kind='line')             # lines are memoized apart from words
+    memo.translate(["ਜੀ"], stub, 'fr')                              # and per target language
+    assert stub.requests[2:] == [['ਜੀ ਆ'], ['ਜੀ']]
+    memo.close()
+
+    # Another job (a new process) starts from the stored memo
+    again, fresh = TranslationMemo(path), StubBackend()
+    assert again.translate("ਜੀ ਦੇ ਨਾ".split(), fresh, 'en') == ['en:ਜੀ', 'en:ਦੇ', 'en:ਨਾ']
+    assert fresh.requests == [] and again.hits == 3
+    many = [f"w{i}" for i in range(MAX_BATCH * 2 + 5)]
+    again.translate(many, fresh, 'en')
+    assert [len(batch) for batch in fresh.requests] == [MAX_BATCH, MAX_BATCH, 5]
+    again.close()
+    shutil.rmtree(directory)
+
+def test_snapshot_is_shared_through_gcs():
+    directory = tempfile.mkdtemp(prefix='translation_memo_test_')
+    client = FakeClient()
+    first = TranslationMemo(os.path.join(directory, 'a.sqlite'), 'bucket', 'memo.sqlite', client=client)
+    first.translate(['ਜੀ', 'ਆ'], StubBackend(), 'en')
+    assert 'memo.sqlite' in client._bucket.objects                 # pushed after new entries
+    second = TranslationMemo(os.path.join(directory, 'b.sqlite'), 'bucket', 'memo.sqlite', client=client)
+    second.translate(['ਨਾ'], StubBackend(), 'en')                  # merges the snapshot before pushing
+    third = TranslationMemo(os.path.join(directory, 'c.sqlite'), 'bucket', 'memo.sqlite', client=client)
+    stub = StubBackend()
+    assert third.translate(['ਜੀ', 'ਆ', 'ਨਾ'], stub, 'en') == ['en:ਜੀ', 'en:ਆ', 'en:ਨਾ']
+    assert stub.requests == []
+    for memo in (first, second, third):
+        memo.close()
+    shutil.rmtree(directory)
+
+def test_concurrent_pushes_keep_both_entries():
+    """A push that loses the race to another instance merges again instead of overwriting"""
+    directory = tempfile.mkdtemp(prefix='translation_memo_test_')
+    client = FakeClient()
+    first = TranslationMemo(os.path.join(directory, 'a.sqlite'), 'bucket', 'memo.sqlite', client=client)
+    second = TranslationMemo(os.path.join(directory, 'b.sqlite'), 'bucket', 'memo.sqlite', client=client)
+    # second pushes between first's pull and first's upload
+    client._bucket.before_upload.append(lambda: second.translate(['ਆ'], StubBackend(), 'en'))
+    first.translate(['ਜੀ'], StubBackend(), 'en')
+    assert client._bucket.generations['memo.sqlite'] == 2
+    third = TranslationMemo(os.path.join(directory, 'c.sqlite'), 'bucket', 'memo.sqlite', client=client)
+    stub = StubBackend()
+    third.translate(['ਜੀ', 'ਆ'], stub, 'en')
+    assert stub.requests == []
+    for memo in (first, second, third):
+        memo.close()
+    shutil.rmtree(directory)
+
+def test_bilingual_subtitles():
+    directory = tempfile.mkdtemp(prefix='translation_memo_test_')
+    memo_path, translation_memo.MEMO_PATH = translation_memo.MEMO_PATH, os.path.join(directory, 'memo.sqlite')
+    transcript = Transcript([Word('ਜੀ', 0.0, 0.4), Word('ਆ', 0.5, 0.9)])
+    path = os.path.join(directory, 'subtitles.ass')
+    try:
+        write_subtitles(transcript, path, 'translation', translate=subtitle_translator('stub', 'en'))
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+        assert 'Translation,,0,0,0,,{\\c&Hdddddd&}en:ਜੀ ਆ\\N' in content
+        assert 'Original,,0,0,0,,{\\c&H0088ff&}ਜੀ{\\c&Hffffff&} ਆ\\N' in content
+
+        # Without a translator the second line is the transliteration
+        write_subtitles(transcript, path, 'translation')
+        with open(path, encoding='utf-8') as f:
+            assert '{\\c&Hdddddd&}ji aa\\N' in f.read()
+
+        class Broken(TranslationBackend):
+            name = 'broken'
+
+            def translate(self, texts, target):
+                raise RuntimeError('quota exceeded')
+
+        translation_memo.BACKENDS['broken'] = Broken
+        write_subtitles(transcript, path, 'bilingual', translate=subtitle_translator('broken'))
+        with open(path, encoding='utf-8') as f:
+            assert 'English,,0,0,0,,{\\c&Hff6600&}ji{\\c&Hffffff&} aa\\N' in f.read()
+    finally:
+        translation_memo.get_memo().close()
+        translation_memo._memos.clear()
+        translation_memo.MEMO_PATH = memo_path
+        translation_memo.BACKENDS.pop('broken', None)
+        shutil.rmtree(directory)
+
+def test_unknown_backend():
+    try:
+        get_translator('babelfish')
+    except ValueError as e:
+        assert 'babelfish' in str(e)
+    else:
+        raise AssertionError('expected ValueError')
+
+if __name__ == "__main__":
+    print("🧪 Testing translation memo...")
+    test_only_new_texts_reach_the_backend()
+    test_snapshot_is_shared_through_gcs()
+    test_concurrent_pushes_keep_both_entries()
+    test_bilingual_subtitles()
+    test_unknown_backend()
+    print("✅ Translation memo works!")
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Offline test for Gurmukhi transliteration
+"""
+from transliteration import transliterate, transliterate_words
+
+def test_letters_and_signs():
+    cases = {
+        'ਜੀ': 'ji', 'ਆ': 'aa', 'ਚੁਨੀ': 'chuni', 'ਸੋਨੇ': 'sone', 'ਕਿਸੇ': 'kise',
+        'ਸਲਾਈ': 'salaai', 'ਕੁਈ': 'kui', 'ਸਾਨੁ': 'saanu',
+        'ਪ੍ਰੀਤ': 'prit',                    # virama joins a conjunct
+        'ਪੱਕਾ': 'pakka',                    # addak doubles, final 'aa' is written 'a'
+        'ਰੰਗੇ': 'range', 'ਆੰਨੇ': 'aane',     # tippi is 'n', silent before n/m
+        'ਲਗਾਏ': 'lagaaye',                  # glide into an independent vowel
+        'ਖ਼ੁਸ਼ੀ': 'khushi', 'ਜ਼ਿੰਦਗੀ': 'zindgi',
+        '\u0a36ਾਮ': 'shaam',                # precomposed nukta letter
+        '੧੯੮੪': '1984', 'Hello': 'hello',
+    }
+    for word, latin in cases.items():
+        assert transliterate(word) == latin, (word, transliterate(word), latin)
+
+def test_inherent_vowel():
+    assert transliterate('ਹਦ') == 'had'              # silent at the end of a word
+    assert transliterate('ਕਮਲ') == 'kamal'
+    assert transliterate('ਲਗਦੀ') == 'lagdi'          # silent between voiced syllables
+    assert transliterate('ਸਮਝਦਾ') == 'samajhda'
+    assert transliterate('ਨਾਗਿਨ') == 'naagin'
+
+def test_transcript_pass():
+    words = ('ਸੋਨੇ ਰੰਗੇ ਗੋਟੇ ਲਗਦੀ ' * 5000).split()
+    transliterate.cache_clear()
+    spelled = transliterate_words(words)
+    assert spelled[:4] == ['sone', 'range', 'gote', 'lagdi'] and len(spelled) == len(words)
+    info = transliterate.cache_info()
+    assert (info.hits, info.misses) == (0, 4)             # each distinct word converted once
+    transliterate_words(words)                            # the next song reuses the memo
+    info = transliterate.cache_info()
+    assert (info.hits, info.misses) == (4, 4)
+
+if __name__ == "__main__":
+    print("🧪 Testing transliteration...")
+    test_letters_and_signs()
+    test_inherent_vowel()
+    test_transcript_pass()
+    print("✅ Transliteration works!")
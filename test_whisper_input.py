@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Offline test for Whisper input encoding
+Uses a stand-in ffmpeg that writes files of the size the requested codec/bitrate would produce
+"""
+import os
+import sys
+import shutil
+import stat
+import tempfile
+import numpy as np
+from stem_store import write_wav
+from karaoke_stages import whisper_inputs, whisper_bitrate, whisper_args, WHISPER_MAX_BYTES, WHISPER_KBPS
+
+SAMPLE_RATE = 8000
+
+FAKE_FFMPEG = '''#!{python}
+import sys
+args = sys.argv[1:]
+fmt, rate, channels = args[args.index('-f') + 1], int(args[args.index('-ar') + 1]), int(args[args.index('-ac') + 1])
+seconds = len(sys.stdin.buffer.read()) / (rate * channels * (2 if fmt == 's16le' else 4))
+output = args[-2]
+if '-b:a' in args:
+    size = int(seconds * int(args[args.index('-b:a') + 1].rstrip('k')) * 125) + 200
+else:
+    size = int(seconds * 32000) + 44
+if 'libopus' in args and '{fail_opus}' == 'yes':
+    sys.exit(1)
+with open(output, 'wb') as f:
+    f.write(b'\\0' * size)
+'''
+
+def make_tools(directory, fail_opus=False):
+    ffmpeg = os.path.join(directory, 'ffmpeg')
+    with open(ffmpeg, 'w') as f:
+        f.write(FAKE_FFMPEG.format(python=sys.executable, fail_opus='yes' if fail_opus else 'no'))
+    os.chmod(ffmpeg, os.stat(ffmpeg).st_mode | stat.S_IEXEC)
+    return ffmpeg
+
+def make_stem(directory, seconds):
+    samples = np.zeros((int(seconds * SAMPLE_RATE), 2), dtype=np.float32)
+    return write_wav(os.path.join(directory, 'vocals.wav'), samples, SAMPLE_RATE)
+
+def test_bitrate_choice():
+    assert whisper_bitrate(180) == WHISPER_KBPS[1]
+    assert WHISPER_KBPS[0] <= whisper_bitrate(3600) < WHISPER_KBPS[1]
+    assert whisper_bitrate(6 * 3600) is None
+    assert '-b:a' in whisper_args('opus', 32) and '-b:a' not in whisper_args('flac', 32)
+
+def test_song_fits_one_request():
+    directory = tempfile.mkdtemp(prefix='whisper_input_test_')
+    ffmpeg = make_tools(directory)
+    vocals = make_stem(directory, 240)
+    chunk_dir = os.path.join(directory, 'chunks')
+    os.makedirs(chunk_dir)
+    chunks = whisper_inputs(ffmpeg, vocals, chunk_dir, codec='opus')
+    assert len(chunks) == 1 and chunks[0][1].endswith('.ogg')
+    # 4 minutes of 44.1kHz stereo PCM would be ~42MB; the encoding is >10x smaller
+    assert os.path.getsize(chunks[0][1]) * 10 < 240 * 44100 * 4
+    shutil.rmtree(directory)
+
+def test_long_track_is_chunked():
+    directory = tempfile.mkdtemp(prefix='whisper_input_test_')
+    ffmpeg = make_tools(directory)
+    vocals = make_stem(directory, 1000)
+    chunk_dir = os.path.join(directory, 'chunks')
+    os.makedirs(chunk_dir)
+    chunks = whisper_inputs(ffmpeg, vocals, chunk_dir, codec='opus', max_bytes=2 * 1024 * 1024)
+    assert [offset for offset, _ in chunks] == [0, 300, 600, 900]
+    assert all(os.path.getsize(path) <= 2 * 1024 * 1024 for _, path in chunks)
+    assert whisper_inputs(ffmpeg, vocals, chunk_dir, max_seconds=60, codec='opus')[0][0] == 0
+    shutil.rmtree(directory)
+
+def test_falls_back_to_pcm():
+    directory = tempfile.mkdtemp(prefix='whisper_input_test_')
+    ffmpeg = make_tools(directory, fail_opus=True)
+    vocals = make_stem(directory, 30)
+    chunk_dir = os.path.join(directory, 'chunks')
+    os.makedirs(chunk_dir)
+    chunks = whisper_inputs(ffmpeg, vocals, chunk_dir, codec='opus')
+    assert len(chunks) == 1 and chunks[0][1].endswith('.wav')
+    assert os.path.getsize(chunks[0][1]) < WHISPER_MAX_BYTES
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    print("🧪 Testing Whisper input encoding...")
+    test_bitrate_choice()
+    test_song_fits_one_request()
+    test_long_track_is_chunked()
+    test_falls_back_to_pcm()
+    print("✅ Whisper input encoding works!")
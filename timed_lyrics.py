@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Timed Lyrics
+Word-timed lyric files for players that mix the stems and draw the highlighting
+themselves (client-side karaoke), instead of a rendered video per vocal level:
+
+- JSON: {'version', 'title', 'lines': [{'start', 'end', 'text', 'words': [{'word', 'start', 'end'}]}]}
+- LRC: enhanced LRC, a [mm:ss.xx] stamp per line and a <mm:ss.xx> stamp per word
+- WebVTT: a cue per line with a <hh:mm:ss.mmm> timestamp before every word, which
+  players render as karaoke-style cue progress
+
+Lines are grouped as in the highlight subtitle presets (word_timing.group_lines_by_span),
+so a client shows the same lines as a rendered video.
+"""
+import os
+import json
+from word_timing import to_transcript, group_lines_by_span
+
+LINE_SPAN = 3.0                     # the 'cloud' subtitle preset's line_span
+FORMATS = ('json', 'lrc', 'vtt')
+CONTENT_TYPES = {'json': 'application/json', 'lrc': 'text/plain; charset=utf-8', 'vtt': 'text/vtt'}
+
+def _centiseconds(seconds):
+    return int(round(max(0.0, seconds) * 100))
+
+def format_lrc_time(seconds):
+    """LRC timestamp mm:ss.xx (minutes may pass 99)"""
+    cs = _centiseconds(seconds)
+    return f"{cs // 6000:02d}:{cs // 100 % 60:02d}.{cs % 100:02d}"
+
+def format_vtt_time(seconds):
+    """WebVTT timestamp hh:mm:ss.mmm"""
+    ms = int(round(max(0.0, seconds) * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def timed_lines(transcript, line_span=LINE_SPAN):
+    """Lines of (stripped) words as JSON-ready dicts"""
+    lines = []
+    for line_words in group_lines_by_span(to_transcript(transcript).words, line_span):
+        words = [{'word': w.word.strip(), 'start': round(w.start, 3), 'end': round(w.end, 3)}
+                 for w in line_words if w.word.strip()]
+        if words:
+            lines.append({'start': words[0]['start'], 'end': words[-1]['end'],
+                          'text': " ".join(w['word'] for w in words), 'words': words})
+    return lines
+
+def to_json(lines, title=None):
+    return json.dumps({'version': 1, 'title': title, 'lines': lines}, ensure_ascii=False, indent=1)
+
+def to_lrc(lines, title=None):
+    rows = [f"[ti:{title}]"] if title else []
+    for line in lines:
+        words = " ".join(f"<{format_lrc_time(w['start'])}>{w['word']}" for w in line['words'])
+        rows.append(f"[{format_lrc_time(line['start'])}]{words} <{format_lrc_time(line['end'])}>")
+    return "\n".join(rows) + "\n"
+
+def to_webvtt(lines, title=None):
+    rows = ["WEBVTT" + (f" - {title}" if title else ""), ""]
+    for line in lines:
+        first, *rest = line['words']
+        text = _escape(first['word']) + "".join(f" <{format_vtt_time(w['start'])}>{_escape(w['word'])}" for w in rest)
+        rows += [f"{format_vtt_time(line['start'])} --> {format_vtt_time(line['end'])}", text, ""]
+    return "\n".join(rows)
+
+WRITERS = {'json': to_json, 'lrc': to_lrc, 'vtt': to_webvtt}
+
+def write_timed_lyrics(transcript, directory, name='lyrics', title=None, formats=FORMATS, line_span=LINE_SPAN):
+    """Write <name>.json/.lrc/.vtt for a Transcript (or its to_dict()); returns {format: path}, {} without words"""
+    lines = timed_lines(transcript, line_span) if transcript else []
+    if not lines:
+        return {}
+    paths = {}
+    for fmt in formats:
+        paths[fmt] = os.path.join(directory, f"{name}.{fmt}")
+        with open(paths[fmt], 'w', encoding='utf-8') as f:
+            f.write(WRITERS[fmt](lines, title))
+    return paths
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Word Timing Refinement
+Snaps transcript word boundaries to the vocal stem, for every word at once:
+
+- a start moves to the strongest onset within SNAP_SECONDS (nearer ones preferred),
+  or forward to where the voice comes in when it was placed in silence
+- an end placed in silence moves back to where the voice stopped, and one placed
+  mid-note extends to where it stops (within SNAP_SECONDS)
+- then starts are made increasing (at least MIN_WORD_SECONDS apart), overlaps are cut
+  at the next word's start and gaps under CLOSE_GAP_SECONDS are closed
+
+The onset/activity envelope is the one lyrics alignment uses (lyrics_alignment.stem_features),
+computed once per stem; everything after it is a handful of array operations.
+"""
+import time
+import numpy as np
+from word_timing import Word, Transcript
+from lyrics_alignment import stem_features, HOP_SECONDS
+
+SNAP_SECONDS = 0.15
+ONSET_MIN = 0.25                    # weaker onsets (after the distance weighting) are not snapped to
+VOICED = 0.5                        # activity above which a hop counts as sung
+MIN_WORD_SECONDS = 0.08
+CLOSE_GAP_SECONDS = 0.12
+
+def _windows(centers, offsets, hops):
+    return np.clip(centers[:, None] + offsets, 0, hops - 1)
+
+def _first(mask):
+    """(index of the first True per row, whether the row has one)"""
+    return mask.argmax(axis=1), mask.any(axis=1)
+
+def refine_times(starts, ends, activity, onset, hop_seconds=HOP_SECONDS, snap_seconds=SNAP_SECONDS):
+    """Refined (starts, ends) arrays in seconds for word times `starts`/`ends`"""
+    starts, ends = np.asarray(starts, dtype=float), np.asarray(ends, dtype=float)
+    hops, count = len(activity), len(starts)
+    if count == 0 or hops == 0:
+        return starts, ends
+    rows = np.arange(count)
+    reach = max(1, int(round(snap_seconds / hop_seconds)))
+    around, ahead = np.arange(-reach, reach + 1), np.arange(reach + 1)
+    voiced = activity >= VOICED
+    start_hop = np.clip(np.round(starts / hop_seconds).astype(int), 0, hops - 1)
+    end_hop = np.clip(np.round(ends / hop_seconds).astype(int), 1, hops)     # first hop after the word
+
+    # Starts: nearest strong onset, else the first voiced hop when the start is in silence
+    window = _windows(start_hop, around, hops)
+    strength = onset[window] * (1 - 0.5 * np.abs(around) / (reach + 1))
+    best = strength.argmax(axis=1)
+    on_onset = strength[rows, best] >= ONSET_MIN
+    forward = _windows(start_hop, ahead, hops)
+    first_voiced, has_voice = _first(voiced[forward])
+    into_voice = ~on_onset & ~voiced[start_hop] & has_voice
+    new_starts = np.where(on_onset, window[rows, best] * hop_seconds,
+                          np.where(into_voice, forward[rows, first_voiced] * hop_seconds, starts))
+
+    # Ends: back to the last voiced hop when in silence, on to the first unvoiced one when mid-note
+    backward = _windows(end_hop - 1, -ahead, hops)
+    last_voiced, had_voice = _first(voiced[backward])
+    in_silence = ~voiced[end_hop - 1]
+    onward = _windows(np.minimum(end_hop, hops - 1), ahead, hops)
+    first_unvoiced, has_silence = _first(~voiced[onward])
+    new_ends = np.where(in_silence & had_voice, (backward[rows, last_voiced] + 1) * hop_seconds,
+                        np.where(~in_silence & has_silence, onward[rows, first_unvoiced] * hop_seconds, ends))
+
+    # Bulk fixes: increasing starts spaced by MIN_WORD_SECONDS, no overlaps, no slivers of gap
+    spacing = rows * MIN_WORD_SECONDS
+    new_starts = np.maximum.accumulate(new_starts - spacing) + spacing
+    new_ends = np.maximum(new_ends, new_starts + MIN_WORD_SECONDS)
+    following = new_starts[1:]
+    new_ends[:-1] = np.minimum(new_ends[:-1], following)
+    gap = following - new_ends[:-1]
+    new_ends[:-1] = np.where(gap < CLOSE_GAP_SECONDS, following, new_ends[:-1])
+    return new_starts, new_ends
+
+def refine_words(words, activity, onset, hop_seconds=HOP_SECONDS):
+    """Copies of `words` with refined times"""
+    starts, ends = refine_times([w.start for w in words], [w.end for w in words], activity, onset, hop_seconds)
+    return [Word(w.word, start, end) for w, start, end in zip(words, starts, ends)]
+
+def refine_transcript(transcript, vocals_path):
+    """Transcript with word times snapped to the vocal stem WAV"""
+    began = time.perf_counter()
+    activity, onset = stem_features(vocals_path)
+    words = refine_words(transcript.words, activity, onset)
+    shifts = np.abs([new.start - old.start for new, old in zip(words, transcript.words)])
+    moved = shifts > HOP_SECONDS / 2
+    print(f"🎯 Refined word timing: {int(moved.sum())}/{len(words)} starts moved "
+          f"(median {np.median(shifts[moved]) * 1000 if moved.any() else 0:.0f}ms) "
+          f"in {(time.perf_counter() - began) * 1000:.0f}ms")
+    return Transcript(words, transcript.text)
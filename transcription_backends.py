@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Transcription Backends
+Interchangeable speech recognizers that all return word_timing.Transcript:
+
+- 'openai': the Whisper API (network, per-minute cost, rate limits)
+- 'local': a Whisper-family model on CPU through faster-whisper (CTranslate2, int8
+  weights by default), no network once the model is downloaded
+
+transcribe_many() is how chunked callers submit work: the API backend sends the
+chunks concurrently, the local one decodes them on a fixed number of model workers
+(batching each file's segments when faster-whisper provides BatchedInferencePipeline).
+get_backend() picks one by name or from TRANSCRIPTION_BACKEND.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from word_timing import Word, Transcript
+
+TRANSCRIPTION_BACKEND = os.getenv('TRANSCRIPTION_BACKEND', 'openai')
+LOCAL_MODEL = os.getenv('LOCAL_WHISPER_MODEL', 'small')
+LOCAL_COMPUTE_TYPE = os.getenv('LOCAL_WHISPER_COMPUTE_TYPE', 'int8')
+LOCAL_THREADS = int(os.getenv('LOCAL_WHISPER_THREADS', '0'))      # 0: CTranslate2 picks
+LOCAL_WORKERS = int(os.getenv('LOCAL_WHISPER_WORKERS', '1'))      # files decoded concurrently
+LOCAL_BATCH_SIZE = int(os.getenv('LOCAL_WHISPER_BATCH_SIZE', '8'))
+
+_models = {}
+_models_lock = threading.Lock()
+
+class TranscriptionBackend:
+    """transcribe(path) -> Transcript; subclasses may override transcribe_many for batching"""
+
+    name = None
+
+    def settings(self):
+        """Hashable settings that change its transcripts (part of cache keys)"""
+        return (self.name,)
+
+    def transcribe(self, audio_path):
+        raise NotImplementedError
+
+    def transcribe_many(self, audio_paths, max_workers=4):
+        """Transcripts in input order; a chunk that fails yields None"""
+        def transcribe(path):
+            try:
+                return self.transcribe(path)
+            except Exception as e:
+                print(f"  ⚠️ {self.name} transcription of {os.path.basename(path)} failed: {e}")
+                return None
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return list(executor.map(transcribe, audio_paths))
+
+class WhisperApiBackend(TranscriptionBackend):
+    """The OpenAI Whisper API with word timestamps"""
+
+    name = 'openai'
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY', '')
+
+    def transcribe(self, audio_path):
+        from karaoke_stages import whisper_request
+        return whisper_request(audio_path, self.api_key)
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """faster-whisper on CPU; one model per (size, compute type, threads, workers) per process"""
+
+    name = 'local'
+
+    def __init__(self, model=LOCAL_MODEL, compute_type=LOCAL_COMPUTE_TYPE, threads=LOCAL_THREADS,
+                 workers=LOCAL_WORKERS, batch_size=LOCAL_BATCH_SIZE, language=None):
+        self.model_name = model
+        self.compute_type = compute_type
+        self.threads = threads
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.language = language
+
+    def settings(self):
+        return (self.name, self.model_name, self.compute_type, self.language)
+
+    def load(self):
+        """The shared WhisperModel (and its batched pipeline, when available)"""
+        key = (self.model_name, self.compute_type, self.threads, self.workers)
+        with _models_lock:
+            if key not in _models:
+                try:
+                    import faster_whisper
+                except ImportError:
+                    raise ImportError("the local transcription backend needs faster-whisper (pip install faster-whisper)")
+                print(f"🧠 Loading local Whisper model {self.model_name} ({self.compute_type}, "
+                      f"{self.threads or 'auto'} threads)...")
+                model = faster_whisper.WhisperModel(self.model_name, device='cpu', compute_type=self.compute_type,
+                                                    cpu_threads=self.threads, num_workers=self.workers)
+                batched = getattr(faster_whisper, 'BatchedInferencePipeline', None)
+                _models[key] = (model, batched(model=model) if batched else None)
+            return _models[key]
+
+    def transcribe(self, audio_path):
+        model, batched = self.load()
+        if batched is not None and self.batch_size > 1:
+            segments, _ = batched.transcribe(audio_path, batch_size=self.batch_size, word_timestamps=True,
+                                             language=self.language)
+        else:
+            segments, _ = model.transcribe(audio_path, word_timestamps=True, vad_filter=True, language=self.language)
+        words, texts = [], []
+        # Segments are a generator; decoding happens while iterating
+        for segment in segments:
+            texts.append(segment.text.strip())
+            words.extend(Word(w.word, w.start, w.end) for w in (segment.words or []))
+        return Transcript(words, " ".join(t for t in texts if t))
+
+    def transcribe_many(self, audio_paths, max_workers=None):
+        """Files share the model; at most `workers` decode at once (more would only contend for cores)"""
+        self.load()     # a missing faster-whisper fails the call instead of every chunk
+        return super().transcribe_many(audio_paths, min(max_workers or self.workers, self.workers))
+
+BACKENDS = {'openai': WhisperApiBackend, 'local': LocalWhisperBackend}
+
+def get_backend(name=None, api_key=None, **kwargs):
+    """Backend instance by name (default TRANSCRIPTION_BACKEND); api_key only goes to the API backend"""
+    name = name or TRANSCRIPTION_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend {name!r} (choose from {', '.join(BACKENDS)})")
+    if name == 'openai':
+        kwargs['api_key'] = api_key
+    return BACKENDS[name](**kwargs)
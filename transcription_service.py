@@ -4,18 +4,30 @@ Standalone Transcription Service
 Provides audio transcription functionality using OpenAI Whisper
 """
 import os
+import uuid
+import shutil
 import tempfile
 import subprocess
 import openai
 import librosa
 import soundfile as sf
+from media_probe import duration as media_duration
+from word_timing import merge_transcripts
+from transcription_backends import get_backend
 
 class TranscriptionService:
-    """Standalone transcription service using OpenAI Whisper"""
+    """Standalone transcription service using OpenAI Whisper or a local backend
+
+    Word-timed (verbose_json) transcription goes through `backend`
+    (transcription_backends; TRANSCRIPTION_BACKEND by default); the plain text
+    formats always use the Whisper API.
+    """
     
-    def __init__(self, openai_api_key=None, ffmpeg_path='/opt/homebrew/bin/ffmpeg'):
+    def __init__(self, openai_api_key=None, ffmpeg_path='/opt/homebrew/bin/ffmpeg', ffprobe_path=None, backend=None):
         self.openai_api_key = openai_api_key or os.getenv('OPENAI_API_KEY', '')
+        self.backend = backend or get_backend(api_key=self.openai_api_key)
         self.ffmpeg_path = ffmpeg_path
+        self.ffprobe_path = ffprobe_path or os.path.join(os.path.dirname(ffmpeg_path), 'ffprobe')
         self.temp_dir = tempfile.gettempdir()
         
         if self.openai_api_key:
@@ -24,7 +36,7 @@ class TranscriptionService:
     def extract_audio_from_video(self, video_path, output_path=None, duration=None):
         """Extract audio from video file"""
         if not output_path:
-            output_path = os.path.join(self.temp_dir, "extracted_audio.wav")
+            output_path = os.path.join(self.temp_dir, f"extracted_audio_{uuid.uuid4().hex[:8]}.wav")
         
         print(f"🎵 Extracting audio from {video_path}...")
         
@@ -49,32 +61,33 @@ class TranscriptionService:
         return output_path
     
     def transcribe_audio_file(self, audio_path, response_format="verbose_json"):
-        """Transcribe a single audio file using OpenAI Whisper"""
-        print(f"🎙️ Transcribing {audio_path} with OpenAI Whisper...")
+        """Transcribe a single audio file using OpenAI Whisper (or the local backend for verbose_json)"""
+        local = response_format == "verbose_json" and self.backend.name != 'openai'
+        print(f"🎙️ Transcribing {audio_path} with {'the ' + self.backend.name + ' backend' if local else 'OpenAI Whisper'}...")
         
-        if not self.openai_api_key:
+        if not local and not self.openai_api_key:
             print("❌ No OpenAI API key provided")
             return None
         
         try:
-            # Check file size and chunk if needed
+            # Check file size and chunk if needed (local backends have no upload limit)
             file_size = os.path.getsize(audio_path)
-            if file_size > 20 * 1024 * 1024:  # 20MB limit
+            if file_size > 20 * 1024 * 1024 and not local:  # 20MB limit
                 return self._transcribe_chunked(audio_path, response_format)
             
+            if response_format == "verbose_json":
+                transcript = self.backend.transcribe(audio_path)
+                print(f"✅ Transcribed: {len(transcript.words)} words")
+                return transcript
+            
             with open(audio_path, 'rb') as audio_file:
                 transcript = openai.Audio.transcribe(
                     model="whisper-1",
                     file=audio_file,
-                    response_format=response_format,
-                    timestamp_granularities=["word"] if response_format == "verbose_json" else None
+                    response_format=response_format
                 )
             
-            if response_format == "verbose_json" and hasattr(transcript, 'words'):
-                print(f"✅ Transcribed: {len(transcript.words)} words")
-            else:
-                print("✅ Transcription completed")
-            
+            print("✅ Transcription completed")
             return transcript
             
         except Exception as e:
@@ -103,8 +116,7 @@ class TranscriptionService:
         """Transcribe large audio files in chunks"""
         print("📦 Chunking large audio file...")
         
-        chunk_dir = os.path.join(self.temp_dir, "audio_chunks")
-        os.makedirs(chunk_dir, exist_ok=True)
+        chunk_dir = tempfile.mkdtemp(prefix="audio_chunks_", dir=self.temp_dir)
         
         # Split into 5-minute chunks
         chunk_duration = 300
@@ -112,22 +124,9 @@ class TranscriptionService:
         chunk_index = 0
         start_time = 0
         
-        # Get audio duration first
-        duration_cmd = [
-            self.ffmpeg_path, '-i', audio_path,
-            '-f', 'null', '-'
-        ]
-        result = subprocess.run(duration_cmd, capture_output=True, text=True)
-        
-        # Parse duration from stderr (ffmpeg outputs to stderr)
-        import re
-        duration_match = re.search(r'Duration: (\d+):(\d+):(\d+\.\d+)', result.stderr)
-        if duration_match:
-            hours, minutes, seconds = duration_match.groups()
-            total_duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
-            max_duration = min(600, total_duration)  # Process up to 10 minutes
-        else:
-            max_duration = 600
+        # Get audio duration first (container header only, no decode)
+        total_duration = media_duration(audio_path, self.ffprobe_path)
+        max_duration = min(600, total_duration) if total_duration else 600  # Process up to 10 minutes
         
         while start_time < max_duration:
             chunk_path = os.path.join(chunk_dir, f"chunk_{chunk_index:03d}.wav")
@@ -149,9 +148,15 @@ class TranscriptionService:
             else:
                 break
         
-        # Transcribe each chunk
         if response_format == "verbose_json":
-            all_words = []
+            # Chunks go to the backend together (concurrent API calls, or batched local decoding)
+            transcripts = self.backend.transcribe_many([path for _, path in chunk_files])
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+            transcript = merge_transcripts([(offset, t) for (offset, _), t in zip(chunk_files, transcripts)])
+            print(f"✅ Chunks transcribed: {len(transcript.words)} words")
+            return transcript
+        
+        # Transcribe each chunk
         all_text = []
         
         for start_offset, chunk_path in chunk_files:
@@ -160,41 +165,22 @@ class TranscriptionService:
                     transcript = openai.Audio.transcribe(
                         model="whisper-1",
                         file=audio_file,
-                        response_format=response_format,
-                        timestamp_granularities=["word"] if response_format == "verbose_json" else None
+                        response_format=response_format
                     )
                 
-                if response_format == "verbose_json" and hasattr(transcript, 'words'):
-                    # Adjust timestamps
-                    for word in transcript.words:
-                        word.start += start_offset
-                        word.end += start_offset
-                        all_words.append(word)
-                    
-                    all_text.append(transcript.text)
-                    print(f"✅ Chunk transcribed: {len(transcript.words)} words")
-                else:
-                    all_text.append(str(transcript))
-                    print("✅ Chunk transcribed")
-                    
+                all_text.append(str(transcript))
+                print("✅ Chunk transcribed")
+                
             except Exception as e:
                 print(f"❌ Chunk failed: {e}")
             
             os.remove(chunk_path)
         
         # Cleanup chunk directory
-        os.rmdir(chunk_dir)
+        shutil.rmtree(chunk_dir, ignore_errors=True)
         
         # Return combined transcript
-        if response_format == "verbose_json":
-            class CombinedTranscript:
-                def __init__(self, words, text):
-                    self.words = words
-                    self.text = text
-            
-            return CombinedTranscript(all_words, " ".join(all_text))
-        else:
-            return " ".join(all_text)
+        return " ".join(all_text)
     
     def get_transcript_text(self, transcript):
         """Extract plain text from transcript object"""
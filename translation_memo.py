@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Translation Memo
+Word- and line-level translations of lyric text, remembered across songs and jobs.
+
+Bilingual subtitles need a second-language text for every word (or line), and the same
+words come back in thousands of songs. TranslationMemo keeps every translation in a
+local SQLite file and only sends what it has never seen to the backend, deduplicated
+and batched into as few requests as the backend allows (MAX_BATCH texts each).
+
+With TRANSLATION_MEMO_BUCKET set, the SQLite file is shared through a GCS snapshot:
+it is merged into the local memo when first opened, and new entries are merged into
+the snapshot (download, merge, upload) after each batch of misses. The upload only
+replaces the generation that was merged, so concurrent pushes never drop each other's
+entries; the one that loses the race merges again.
+
+Backends (get_translator() picks one by name or from TRANSLATION_BACKEND):
+- 'transliterate': the local rule-based transliterator; free, so it bypasses the memo
+- 'google': Cloud Translation (google-cloud-translate), a bulk request per batch
+- 'stub': a deterministic local translator that records its requests, for tests
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+
+TRANSLATION_BACKEND = os.getenv('TRANSLATION_BACKEND', 'transliterate')
+TRANSLATION_TARGET = os.getenv('TRANSLATION_TARGET', 'en')
+MEMO_PATH = os.getenv('TRANSLATION_MEMO_PATH', os.path.join(tempfile.gettempdir(), 'translation_memo.sqlite'))
+MEMO_BUCKET = os.getenv('TRANSLATION_MEMO_BUCKET', '')
+MEMO_OBJECT = os.getenv('TRANSLATION_MEMO_OBJECT', 'memo/translation_memo.sqlite')
+MAX_BATCH = 128                     # texts per request (the Cloud Translation v2 limit)
+PUSH_ATTEMPTS = 5                   # merge-and-upload rounds before a push gives up to a busy snapshot
+QUERY_CHUNK = 500                   # texts per SQLite lookup (stays under the bound-parameter limit)
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS memo (
+    backend TEXT NOT NULL, target TEXT NOT NULL, kind TEXT NOT NULL, text TEXT NOT NULL, result TEXT NOT NULL,
+    PRIMARY KEY (backend, target, kind, text)
+) WITHOUT ROWID"""
+
+_memos = {}
+_memos_lock = threading.Lock()
+
+class TranslationBackend:
+    """translate(texts, target) -> translations in order, in one request"""
+
+    name = None
+    free = False                    # free backends are not memoized
+
+    def translate(self, texts, target):
+        raise NotImplementedError
+
+class TransliterationBackend(TranslationBackend):
+    """Latin spelling from transliteration.py; the target language is ignored"""
+
+    name = 'transliterate'
+    free = True
+
+    def translate(self, texts, target):
+        from transliteration import transliterate_words
+        return [" ".join(transliterate_words(text.split())) for text in texts]
+
+class GoogleTranslateBackend(TranslationBackend):
+    """Cloud Translation v2; the source language is detected"""
+
+    name = 'google'
+
+    def __init__(self, client=None):
+        self._client = client
+
+    def translate(self, texts, target):
+        if self._client is None:
+            from google.cloud import translate_v2
+            self._client = translate_v2.Client()
+        results = self._client.translate(list(texts), target_language=target, format_='text')
+        return [result['translatedText'] for result in results]
+
+class StubBackend(TranslationBackend):
+    """'<target>:<text>' for every text; `requests` lists the batches it was sent"""
+
+    name = 'stub'
+
+    def __init__(self):
+        self.requests = []
+
+    def translate(self, texts, target):
+        self.requests.append(list(texts))
+        return [f"{target}:{text}" for text in texts]
+
+BACKENDS = {'transliterate': TransliterationBackend, 'google': GoogleTranslateBackend, 'stub': StubBackend}
+
+def get_translator(name=None, **kwargs):
+    """Backend instance by name (default TRANSLATION_BACKEND)"""
+    name = name or TRANSLATION_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown translation backend {name!r} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name](**kwargs)
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+class TranslationMemo:
+    """SQLite memo of (backend, target language, 'word' or 'line', text) -> translation"""
+
+    def __init__(self, path=MEMO_PATH, bucket_name=MEMO_BUCKET, object_name=MEMO_OBJECT, client=None):
+        self.path = path
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.hits = 0
+        self.misses = 0
+        self._client = client
+        self._generation = None         # snapshot generation merged by the last pull(), 0 if none exists
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SCHEMA)
+        self._db.commit()
+        if bucket_name:
+            self.pull()
+
+    def lookup(self, backend, target, kind, texts):
+        """{text: translation} for the texts already in the memo"""
+        found = {}
+        with self._lock:
+            for chunk in _chunks(list(texts), QUERY_CHUNK):
+                rows = self._db.execute(
+                    f"SELECT text, result FROM memo WHERE backend = ? AND target = ? AND kind = ? "
+                    f"AND text IN ({','.join('?' * len(chunk))})", [backend, target, kind] + chunk)
+                found.update(rows)
+        return found
+
+    def store(self, backend, target, kind, translations):
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?, ?)",
+                                 [(backend, target, kind, text, result) for text, result in translations.items()])
+            self._db.commit()
+
+    def translate(self, texts, backend, target=TRANSLATION_TARGET, kind='word'):
+        """Translations of `texts` in order; unseen distinct texts go to `backend` in MAX_BATCH batches"""
+        texts = list(texts)
+        unique = list(dict.fromkeys(texts))
+        if backend.free:
+            found = dict(zip(unique, backend.translate(unique, target))) if unique else {}
+            return [found[text] for text in texts]
+        found = self.lookup(backend.name, target, kind, unique)
+        missing = [text for text in unique if text not in found]
+        self.hits += len(unique) - len(missing)
+        self.misses += len(missing)
+        batches = _chunks(missing, MAX_BATCH)
+        for batch in batches:
+            translated = dict(zip(batch, backend.translate(batch, target)))
+            self.store(backend.name, target, kind, translated)
+            found.update(translated)
+        print(f"🌐 Translation memo: {len(unique) - len(missing)}/{len(unique)} {kind}s known, "
+              f"{len(missing)} sent to {backend.name} in {len(batches)} request(s)")
+        if batches and self.bucket_name:
+            self.push()
+        return [found[text] for text in texts]
+
+    def merge(self, other_path):
+        """Add the entries of another memo file (e.g. a snapshot) that this one lacks"""
+        with self._lock:
+            self._db.execute("ATTACH DATABASE ? AS other", (other_path,))
+            try:
+                self._db.execute("INSERT OR IGNORE INTO memo SELECT * FROM other.memo")
+                self._db.commit()
+            finally:
+                self._db.execute("DETACH DATABASE other")
+
+    @property
+    def bucket(self):
+        if self._client is None:
+            from google.cloud import storage
+            self._client = storage.Client()
+        return self._client.bucket(self.bucket_name)
+
+    def pull(self):
+        """Merge the shared GCS snapshot into the local memo; False when there is none or it fails"""
+        snapshot = self.path + '.snapshot'
+        self._generation = None
+        try:
+            blob = self.bucket.get_blob(self.object_name)
+            if blob is None:
+                self._generation = 0
+                return False
+            blob.download_to_filename(snapshot, if_generation_match=blob.generation)
+            self.merge(snapshot)
+            self._generation = blob.generation
+            return True
+        except Exception as e:
+            print(f"⚠️ Translation memo snapshot not loaded: {e}")
+            return False
+        finally:
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+
+    def push(self):
+        """Merge the latest snapshot in, then upload the whole memo as its next generation"""
+        snapshot = self.path + '.upload'
+        try:
+            for _ in range(PUSH_ATTEMPTS):
+                self.pull()
+                if self._generation is None:
+                    return False
+                with self._lock:
+                    target = sqlite3.connect(snapshot)
+                    self._db.backup(target)
+                    target.close()
+                try:
+                    self.bucket.blob(self.object_name).upload_from_filename(
+                        snapshot, if_generation_match=self._generation)
+                    return True
+                except Exception as e:
+                    if getattr(e, 'code', None) != 412:     # PreconditionFailed: another push got there first
+                        raise
+            print(f"⚠️ Translation memo snapshot not saved: it changed on each of {PUSH_ATTEMPTS} attempts")
+            return False
+        except Exception as e:
+            print(f"⚠️ Translation memo snapshot not saved: {e}")
+            return False
+        finally:
+            if os.path.exists(snapshot):
+                os.remove(snapshot)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def get_memo(path=None):
+    """The memo for `path` (default MEMO_PATH), shared by every job in this process"""
+    path = path or MEMO_PATH
+    with _memos_lock:
+        if path not in _memos:
+            _memos[path] = TranslationMemo(path)
+        return _memos[path]
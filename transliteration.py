@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Transliteration
+Rule-based Indic -> Latin transliteration for the bilingual subtitle presets.
+
+Each script is a table of letters by kind (consonant, independent vowel, vowel sign,
+nasal, virama, ...), compiled once into a codepoint lookup. A word is read as syllable
+clusters (consonant conjunct + vowel), the inherent 'a' is dropped where Punjabi/Hindi
+speakers drop it (word-final, and between two voiced syllables: ਲਗਦੀ -> lagdi), and the
+clusters are joined. Words are memoized, and transliterate_words() converts each distinct
+word of a transcript once, so a song costs O(words) with no per-song dictionary.
+
+Only Gurmukhi is defined so far; another script is another SCRIPTS entry.
+"""
+import re
+from functools import lru_cache
+
+CONSONANT, VOWEL, SIGN, NASAL, VIRAMA, GEMINATE, NUKTA, BEARER, LATIN = range(9)
+
+SCRIPTS = {
+    'gurmukhi': {
+        CONSONANT: {
+            'ਕ': 'k', 'ਖ': 'kh', 'ਗ': 'g', 'ਘ': 'gh', 'ਙ': 'ng',
+            'ਚ': 'ch', 'ਛ': 'chh', 'ਜ': 'j', 'ਝ': 'jh', 'ਞ': 'ny',
+            'ਟ': 't', 'ਠ': 'th', 'ਡ': 'd', 'ਢ': 'dh', 'ਣ': 'n',
+            'ਤ': 't', 'ਥ': 'th', 'ਦ': 'd', 'ਧ': 'dh', 'ਨ': 'n',
+            'ਪ': 'p', 'ਫ': 'ph', 'ਬ': 'b', 'ਭ': 'bh', 'ਮ': 'm',
+            'ਯ': 'y', 'ਰ': 'r', 'ਲ': 'l', 'ਵ': 'v', 'ੜ': 'r', 'ਸ': 's', 'ਹ': 'h',
+            '\u0a36': 'sh', '\u0a59': 'kh', '\u0a5a': 'gh', '\u0a5b': 'z', '\u0a5e': 'f', '\u0a33': 'l',
+        },
+        # Letters that take a different sound with a nukta dot (the decomposed spelling of the
+        # precomposed letters above, which is what normalized text contains)
+        NUKTA: {'ਸ': 'sh', 'ਖ': 'kh', 'ਗ': 'gh', 'ਜ': 'z', 'ਫ': 'f', 'ਲ': 'l'},
+        VOWEL: {'ਅ': 'a', 'ਆ': 'aa', 'ਇ': 'i', 'ਈ': 'i', 'ਉ': 'u', 'ਊ': 'oo',
+                'ਏ': 'e', 'ਐ': 'ai', 'ਓ': 'o', 'ਔ': 'au'},
+        SIGN: {'ਾ': 'aa', 'ਿ': 'i', 'ੀ': 'i', 'ੁ': 'u', 'ੂ': 'oo',
+               'ੇ': 'e', 'ੈ': 'ai', 'ੋ': 'o', 'ੌ': 'au'},
+        BEARER: {'ੳ': 'u', 'ੲ': 'i'},       # vowel carriers: their sign is the vowel
+        NASAL: {'ੰ': 'n', 'ਂ': 'n'},        # tippi, bindi
+        VIRAMA: {'੍': ''},
+        GEMINATE: {'ੱ': ''},                # addak doubles the next consonant
+        LATIN: {'ੵ': 'y', 'ਃ': 'h', '।': '.', '॥': '.',
+                **{chr(0x0A66 + d): str(d) for d in range(10)}},
+    },
+}
+GLIDE_VOWELS = {'e': 'ye'}               # ਲਗਾਏ -> lagaaye: an independent 'e' after a vowel
+SILENT_NASAL_BEFORE = ('n', 'm')         # ਆੰਨੇ -> aane, not aanne
+FINAL_VOWELS = {'aa': 'a'}               # ਮੁੰਡਾ -> munda, the usual spelling
+
+def compile_table(scripts=SCRIPTS):
+    """{character: (kind, latin)} for every script"""
+    table = {}
+    for letters in scripts.values():
+        for kind, mapping in letters.items():
+            if kind != NUKTA:
+                table.update((char, (kind, latin)) for char, latin in mapping.items())
+    return table
+
+TABLE = compile_table()
+NUKTA_FORMS = {char + '਼': latin for script in SCRIPTS.values() for char, latin in script[NUKTA].items()}
+# Decomposed nukta letters first, then single codepoints
+UNIT = re.compile("|".join(map(re.escape, NUKTA_FORMS)) + r"|.", re.S)
+
+def _clusters(word):
+    """[onset, vowel, nasal, double] per syllable; vowel None is the inherent 'a'"""
+    clusters, joining, double = [], False, False
+    for unit in UNIT.findall(word):
+        if unit in NUKTA_FORMS:
+            kind, latin = CONSONANT, NUKTA_FORMS[unit]
+        else:
+            kind, latin = TABLE.get(unit, (None, unit.lower()))
+        if kind == CONSONANT:
+            if joining:
+                clusters[-1][0] += latin
+            else:
+                clusters.append([latin, None, False, double])
+            joining = double = False
+        elif kind in (VOWEL, BEARER):
+            clusters.append(['', latin, False, False])
+        elif kind == SIGN and clusters and (clusters[-1][1] is None or clusters[-1][0] == ''):
+            clusters[-1][1] = latin
+        elif kind == VIRAMA and clusters:
+            joining = True
+        elif kind == GEMINATE:
+            double = True
+        elif kind == NASAL and clusters:
+            clusters[-1][2] = True
+        elif kind is not None or unit.strip():
+            clusters.append([latin, '', False, False])
+    return clusters
+
+def _drop_schwas(clusters):
+    """Resolve the inherent 'a': silent at the end of a word and in V C(a) C V, read right to left"""
+    vowels = [c[1] for c in clusters]
+    last = len(clusters) - 1
+    if last > 0 and vowels[last] is None and clusters[last][0]:
+        vowels[last] = ''
+    for i in range(last - 1, 0, -1):
+        if (vowels[i] is None and clusters[i][0] and not clusters[i][2] and vowels[i - 1] != ''
+                and clusters[i + 1][0] and vowels[i + 1] != ''):
+            vowels[i] = ''
+    return ['a' if v is None else v for v in vowels]
+
+@lru_cache(maxsize=4096)
+def transliterate(word):
+    """Latin spelling of one word; text outside the tables is lowercased as it is"""
+    clusters = _clusters(word)
+    vowels = _drop_schwas(clusters)
+    if clusters and clusters[-1][0] and vowels[-1] in FINAL_VOWELS:
+        vowels[-1] = FINAL_VOWELS[vowels[-1]]
+    out = []
+    for i, ((onset, _, nasal, double), vowel) in enumerate(zip(clusters, vowels)):
+        if double and onset:
+            out.append(onset[0])
+        if not onset and out and out[-1][-1:] in 'aeiou' and vowel in GLIDE_VOWELS:
+            vowel = GLIDE_VOWELS[vowel]
+        out.append(onset + vowel)
+        following = clusters[i + 1][0] if i + 1 < len(clusters) else ''
+        if nasal and not following.startswith(SILENT_NASAL_BEFORE):
+            out.append('n')
+    return "".join(out)
+
+def transliterate_words(words):
+    """Transliteration of every word, each distinct word converted once"""
+    spelled = {word: transliterate(word) for word in dict.fromkeys(words)}
+    return [spelled[word] for word in words]
@@ -1,51 +1,36 @@
 #!/usr/bin/env python3
 """
-Upload videos using gsutil and process through karaoke service
+Upload videos to GCS and process through karaoke service
+Uploads run in-process on gcs_transfer's thread pool (no gsutil forks) and skip
+videos that are already in the bucket with the same checksum
 """
 import os
 import glob
-import subprocess
 import requests
 import json
+from gcs_transfer import TransferEngine
 
 # Configuration
 LOCAL_VIDEO_DIR = "/Users/rajvindersingh/Projects/karooke/trending_music"
 BUCKET_NAME = "soniq-karaoke-videos"
 PROCESSING_SERVICE_URL = "https://soniq-processor-894603036612.us-central1.run.app"
 
-def upload_video_with_gsutil(local_path, gcs_filename):
-    """Upload video using gsutil command"""
-    try:
-        gcs_path = f"gs://{BUCKET_NAME}/trending/{gcs_filename}"
-        
-        print(f"📤 Uploading: {gcs_filename}")
-        
-        # Upload with gsutil
-        result = subprocess.run([
-            'gsutil', 'cp', local_path, gcs_path
-        ], capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            # Make public
-            public_result = subprocess.run([
-                'gsutil', 'acl', 'ch', '-u', 'AllUsers:R', gcs_path
-            ], capture_output=True, text=True)
-            
-            if public_result.returncode == 0:
-                gcs_url = f"https://storage.googleapis.com/{BUCKET_NAME}/trending/{gcs_filename}"
-                print(f"✅ Uploaded and made public: {gcs_url}")
-                return gcs_url
-            else:
-                print(f"⚠️ Uploaded but failed to make public: {public_result.stderr}")
-                gcs_url = f"https://storage.googleapis.com/{BUCKET_NAME}/trending/{gcs_filename}"
-                return gcs_url
+def upload_videos(video_paths, engine):
+    """Upload videos concurrently; returns {local_path: public URL or None}"""
+    print(f"📤 Uploading {len(video_paths)} videos...")
+    results = engine.upload_many([(path, f"trending/{os.path.basename(path)}") for path in video_paths])
+    
+    urls = {}
+    for path, result in zip(video_paths, results):
+        name = os.path.basename(path)
+        if result['status'] == 'failed':
+            print(f"❌ Upload failed for {name}: {result['error']}")
+            urls[path] = None
         else:
-            print(f"❌ Upload failed: {result.stderr}")
-            return None
-            
-    except Exception as e:
-        print(f"❌ Upload error for {gcs_filename}: {e}")
-        return None
+            verb = 'Already uploaded' if result['status'] == 'skipped' else 'Uploaded and made public'
+            print(f"✅ {verb}: {result['url']} ({result['seconds']}s)")
+            urls[path] = result['url']
+    return urls
 
 def process_video_with_karaoke_service(video_url, video_name, vocal_level, test_duration=None):
     """Send video to processing service for karaoke creation - one level at a time"""
@@ -102,20 +87,9 @@ def process_video_with_karaoke_service(video_url, video_name, vocal_level, test_
 
 def main():
     """Main function to upload and process trending videos"""
-    print("🎵 GSUTIL BATCH KARAOKE PROCESSOR 🎵")
+    print("🎵 BATCH KARAOKE PROCESSOR 🎵")
     print("=" * 60)
     
-    # Check if gsutil is available
-    try:
-        result = subprocess.run(['gsutil', '--version'], capture_output=True, text=True)
-        if result.returncode != 0:
-            print("❌ gsutil not available. Please install Google Cloud SDK.")
-            return
-        print("✅ gsutil is available")
-    except FileNotFoundError:
-        print("❌ gsutil not found. Please install Google Cloud SDK.")
-        return
-    
     # Get all video files
     video_files = glob.glob(os.path.join(LOCAL_VIDEO_DIR, "*.mp4"))
     if not video_files:
@@ -127,6 +101,13 @@ def main():
     # Process first 3 videos to start (to avoid timeouts)
     video_files = sorted(video_files)[:3]  # Just first 3 for testing
     
+    # Step 1: Upload everything to GCS up front
+    engine = TransferEngine(BUCKET_NAME)
+    try:
+        uploaded = upload_videos(video_files, engine)
+    finally:
+        engine.close()
+    
     results = []
     successful_uploads = 0
     successful_processing = 0
@@ -139,8 +120,7 @@ def main():
         print(f"🎯 VIDEO {i}/{len(video_files)}: {video_name}")
         print(f"📁 Local: {video_path}")
         
-        # Step 1: Upload to GCS with gsutil
-        gcs_url = upload_video_with_gsutil(video_path, video_filename)
+        gcs_url = uploaded[video_path]
         
         if gcs_url:
             successful_uploads += 1
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Word Timing Model
+Plain word/line records shared by transcription, subtitle and export code,
+independent of which Whisper client (or other source) produced them
+"""
+
+class Word:
+    """One timed word; attribute names match Whisper's verbose_json words"""
+
+    __slots__ = ('word', 'start', 'end')
+
+    def __init__(self, word, start, end):
+        self.word = word
+        self.start = float(start)
+        self.end = float(end)
+
+    def __repr__(self):
+        return f"Word({self.word!r}, {self.start:.2f}, {self.end:.2f})"
+
+    def to_dict(self):
+        return {'word': self.word, 'start': self.start, 'end': self.end}
+
+class Transcript:
+    """Ordered timed words plus the full text"""
+
+    def __init__(self, words, text=None):
+        self.words = list(words)
+        self.text = text if text is not None else " ".join(w.word for w in self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def shifted(self, offset):
+        """Copy with every word moved by `offset` seconds (used when merging chunks)"""
+        return Transcript([Word(w.word, w.start + offset, w.end + offset) for w in self.words], self.text)
+
+    def to_dict(self):
+        return {'text': self.text, 'words': [w.to_dict() for w in self.words]}
+
+def _field(item, name):
+    return item.get(name) if isinstance(item, dict) else getattr(item, name, None)
+
+def to_transcript(response):
+    """Convert a Whisper response (openai 0.28 or 1.x object, or plain dict) to a Transcript"""
+    if response is None:
+        return None
+    if isinstance(response, Transcript):
+        return response
+    words = [Word(_field(w, 'word'), _field(w, 'start'), _field(w, 'end'))
+             for w in (_field(response, 'words') or [])]
+    return Transcript(words, _field(response, 'text'))
+
+def merge_transcripts(parts):
+    """Merge (offset_seconds, Transcript) chunk results into one transcript"""
+    words = []
+    texts = []
+    for offset, transcript in parts:
+        if transcript is None:
+            continue
+        words.extend(transcript.shifted(offset).words)
+        texts.append(transcript.text)
+    return Transcript(words, " ".join(t for t in texts if t))
+
+def group_lines_by_span(words, max_span=3.0):
+    """Start a new line once a word begins more than `max_span` seconds after the line did"""
+    lines = []
+    current = []
+    line_start = words[0].start if words else 0
+    for word in words:
+        if current and word.start - line_start > max_span:
+            lines.append(current)
+            current = [word]
+            line_start = word.start
+        else:
+            current.append(word)
+    if current:
+        lines.append(current)
+    return lines
+
+def group_lines_by_count(words, max_words=8):
+    """End a line after `max_words` words or on sentence punctuation"""
+    lines = []
+    current = []
+    for word in words:
+        current.append(word)
+        text = word.word.rstrip()
+        if len(current) >= max_words or (text and text[-1] in '.!?'):
+            lines.append(current)
+            current = []
+    if current:
+        lines.append(current)
+    return lines
+
+def format_ass_time(seconds):
+    """ASS timestamp H:MM:SS.cc"""
+    h = int(seconds // 3600)
+    m = int((seconds % 3600) // 60)
+    s = seconds % 60
+    return f"{h}:{m:02d}:{s:05.2f}"